@@ -1,7 +1,9 @@
 import os
-import requests
+import json
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict, Counter
+from collections import Counter
+
+from feishu_client import BitableClient, FeishuError, get_tenant_access_token, summarize_ranges, format_ranges
 
 # ================= Config =================
 APP_ID = os.environ.get("FEISHU_APP_ID")
@@ -15,10 +17,18 @@ DRY_RUN = os.environ.get("DRY_RUN", "false").lower() in ("true", "1", "yes")
 # BACKFILL 模式：归档表内所有历史周（而非仅上一周）
 BACKFILL = os.environ.get("BACKFILL", "false").lower() in ("true", "1", "yes")
 
-BASE_URL = "https://open.feishu.cn/open-apis"
+BITABLE = BitableClient(APP_TOKEN)
+
+# BACKFILL 断点：记录已处理完成的周 (周一毫秒时间戳)，中断后重跑跳过这些周
+# 文件不入库；CI 中由 weekly_archive.yml 通过 actions/cache 在多次运行间恢复 / 保存
+BACKFILL_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive_backfill_checkpoint.json")
+WEEK_MS = 7 * 24 * 3600 * 1000
 
 ARCHIVED_MARKERS = ("周均", "周均-无数据")
 
+# 周均聚合 (group_and_build_weekly_rows / check_already_archived) 用到的字段，服务端拉取时只投影这些列
+WINDOW_FIELDS = ["日期", "品牌", "型号", "国家", "平台", "页面标题", "币种", "状态", "价格"]
+
 WEEKDAY_FIELDS = {
     0: "周一价格",
     1: "周二价格",
@@ -30,22 +40,6 @@ WEEKDAY_FIELDS = {
 }
 
 
-def get_tenant_access_token():
-    url = f"{BASE_URL}/auth/v3/tenant_access_token/internal"
-    headers = {"Content-Type": "application/json; charset=utf-8"}
-    data = {"app_id": APP_ID, "app_secret": APP_SECRET}
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        if result.get("code") == 0:
-            return result.get("tenant_access_token")
-        print(f" 获取 Token 失败: {result.get('msg')}")
-    except Exception as e:
-        print(f" 请求 Token 异常: {e}")
-    return None
-
-
 def compute_last_week_window():
     """
     返回上周时间窗口的毫秒时间戳：
@@ -71,64 +65,60 @@ def date_ms_to_week_monday_ms(date_ms):
     return int(monday.timestamp() * 1000)
 
 
-def _paginate_all_records(token):
+def _paginate_all_records():
     """分页拉取飞书价格表全部记录，返回原始 item 列表"""
-    url = f"{BASE_URL}/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/records"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8",
-    }
     all_items = []
-    page_token = None
-    has_more = True
+    try:
+        for item in BITABLE.iter_records(TABLE_ID):
+            all_items.append(item)
+    except FeishuError as e:
+        print(f" 拉取记录失败: {e}")
+    return all_items
 
-    while has_more:
-        params = {"page_size": 100}
-        if page_token:
-            params["page_token"] = page_token
-        try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            result = response.json()
-            if result.get("code") != 0:
-                print(f" 拉取记录失败: {result.get('msg')}")
-                break
-            data = result.get("data", {})
-            all_items.extend(data.get("items", []))
-            has_more = data.get("has_more", False)
-            page_token = data.get("page_token")
-        except Exception as e:
-            print(f" 网络请求异常: {e}")
-            break
 
-    return all_items
+def _date_filter(start_ms, end_ms):
+    """
+    日期字段的服务端过滤按天比较，这里各向外放宽一天，精确边界仍由客户端按毫秒判断
+    """
+    day_ms = 24 * 3600 * 1000
+    return {
+        "conjunction": "and",
+        "conditions": [
+            {"field_name": "日期", "operator": "isGreater", "value": ["ExactDate", str(start_ms - day_ms)]},
+            {"field_name": "日期", "operator": "isLess", "value": ["ExactDate", str(end_ms + day_ms)]},
+        ],
+    }
 
 
-def fetch_all_records(token):
-    """拉取全部记录，解析为 {record_id, fields} 结构"""
-    raw = _paginate_all_records(token)
-    records = [{"record_id": item.get("record_id"), "fields": item.get("fields", {})} for item in raw]
-    print(f" 拉取完成: 共 {len(records)} 条记录")
-    return records
+def _in_window(fields, start_ms, end_ms):
+    date_val = fields.get("日期")
+    if date_val is None:
+        return False
+    try:
+        date_ms = int(date_val)
+    except (TypeError, ValueError):
+        return False
+    return start_ms <= date_ms <= end_ms
 
 
-def fetch_records_in_window(token, start_ms, end_ms):
-    """拉取全部记录，客户端过滤出日期落在窗口内的"""
-    raw = _paginate_all_records(token)
+def fetch_records_in_window(start_ms, end_ms):
+    """
+    拉取日期落在窗口内的记录：优先用 records/search 服务端按日期过滤并只取聚合所需字段，
+    接口不可用时回退为全量分页 + 客户端过滤
+    """
+    try:
+        raw = list(BITABLE.iter_search(TABLE_ID, filter=_date_filter(start_ms, end_ms), field_names=WINDOW_FIELDS))
+        source = "服务端过滤"
+    except FeishuError as e:
+        print(f" 服务端过滤不可用 ({e})，回退为全量分页拉取")
+        raw = _paginate_all_records()
+        source = "全量扫描"
     total = len(raw)
-    matched = []
-    for item in raw:
-        fields = item.get("fields", {})
-        date_val = fields.get("日期")
-        if date_val is None:
-            continue
-        try:
-            date_ms = int(date_val)
-        except (TypeError, ValueError):
-            continue
-        if start_ms <= date_ms <= end_ms:
-            matched.append({"record_id": item.get("record_id"), "fields": fields})
-    print(f" 扫描总记录数: {total}, 上周窗口内: {len(matched)} 条")
+    matched = [
+        {"record_id": item.get("record_id"), "fields": item.get("fields", {})}
+        for item in raw if _in_window(item.get("fields", {}), start_ms, end_ms)
+    ]
+    print(f" {source}记录数: {total}, 上周窗口内: {len(matched)} 条")
     return matched
 
 
@@ -147,166 +137,146 @@ def _extract_string(fields, key):
     return str(val).strip()
 
 
-def _mode_or_first(values):
-    cleaned = [v for v in values if v]
-    if not cleaned:
-        return ""
-    return Counter(cleaned).most_common(1)[0][0]
-
-
-def _first_non_empty(values):
-    for v in values:
-        if v:
-            return v
-    return ""
-
-
-def group_and_build_weekly_rows(records, monday_ms):
+class WeeklyAggregator:
     """
-    按 (品牌, 型号, 国家, 平台) 分组日级记录，对每组生成 1 条周均行：
-      - 有 Success 数据 → 状态=周均, 价格=有效价格平均
-      - 全周无 Success 数据 → 状态=周均-无数据, 价格字段不写
+    单周流式聚合器：逐条消费日级记录，只保留每组 (品牌, 型号, 国家, 平台) 的
+    价格累计和 / 计数 / 每个工作日最后一个价格 / 首个页面标题 / 币种计数，以及待删除的 record_id
     """
-    groups = defaultdict(list)
-    for r in records:
-        f = r["fields"]
+
+    def __init__(self, monday_ms):
+        self.monday_ms = monday_ms
+        self.groups = {}
+        self.daily_ids = []
+        self.archived = False
+
+    def add(self, record):
+        f = record["fields"]
         if f.get("状态") in ARCHIVED_MARKERS:
-            continue
+            self.archived = True
+            return
+        self.daily_ids.append(record.get("record_id"))
         key = (
             _extract_string(f, "品牌"),
             _extract_string(f, "型号"),
             _extract_string(f, "国家"),
             _extract_string(f, "平台"),
         )
-        groups[key].append(f)
-
-    weekly_rows = []
-    has_data_count = 0
-    no_data_count = 0
-
-    for (brand, model, country, platform), items in groups.items():
-        valid_prices = []
-        daily_prices = {}  # weekday(0-6) → price; 同日多条 Success 用最后一条
-        for f in items:
-            if f.get("状态") != "Success":
-                continue
-            price_val = f.get("价格")
-            if price_val in (None, ""):
-                continue
+        g = self.groups.get(key)
+        if g is None:
+            g = self.groups[key] = {"sum": 0.0, "count": 0, "daily_prices": {}, "page_title": "", "currencies": Counter()}
+        if not g["page_title"]:
+            g["page_title"] = _extract_string(f, "页面标题")
+        currency = _extract_string(f, "币种")
+        if currency:
+            g["currencies"][currency] += 1
+
+        if f.get("状态") != "Success":
+            return
+        price_val = f.get("价格")
+        if price_val in (None, ""):
+            return
+        try:
+            price = float(price_val)
+        except (TypeError, ValueError):
+            return
+        g["sum"] += price
+        g["count"] += 1
+        date_val = f.get("日期")
+        if date_val is not None:
             try:
-                price = float(price_val)
+                weekday = datetime.fromtimestamp(int(date_val) / 1000, tz=timezone.utc).weekday()
+                g["daily_prices"][weekday] = price  # 同日多条 Success 用最后一条
             except (TypeError, ValueError):
-                continue
-            valid_prices.append(price)
-            date_val = f.get("日期")
-            if date_val is not None:
-                try:
-                    weekday = datetime.fromtimestamp(int(date_val) / 1000, tz=timezone.utc).weekday()
-                    daily_prices[weekday] = price
-                except (TypeError, ValueError):
-                    pass
-
-        page_title = _first_non_empty([_extract_string(f, "页面标题") for f in items])
-        currency = _mode_or_first([_extract_string(f, "币种") for f in items])
-
-        base = {
-            "日期": monday_ms,
-            "时间": "weekly",
-            "品牌": brand,
-            "型号": model,
-            "国家": country,
-            "平台": platform,
-            "页面标题": page_title,
-            "币种": currency,
-        }
-
-        if valid_prices:
-            avg = round(sum(valid_prices) / len(valid_prices), 2)
-            row = {**base, "状态": "周均", "价格动态": "周均", "价格": avg}
-            for wd, p in daily_prices.items():
-                row[WEEKDAY_FIELDS[wd]] = p
-            has_data_count += 1
-        else:
-            row = {**base, "状态": "周均-无数据", "价格动态": "无数据"}
-            no_data_count += 1
+                pass
+
+    def build_rows(self):
+        """
+        对每组生成 1 条周均行：
+          - 有 Success 数据 → 状态=周均, 价格=有效价格平均
+          - 全周无 Success 数据 → 状态=周均-无数据, 价格字段不写
+        """
+        weekly_rows = []
+        has_data_count = 0
+        no_data_count = 0
+
+        for (brand, model, country, platform), g in self.groups.items():
+            currency = g["currencies"].most_common(1)[0][0] if g["currencies"] else ""
+            base = {
+                "日期": self.monday_ms,
+                "时间": "weekly",
+                "品牌": brand,
+                "型号": model,
+                "国家": country,
+                "平台": platform,
+                "页面标题": g["page_title"],
+                "币种": currency,
+            }
+
+            if g["count"]:
+                avg = round(g["sum"] / g["count"], 2)
+                row = {**base, "状态": "周均", "价格动态": "周均", "价格": avg}
+                for wd, p in g["daily_prices"].items():
+                    row[WEEKDAY_FIELDS[wd]] = p
+                has_data_count += 1
+            else:
+                row = {**base, "状态": "周均-无数据", "价格动态": "无数据"}
+                no_data_count += 1
 
-        row = {k: v for k, v in row.items() if v not in (None, "")}
-        weekly_rows.append(row)
+            row = {k: v for k, v in row.items() if v not in (None, "")}
+            weekly_rows.append(row)
 
-    print(f"   聚合: 有数据 {has_data_count} 条, 无数据兜底 {no_data_count} 条")
-    return weekly_rows
+        print(f"   聚合: 有数据 {has_data_count} 条, 无数据兜底 {no_data_count} 条")
+        return weekly_rows
 
 
-def batch_create_records(token, rows):
+def group_and_build_weekly_rows(records, monday_ms):
+    """按 (品牌, 型号, 国家, 平台) 分组日级记录，对每组生成 1 条周均行"""
+    aggregator = WeeklyAggregator(monday_ms)
+    for r in records:
+        aggregator.add(r)
+    return aggregator.build_rows()
+
+
+def _report_batch(results, action, unit):
+    """打印逐块失败信息与成功 / 失败区间汇总，返回是否全部成功"""
+    for start, size, error in results:
+        if error is not None:
+            print(f"   {action}失败 (第 {start + 1}-{start + size} 条): {error} | {error.result}")
+    ok_ranges, failed_ranges = summarize_ranges(results)
+    ok_count = sum(b - a + 1 for a, b in ok_ranges)
+    print(f"   {action}成功: {ok_count} 条{unit} (区间 {format_ranges(ok_ranges)})")
+    if failed_ranges:
+        print(f"   {action}失败区间: {format_ranges(failed_ranges)}")
+    return not failed_ranges
+
+
+def batch_create_records(rows):
     if not rows:
         return True
     if DRY_RUN:
         print(f"   [DRY_RUN] 将写入 {len(rows)} 条周均行（未实际发送）")
         return True
 
-    url = f"{BASE_URL}/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/records/batch_create"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8",
-    }
-    batch_size = 100
-    all_ok = True
-    for i in range(0, len(rows), batch_size):
-        chunk = rows[i:i + batch_size]
-        payload = {"records": [{"fields": r} for r in chunk]}
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            result = response.json()
-            if result.get("code") == 0:
-                print(f"   写入成功: {len(chunk)} 条周均行")
-            else:
-                print(f"   写入失败: {result.get('msg')} | {result}")
-                all_ok = False
-        except Exception as e:
-            print(f"   写入异常: {e}")
-            all_ok = False
-    return all_ok
+    # 逐块写入 (同一张表不能并发写入，写冲突由客户端退避重试)
+    return _report_batch(list(BITABLE.batch_create(TABLE_ID, rows)), "写入", "周均行")
 
 
-def batch_delete_records(token, record_ids):
+def batch_delete_records(record_ids):
     if not record_ids:
         return True
     if DRY_RUN:
         print(f"   [DRY_RUN] 将删除 {len(record_ids)} 条日级记录（未实际发送）")
         return True
 
-    url = f"{BASE_URL}/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/records/batch_delete"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8",
-    }
-    batch_size = 500
-    all_ok = True
-    for i in range(0, len(record_ids), batch_size):
-        chunk = record_ids[i:i + batch_size]
-        payload = {"records": chunk}
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            result = response.json()
-            if result.get("code") == 0:
-                print(f"   删除成功: {len(chunk)} 条日级记录")
-            else:
-                print(f"   删除失败: {result.get('msg')} | {result}")
-                all_ok = False
-        except Exception as e:
-            print(f"   删除异常: {e}")
-            all_ok = False
-    return all_ok
+    return _report_batch(list(BITABLE.batch_delete(TABLE_ID, record_ids)), "删除", "日级记录")
 
 
-def run_single_week(token):
+def run_single_week():
     """归档模式：只处理上一周"""
     start_ms, end_ms, last_monday = compute_last_week_window()
     print(f" 上周窗口起点 (UTC): {last_monday.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    records = fetch_records_in_window(token, start_ms, end_ms)
+    records = fetch_records_in_window(start_ms, end_ms)
     if not records:
         print(" 上周窗口内无任何记录, 退出")
         return
@@ -320,95 +290,188 @@ def run_single_week(token):
         print(" 没有可聚合的日级数据, 退出")
         return
 
-    create_ok = batch_create_records(token, weekly_rows)
+    create_ok = batch_create_records(weekly_rows)
     if not create_ok:
         print(" 周均行写入存在失败, 跳过删除步骤以避免数据丢失")
         return
 
-    delete_ok = batch_delete_records(token, [r["record_id"] for r in records])
+    delete_ok = batch_delete_records([r["record_id"] for r in records])
     if not delete_ok:
         print(" 警告: 部分日级记录删除失败, 下次运行幂等检查会阻止重复归档")
     else:
         print(" 归档完成")
 
 
-def run_backfill(token):
-    """补跑模式：归档表内所有历史周（本周除外）"""
-    now_utc = datetime.now(timezone.utc)
-    this_monday_ms = int(
-        (now_utc - timedelta(days=now_utc.weekday())).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        ).timestamp() * 1000
+def _week_label(week_ms):
+    return datetime.fromtimestamp(week_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def load_backfill_checkpoint():
+    if not os.path.exists(BACKFILL_CHECKPOINT):
+        return set()
+    try:
+        with open(BACKFILL_CHECKPOINT, "r", encoding="utf-8") as f:
+            return set(json.load(f).get("done_weeks", []))
+    except Exception as e:
+        print(f" 读取断点失败, 从头开始: {e}")
+        return set()
+
+
+def save_backfill_checkpoint(done_weeks):
+    if DRY_RUN:
+        return
+    tmp_file = BACKFILL_CHECKPOINT + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"done_weeks": sorted(done_weeks)}, f)
+    os.replace(tmp_file, BACKFILL_CHECKPOINT)
+
+
+def archive_week(aggregator):
+    """写入一周的周均行并删除其日级记录，返回 (是否完成, 写入数, 删除数)"""
+    label = _week_label(aggregator.monday_ms)
+    if not aggregator.daily_ids and not aggregator.archived:
+        return True, 0, 0  # 空周 (停跑期间等)
+    if aggregator.archived:
+        print(f"\n [{label}] 已归档, 跳过")
+        return True, 0, 0
+
+    print(f"\n [{label}] 处理 {len(aggregator.daily_ids)} 条日级记录...")
+    weekly_rows = aggregator.build_rows()
+    if not weekly_rows:
+        print(f"   无可聚合数据, 跳过")
+        return True, 0, 0
+
+    create_ok = batch_create_records(weekly_rows)
+    if not create_ok:
+        print(f"   写入失败, 跳过该周删除以避免数据丢失")
+        return False, 0, 0
+
+    delete_ok = batch_delete_records(aggregator.daily_ids)
+    if not delete_ok:
+        # 周均行已写入，下次运行的幂等检查会跳过该周
+        print(f"   警告: 删除不完整")
+    return True, len(weekly_rows), len(aggregator.daily_ids)
+
+
+def _find_oldest_date_ms():
+    """服务端按日期升序只取 1 条，得到表内最早的日期；接口不可用时抛出 FeishuError"""
+    oldest = BITABLE.iter_search(
+        TABLE_ID,
+        filter={"conjunction": "and", "conditions": [{"field_name": "日期", "operator": "isNotEmpty", "value": []}]},
+        field_names=["日期"],
+        sort=[{"field_name": "日期", "desc": False}],
+        page_size=1,
     )
+    for item in oldest:
+        return int(item["fields"]["日期"])
+    return None
+
+
+def _pending_weeks(oldest_ms, this_monday_ms, done_weeks):
+    """从最早日期所在周到上周，尚未归档的周一时间戳"""
+    week_ms = date_ms_to_week_monday_ms(oldest_ms)
+    while week_ms < this_monday_ms:
+        if week_ms not in done_weeks:
+            yield week_ms
+        week_ms += WEEK_MS
+
 
-    print(" 拉取全部记录...")
-    all_records = fetch_all_records(token)
+def _fetch_week_by_search(week_ms):
+    """服务端过滤拉取单周记录并聚合，内存中只有这一周的状态；失败抛出 FeishuError"""
+    aggregator = WeeklyAggregator(week_ms)
+    for item in BITABLE.iter_search(TABLE_ID, filter=_date_filter(week_ms, week_ms + WEEK_MS - 1), field_names=WINDOW_FIELDS):
+        record = {"record_id": item.get("record_id"), "fields": item.get("fields", {})}
+        if _in_window(record["fields"], week_ms, week_ms + WEEK_MS - 1):
+            aggregator.add(record)
+    return aggregator
 
-    # 按周分组，跳过本周及无日期记录
-    week_groups = defaultdict(list)
+
+def _stream_weeks_by_scan(this_monday_ms, done_weeks):
+    """回退路径：全量分页单次扫描，按页消费，只保留各周的聚合状态与待删除 id"""
+    aggregators = {}
     skipped = 0
-    for r in all_records:
-        date_val = r["fields"].get("日期")
-        if date_val is None:
-            skipped += 1
-            continue
+    for item in BITABLE.iter_records(TABLE_ID):
+        fields = item.get("fields", {})
         try:
-            date_ms = int(date_val)
+            date_ms = int(fields.get("日期"))
         except (TypeError, ValueError):
             skipped += 1
             continue
         week_ms = date_ms_to_week_monday_ms(date_ms)
-        if week_ms >= this_monday_ms:
+        if week_ms >= this_monday_ms or week_ms in done_weeks:
             continue  # 本周数据不归档
-        week_groups[week_ms].append(r)
-
+        if week_ms not in aggregators:
+            aggregators[week_ms] = WeeklyAggregator(week_ms)
+        aggregators[week_ms].add({"record_id": item.get("record_id"), "fields": fields})
     if skipped:
         print(f" 跳过 {skipped} 条无日期记录")
+    for week_ms in sorted(aggregators):
+        yield aggregators[week_ms]
 
-    historical_weeks = sorted(week_groups.keys())
-    if not historical_weeks:
-        print(" 没有历史周数据可归档, 退出")
-        return
 
-    print(f" 发现 {len(historical_weeks)} 个历史周待处理:")
-    for w in historical_weeks:
-        label = datetime.fromtimestamp(w / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
-        count = len(week_groups[w])
-        print(f"   {label} ({count} 条)")
+def run_backfill():
+    """补跑模式：归档表内所有历史周（本周除外），逐周流式聚合，支持断点续跑"""
+    now_utc = datetime.now(timezone.utc)
+    this_monday_ms = int(
+        (now_utc - timedelta(days=now_utc.weekday())).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ).timestamp() * 1000
+    )
+
+    done_weeks = load_backfill_checkpoint()
+    if done_weeks:
+        print(f" 从断点续跑: 已完成 {len(done_weeks)} 个历史周")
 
     total_written = 0
     total_deleted = 0
+    failed_weeks = []
+
+    def process(aggregator):
+        nonlocal total_written, total_deleted
+        ok, written, deleted = archive_week(aggregator)
+        total_written += written
+        total_deleted += deleted
+        if ok:
+            done_weeks.add(aggregator.monday_ms)
+            save_backfill_checkpoint(done_weeks)
+        else:
+            failed_weeks.append(_week_label(aggregator.monday_ms))
 
-    for week_monday_ms in historical_weeks:
-        week_records = week_groups[week_monday_ms]
-        label = datetime.fromtimestamp(week_monday_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
-
-        if check_already_archived(week_records):
-            print(f"\n [{label}] 已归档, 跳过")
-            continue
-
-        daily_count = sum(1 for r in week_records if r["fields"].get("状态") not in ARCHIVED_MARKERS)
-        print(f"\n [{label}] 处理 {daily_count} 条日级记录...")
-
-        weekly_rows = group_and_build_weekly_rows(week_records, week_monday_ms)
-        if not weekly_rows:
-            print(f"   无可聚合数据, 跳过")
-            continue
-
-        create_ok = batch_create_records(token, weekly_rows)
-        if not create_ok:
-            print(f"   写入失败, 跳过该周删除以避免数据丢失")
-            continue
-
-        ids_to_delete = [r["record_id"] for r in week_records if r["fields"].get("状态") not in ARCHIVED_MARKERS]
-        delete_ok = batch_delete_records(token, ids_to_delete)
-        if not delete_ok:
-            print(f"   警告: 删除不完整")
+    # 只有首次探测 (最早日期查询 / 第一周 search) 失败才说明服务端过滤不可用，回退全量扫描；
+    # 之后单周拉取失败只记为失败周，避免回退路径把剩余所有周都装进内存
+    use_search = True
+    print(" 逐周服务端过滤拉取...")
+    try:
+        oldest_ms = _find_oldest_date_ms()
+    except FeishuError as e:
+        print(f" 服务端过滤不可用 ({e})，回退为全量分页流式扫描")
+        use_search = False
+
+    if use_search and oldest_ms is not None:
+        probed = False
+        for week_ms in _pending_weeks(oldest_ms, this_monday_ms, done_weeks):
+            try:
+                aggregator = _fetch_week_by_search(week_ms)
+            except FeishuError as e:
+                if not probed:
+                    print(f" 服务端过滤不可用 ({e})，回退为全量分页流式扫描")
+                    use_search = False
+                    break
+                print(f" {_week_label(week_ms)} 拉取失败: {e}")
+                failed_weeks.append(_week_label(week_ms))
+                continue
+            probed = True
+            process(aggregator)
 
-        total_written += len(weekly_rows)
-        total_deleted += len(ids_to_delete)
+    if not use_search:
+        for aggregator in _stream_weeks_by_scan(this_monday_ms, done_weeks):
+            process(aggregator)
 
     print(f"\n Backfill 完成: 共写入 {total_written} 条周均行, 删除 {total_deleted} 条日级记录")
+    if failed_weeks:
+        print(f" 失败周 (下次运行会重试): {', '.join(failed_weeks)}")
+    elif not DRY_RUN and os.path.exists(BACKFILL_CHECKPOINT):
+        os.remove(BACKFILL_CHECKPOINT)
 
 
 def main():
@@ -424,14 +487,13 @@ def main():
     if mode_flags:
         print(f" === 模式: {' + '.join(mode_flags)} ===")
 
-    token = get_tenant_access_token()
-    if not token:
+    if not get_tenant_access_token():
         return
 
     if BACKFILL:
-        run_backfill(token)
+        run_backfill()
     else:
-        run_single_week(token)
+        run_single_week()
 
 
 if __name__ == "__main__":
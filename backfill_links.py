@@ -1,6 +1,10 @@
 import os
 import csv
-import requests
+import json
+import time
+
+from feishu_client import BitableClient, FeishuError, get_tenant_access_token
+from price_index import get_latest_states
 
 # ================= 配置读取 (从环境变量获取) =================
 APP_ID = os.environ.get("FEISHU_APP_ID")
@@ -9,24 +13,17 @@ APP_TOKEN = os.environ.get("FEISHU_APP_TOKEN")
 TABLE_ID = os.environ.get("FEISHU_PRODUCT_TABLE_ID")
 
 CSV_PRODUCTS = "products.csv"
-CSV_PRICES = "prices.csv"
+CSV_PRICES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prices.csv")
 
-def get_tenant_access_token():
-    """获取飞书租户验证令牌"""
-    url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-    headers = {"Content-Type": "application/json; charset=utf-8"}
-    data = {"app_id": APP_ID, "app_secret": APP_SECRET}
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        if result.get("code") == 0:
-            return result.get("tenant_access_token")
-        else:
-            print(f"❌ 获取 Token 失败: {result.get('msg')}")
-    except Exception as e:
-        print(f"❌ 请求 Token 异常: {e}")
-    return None
+BITABLE = BitableClient(APP_TOKEN)
+
+# 上次回填后飞书侧的已知状态快照: record_id -> {key, link, status}
+# 快照有效期内只对比本地变化并推送差异，不再翻页拉取整张表；
+# 过期、缺失或本地出现快照里没有的产品 (飞书新增记录) 时才全量拉取并重建快照
+SNAPSHOT_FILE = "backfill_snapshot.json"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MAX_AGE_DAYS = float(os.environ.get("BACKFILL_SNAPSHOT_MAX_AGE_DAYS", "7"))
+FORCE_FULL_SYNC = os.environ.get("BACKFILL_FULL_SYNC", "false").lower() in ("true", "1", "yes")
 
 def get_product_key(brand, model, country, platform):
     """生成唯一组合键：品牌_型号_国家_平台"""
@@ -36,6 +33,78 @@ def get_product_key(brand, model, country, platform):
     p = str(platform or "").strip().lower()
     return f"{b}_{m}_{c}_{p}"
 
+def load_snapshot():
+    if not os.path.exists(SNAPSHOT_FILE):
+        return None
+    try:
+        with open(SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+    except Exception as e:
+        print(f"⚠️ 读取快照失败，将全量同步: {e}")
+        return None
+
+def save_snapshot(records, full_sync_at):
+    snapshot = {"version": SNAPSHOT_VERSION, "full_sync_at": full_sync_at, "records": records}
+    tmp_file = SNAPSHOT_FILE + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_file, SNAPSHOT_FILE)
+
+def fetch_remote_state():
+    """全量翻页拉取飞书产品表，返回 record_id -> {key, link, status, debug_info}；失败返回 None"""
+    remote = {}
+    try:
+        for item in BITABLE.iter_records(TABLE_ID):
+            fields = item.get("fields", {})
+            brand = fields.get("品牌")
+            model = fields.get("型号")
+
+            feishu_link_data = fields.get("链接")
+            feishu_link = ""
+            if isinstance(feishu_link_data, dict):
+                feishu_link = feishu_link_data.get("link", "")
+            elif feishu_link_data:
+                feishu_link = str(feishu_link_data)
+
+            remote[item.get("record_id")] = {
+                "key": get_product_key(brand, model, fields.get("国家"), fields.get("平台")),
+                "link": feishu_link.strip(),
+                "status": fields.get("最新状态", ""),
+                "debug_info": f"{brand}|{model}",
+            }
+    except FeishuError as e:
+        print(f"❌ 飞书记录拉取失败: {e}")
+        return None
+    return remote
+
+def diff_updates(remote, local_links, local_status_map):
+    """对比飞书侧状态与本地数据，只返回值确实变化的字段"""
+    records_to_update = []
+    for record_id, state in remote.items():
+        fs_key = state["key"]
+        fields_to_update = {}
+
+        # --- 判断 1: 链接回填 ---
+        if not state["link"] and fs_key in local_links:
+            fields_to_update["链接"] = {"link": local_links[fs_key]}
+
+        # --- 判断 2: 状态回填 ---
+        if fs_key in local_status_map:
+            latest_status = local_status_map[fs_key]
+            if latest_status != state["status"]:
+                fields_to_update["最新状态"] = latest_status
+
+        if fields_to_update:
+            records_to_update.append({
+                "record_id": record_id,
+                "fields": fields_to_update,
+                "debug_info": state.get("debug_info", "")
+            })
+    return records_to_update
+
 def main():
     if not all([APP_ID, APP_SECRET, APP_TOKEN, TABLE_ID]):
         print("❌ 错误: 环境参数缺失")
@@ -43,138 +112,97 @@ def main():
 
     # 1.1 从 products.csv 构建本地 Link 字典
     local_links = {}
+    local_products = set()
     if os.path.exists(CSV_PRODUCTS):
         with open(CSV_PRODUCTS, mode='r', encoding='utf-8-sig') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 clean_row = {k.strip(): v for k, v in row.items() if k is not None}
+                key = get_product_key(clean_row.get("Brand"), clean_row.get("Product Name"), clean_row.get("Country"), clean_row.get("Platform"))
+                local_products.add(key)
                 link = clean_row.get("Link", "").strip()
                 if link:
-                    key = get_product_key(clean_row.get("Brand"), clean_row.get("Product Name"), clean_row.get("Country"), clean_row.get("Platform"))
                     local_links[key] = link
 
-    # 1.2 从 prices.csv 构建最新 Status 字典
+    # 1.2 从最新状态索引 (prices_index.json，monitor.py 写入时维护) 读取每个 SKU 的最后状态
     local_status_map = {}
+    latest_seen = {}
     if os.path.exists(CSV_PRICES):
-        with open(CSV_PRICES, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            # 通过全量遍历覆盖，确保拿到最后一条（即最新的一条）状态
-            for row in reader:
-                clean_row = {k.strip(): v for k, v in row.items() if k is not None}
-                key = get_product_key(clean_row.get("Brand"), clean_row.get("Product Name"), clean_row.get("Country"), clean_row.get("Platform"))
-                status = clean_row.get("Status", "").strip()
-                if status:
-                    local_status_map[key] = status
+        for entry in get_latest_states(CSV_PRICES).values():
+            status = entry.get("last_status")
+            if not status:
+                continue
+            key = get_product_key(entry.get("brand"), entry.get("name"), entry.get("country"), entry.get("platform"))
+            # 大小写不同的同一产品合并为一个 Key，取最后出现的记录
+            seen_at = (entry.get("last_date") or "", entry.get("last_time") or "")
+            if key not in latest_seen or seen_at >= latest_seen[key]:
+                latest_seen[key] = seen_at
+                local_status_map[key] = status
 
     if not local_links and not local_status_map:
         print("ℹ️ 本地没有发现有效的链接或状态信息，无需更新。")
         return
 
-    # 2. 获取 token 并从飞书拉取记录
-    token = get_tenant_access_token()
-    if not token: return
+    # 2. 获取 token，决定增量 / 全量
+    if not get_tenant_access_token(): return
+
+    snapshot = None if FORCE_FULL_SYNC else load_snapshot()
+    full_sync_at = time.time()
+    if snapshot:
+        remote = snapshot["records"]
+        known_keys = {state["key"] for state in remote.values()}
+        age_days = (time.time() - snapshot.get("full_sync_at", 0)) / 86400
+        # products.csv 与飞书监控清单一致，其中出现快照外的产品说明飞书有新增记录
+        new_keys = local_products - known_keys
+        if age_days > SNAPSHOT_MAX_AGE_DAYS:
+            print(f"ℹ️ 快照已 {age_days:.1f} 天未全量校对，执行全量同步。")
+            remote = None
+        elif new_keys:
+            print(f"ℹ️ 本地出现 {len(new_keys)} 个快照中没有的产品，执行全量同步。")
+            remote = None
+        else:
+            full_sync_at = snapshot.get("full_sync_at", 0)
+            print(f"⚡ 使用快照增量比对 ({len(remote)} 条记录，{age_days:.1f} 天前全量校对)，跳过拉取飞书表格。")
+    else:
+        remote = None
 
-    print("🚀 正在检查飞书表格，寻找需要回填或更新状态的记录...")
-    
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/records"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8"
-    }
-    
-    records_to_update = []
-    page_token = None
-    has_more = True
-    
-    while has_more:
-        params = {"page_size": 100}
-        if page_token:
-            params["page_token"] = page_token
-            
-        try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("code") == 0:
-                data = result.get("data", {})
-                items = data.get("items", [])
-                
-                for item in items:
-                    record_id = item.get("record_id")
-                    fields = item.get("fields", {})
-                    
-                    brand = fields.get("品牌")
-                    model = fields.get("型号")
-                    country = fields.get("国家")
-                    platform = fields.get("平台")
-                    fs_key = get_product_key(brand, model, country, platform)
-                    
-                    fields_to_update = {}
-
-                    # --- 判断 1: 链接回填 ---
-                    feishu_link_data = fields.get("链接")
-                    feishu_link = ""
-                    if isinstance(feishu_link_data, dict):
-                        feishu_link = feishu_link_data.get("link", "")
-                    elif feishu_link_data:
-                        feishu_link = str(feishu_link_data)
-
-                    if not feishu_link.strip() and fs_key in local_links:
-                        fields_to_update["链接"] = {"link": local_links[fs_key]}
-
-                    # --- 判断 2: 状态回填 ---
-                    feishu_status = fields.get("最新状态", "")
-                    if fs_key in local_status_map:
-                        latest_status = local_status_map[fs_key]
-                        if latest_status != feishu_status:
-                            fields_to_update["最新状态"] = latest_status
-
-                    if fields_to_update:
-                        records_to_update.append({
-                            "record_id": record_id,
-                            "fields": fields_to_update,
-                            "debug_info": f"{brand}|{model}"
-                        })
-                
-                has_more = data.get("has_more", False)
-                page_token = data.get("page_token")
-            else:
-                print(f"❌ 飞书记录拉取失败: {result.get('msg')}")
-                break
-        except Exception as e:
-            print(f"❌ 网络请求异常: {e}")
-            break
+    if remote is None:
+        print("🚀 正在检查飞书表格，寻找需要回填或更新状态的记录...")
+        remote = fetch_remote_state()
+        if remote is None:
+            return
+
+    records_to_update = diff_updates(remote, local_links, local_status_map)
 
     # 3. 执行批量更新
     if not records_to_update:
         print("ℹ️ 未发现需要更新的记录。")
+        save_snapshot(remote, full_sync_at)
         return
 
     print(f"🔍 发现了 {len(records_to_update)} 条记录需要回填信息。")
     
-    batch_url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/records/batch_update"
-    
-    batch_size = 100
-    for i in range(0, len(records_to_update), batch_size):
-        chunk = records_to_update[i : i + batch_size]
-        payload = {
-            "records": [{"record_id": r["record_id"], "fields": r["fields"]} for r in chunk]
-        }
-        
-        try:
-            print(f"⌛ 正在推送第 {i//batch_size + 1} 批次 ({len(chunk)} 条)...")
-            res = requests.post(batch_url, headers=headers, json=payload)
-            res.raise_for_status()
-            res_json = res.json()
-            
-            if res_json.get("code") == 0:
-                print(f"✨ 第 {i//batch_size + 1} 批次更新完毕。")
-            else:
-                print(f"❌ 批量回填失败: {res_json.get('msg')}")
-        except Exception as e:
-            print(f"❌ 更新异常: {e}")
-
+    failed = False
+    for start, size, error in BITABLE.batch_update(TABLE_ID, records_to_update):
+        if error is None:
+            print(f"✨ 第 {start + 1}-{start + size} 条更新完毕。")
+            # 推送成功的记录同步写入快照
+            for r in records_to_update[start:start + size]:
+                state = remote[r["record_id"]]
+                if "链接" in r["fields"]:
+                    state["link"] = r["fields"]["链接"]["link"]
+                if "最新状态" in r["fields"]:
+                    state["status"] = r["fields"]["最新状态"]
+        else:
+            print(f"❌ 批量回填失败 (第 {start + 1}-{start + size} 条): {error}")
+            failed = True
+
+    if failed:
+        # 失败可能是飞书侧记录已被删除 / 重建 (record_id 失效)，快照照旧会让同一块每次重试都失败；
+        # 作废快照的校对时间，下次运行全量拉取飞书表格重建快照
+        print("⚠️ 部分记录回填失败，下次运行将全量同步飞书表格。")
+        full_sync_at = 0
+    save_snapshot(remote, full_sync_at)
     print("✨ 全部同步任务完成！")
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+import glob
+import os
+import sys
+import time
+
+from html_backend import AVAILABLE_BACKENDS
+from keywords_monitor import _parse_currys_html, _parse_darty_html
+
+# ================= HTML 解析微基准 =================
+# 用法:
+#   python bench_parse.py                      测试 debug_screenshots/ 下保存的完整搜索页 (SAVE_SEARCH_HTML=true 运行 keywords_monitor 生成)
+#   python bench_parse.py 页面1.html 页面2.html  指定文件 (文件名含 currys / darty 以选择解析规则)
+# 环境变量 BENCH_ROUNDS 控制每个后端的重复次数
+
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", "20"))
+
+PARSERS = {
+    "currys": _parse_currys_html,
+    "darty": _parse_darty_html,
+}
+
+def bench_file(path):
+    name = os.path.basename(path).lower()
+    platform = next((p for p in PARSERS if p in name), None)
+    if not platform:
+        print(f"跳过 {path}: 文件名中没有 currys / darty")
+        return
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        html = f.read()
+    parse = PARSERS[platform]
+
+    print(f"\n{os.path.basename(path)} ({platform}, {len(html) / 1024:.0f} KB, {ROUNDS} 轮)")
+    baseline = None
+    expected = None
+    for backend in reversed(AVAILABLE_BACKENDS):  # bs4 作为基准最先跑
+        result = parse(html, backend)
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            parse(html, backend)
+        per_run = (time.perf_counter() - start) / ROUNDS * 1000
+        if baseline is None:
+            baseline, expected = per_run, result
+        same = "一致" if result == expected else f"不一致 ({len(result)} vs {len(expected)})"
+        print(f"  {backend:<11} {per_run:8.2f} ms/页  x{baseline / per_run:5.1f}  商品 {len(result)} 条，结果{same}")
+
+def main():
+    # debug_*_http_response.html 只截取了前 5000 字符，不适合做基准，只用 SAVE_SEARCH_HTML 保存的完整页面
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join("debug_screenshots", "*_search_*.html")))
+    if not paths:
+        print("没有找到可用的 HTML 文件。")
+        return
+    print(f"可用解析后端: {', '.join(AVAILABLE_BACKENDS)}")
+    for path in paths:
+        bench_file(path)
+
+if __name__ == "__main__":
+    main()
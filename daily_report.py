@@ -1,19 +1,121 @@
 import os
 import csv
 from datetime import datetime, timezone, timedelta
-import requests
 from tavily import TavilyClient
 from openai import OpenAI
 
-from sync_feishu import get_tenant_access_token
+from feishu_client import BitableClient, FeishuError, get_tenant_access_token
+from price_index import CSV_FILE as INDEX_CSV_FILE, get_latest_states
+from price_store import PRICE_STORE, sync_from_csv, get_sku_history
 
 # ====== 设定东八区时间，以防 GitHub Actions 默认按 UTC 产生日历差 ======
 BJ_TZ = timezone(timedelta(hours=8))
 
-def get_internal_data(csv_file="prices.csv"):
+# 调价 SKU 附带的历史价格区间天数 (从 prices.db 按 SKU 查询)
+PRICE_HISTORY_DAYS = 30
+
+PRICE_FIELDS = ["Date", "Time", "Brand", "Product Name", "Country", "Platform", "Price", "Currency", "Page Title", "Status", "Price_Trend"]
+
+def analyze_price_windows(csv_file, windows):
+    """
+    单次流式扫描 prices.csv，同时分析多个日期窗口 [(start_date, end_date), ...]
+    每个窗口内按 SKU 只保留两条记录: 窗口前最后一条 / 窗口内最后一条
+    内存为 O(SKU 数 × 窗口数)，与历史行数无关
+    返回 {(start_date, end_date): (notable_price_changes, status_mutations)}
+    """
+    # states[window][key] = {"prev": 窗口前最后一条, "last": 窗口内最后一条}
+    states = {window: {} for window in windows}
+    total = 0
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        f.readline() # 跳过文件头
+        reader = csv.DictReader(f, fieldnames=PRICE_FIELDS)
+        for row in reader:
+            if not any(row.values()):
+                continue
+            total += 1
+            date = row.get("Date") or ""
+            key = (row.get("Brand"), row.get("Product Name"), row.get("Platform"), row.get("Country"))
+            for (start_date, end_date), sku_states in states.items():
+                if date > end_date:
+                    continue
+                state = sku_states.get(key)
+                if state is None:
+                    state = sku_states[key] = {"prev": None, "last": None}
+                if date < start_date:
+                    state["prev"] = row
+                else:
+                    state["last"] = row
+    print(f">>> [内部数据] 成功读取 CSV 文件，共 {total} 条历史记录。")
+
+    results = {}
+    for window, sku_states in states.items():
+        notable_price_changes = []
+        status_mutations = []
+        for key, state in sku_states.items():
+            latest = state["last"]
+            if latest is None:
+                continue
+            trend = latest.get("Price_Trend", "")
+
+            # 1. 甄别涨降价
+            if trend and ("降价" in trend or "涨价" in trend):
+                notable_price_changes.append(latest)
+
+            # 2. 甄别状态突变: 窗口前最后一条 vs 窗口内最新一条
+            prev_record = state["prev"]
+            if prev_record is not None:
+                old_status = prev_record.get("Status")
+                new_status = latest.get("Status")
+                if old_status != new_status:
+                    status_mutations.append({
+                        "key": key,
+                        "old_status": old_status,
+                        "new_status": new_status,
+                        "details": latest
+                    })
+        results[window] = (notable_price_changes, status_mutations)
+    return results
+
+def analyze_latest_day_from_index(date_str):
+    """
+    用 monitor.py 维护的最新状态索引直接得出 date_str 当天的调价与状态突变，O(SKU 数)
+    仅当 date_str 是各 SKU 的最新记录日期 (即日报当天) 时成立
+    """
+    notable_price_changes = []
+    status_mutations = []
+    for entry in get_latest_states().values():
+        if entry.get("last_date") != date_str:
+            continue
+        latest = {
+            "Date": entry["last_date"],
+            "Time": entry.get("last_time"),
+            "Brand": entry.get("brand"),
+            "Product Name": entry.get("name"),
+            "Country": entry.get("country"),
+            "Platform": entry.get("platform"),
+            "Price": entry.get("last_row_price"),
+            "Currency": entry.get("last_row_currency"),
+            "Status": entry.get("last_row_status"),
+            "Price_Trend": entry.get("last_trend"),
+        }
+        trend = latest["Price_Trend"] or ""
+        if "降价" in trend or "涨价" in trend:
+            notable_price_changes.append(latest)
+
+        old_status = entry.get("prev_day_status")
+        if old_status is not None and old_status != latest["Status"]:
+            status_mutations.append({
+                "key": (latest["Brand"], latest["Product Name"], latest["Platform"], latest["Country"]),
+                "old_status": old_status,
+                "new_status": latest["Status"],
+                "details": latest
+            })
+    return notable_price_changes, status_mutations
+
+def get_internal_data(csv_file="prices.csv", start_date=None, end_date=None):
     """
     梳理同目录的 prices.csv 数据
-    提取今天的降价/涨价数据，以及状态突变（如 Out of Stock）的数据
+    提取指定日期窗口 (默认今天) 的降价/涨价数据，以及状态突变（如 Out of Stock）的数据
     """
     notable_price_changes = []
     status_mutations = []
@@ -26,60 +128,49 @@ def get_internal_data(csv_file="prices.csv"):
     # 使用东八区时间
     today_str = datetime.now(BJ_TZ).strftime("%Y-%m-%d")
     print(f">>> [内部数据] 获取到当前东八区日期为: {today_str}")
-    
-    product_history = {}
-    fieldnames = ["Date", "Time", "Brand", "Product Name", "Country", "Platform", "Price", "Currency", "Page Title", "Status", "Price_Trend"]
-    
+    window = (start_date or today_str, end_date or start_date or today_str)
+    if window != (today_str, today_str):
+        print(f">>> [内部数据] 分析窗口: {window[0]} ~ {window[1]}")
+
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            f.readline() # 跳过文件头
-            reader = csv.DictReader(f, fieldnames=fieldnames)
-            for row in reader:
-                 if not any(row.values()): 
-                     continue
-                 key = (row.get("Brand"), row.get("Product Name"), row.get("Platform"), row.get("Country"))
-                 if key not in product_history:
-                     product_history[key] = []
-                 product_history[key].append(row)
-                 
-        print(f">>> [内部数据] 成功读取 CSV 文件，共 {sum(len(v) for v in product_history.values())} 条历史记录。")
+        if window == (today_str, today_str) and os.path.abspath(csv_file) == INDEX_CSV_FILE:
+            # 日报当天: 直接读取最新状态索引，无需重新解析全部历史
+            notable_price_changes, status_mutations = analyze_latest_day_from_index(today_str)
+            print(">>> [内部数据] 已从最新状态索引 (prices_index.json) 读取当日数据。")
+        else:
+            notable_price_changes, status_mutations = analyze_price_windows(csv_file, [window])[window]
     except Exception as e:
         print(f">>> [内部数据] 读取 CSV 出错: {e}")
         return notable_price_changes, status_mutations
 
-    for key, history in product_history.items():
-         today_records = [r for r in history if r.get("Date") == today_str]
-         if not today_records:
-             continue
-         
-         # 当天的最新记录
-         latest_today = today_records[-1]
-         trend = latest_today.get("Price_Trend", "")
-         
-         # 1. 甄别涨降价
-         if trend and ("降价" in trend or "涨价" in trend):
-             notable_price_changes.append(latest_today)
-
-         # 2. 甄别状态突变
-         if len(history) > 1:
-             today_first_idx = history.index(today_records[0])
-             if today_first_idx > 0:
-                 prev_record = history[today_first_idx - 1]
-                 old_status = prev_record.get("Status")
-                 new_status = latest_today.get("Status")
-                 # 状态发生改变，视为突变
-                 if old_status != new_status:
-                     status_mutations.append({
-                         "key": key,
-                         "old_status": old_status,
-                         "new_status": new_status,
-                         "details": latest_today
-                     })
-
     print(f">>> [内部数据] 分析完毕：发现近期显著调价单品 {len(notable_price_changes)} 个，异常状态突变单品 {len(status_mutations)} 个。")
     return notable_price_changes, status_mutations
 
 
+def describe_price_history(row, days=PRICE_HISTORY_DAYS):
+    """查询价格库中该 SKU 近 days 天的成功报价，返回 "近30天区间 a~b" 描述；无数据或价格库关闭时返回空串"""
+    if not PRICE_STORE:
+        return ""
+    try:
+        end_date = row.get("Date")
+        start_date = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=days)).strftime("%Y-%m-%d")
+        history = get_sku_history(
+            (row.get("Product Name") or "").strip(),
+            country=(row.get("Country") or "").strip(),
+            platform=(row.get("Platform") or "").strip(),
+            brand=(row.get("Brand") or "").strip(),
+            start_date=start_date,
+            end_date=end_date,
+            sync=False,
+        )
+    except Exception as e:
+        print(f">>> [价格库] 查询 {row.get('Product Name')} 历史价格失败: {e}")
+        return ""
+    prices = [float(h["Price"]) for h in history if h.get("Price") and h.get("Status") == "Success"]
+    if not prices:
+        return ""
+    return f", 近{days}天区间 {min(prices):g}~{max(prices):g}"
+
 def get_external_news():
     """
     抓取过去 24 小时的欧洲电视与家电行业新闻
@@ -226,17 +317,10 @@ def append_to_feishu_bitable(report_dict):
     table_id = table_id.strip()
 
     print(">>> [同步飞书] 正在尝试获取飞书应用凭证 Tenant Access Token...")
-    token = get_tenant_access_token()
-    if not token:
+    if not get_tenant_access_token():
         print(">>> [同步飞书] ❌ 获取凭证失败 (请检查 FEISHU_APP_ID/SECRET)，写入已中止。")
         return
 
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{app_token}/tables/{table_id}/records"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8"
-    }
-
     # 读取字段值
     price_report = report_dict.get("price_report", "分析异常，未提取到报告数据")
     industry_news = report_dict.get("industry_news", "分析异常，未提取到新闻数据")
@@ -248,33 +332,20 @@ def append_to_feishu_bitable(report_dict):
     # 飞书多维表格 Date 字段目前要求毫秒级时间戳，不能输入格式化的字符串
     today_timestamp = int(datetime.now(BJ_TZ).timestamp() * 1000)
 
-    payload = {
-        "fields": {
-            "日期": today_timestamp,
-            "价格日报": price_report,
-            "行业简讯": industry_news
-        }
+    fields = {
+        "日期": today_timestamp,
+        "价格日报": price_report,
+        "行业简讯": industry_news
     }
 
     try:
-        resp = requests.post(url, headers=headers, json=payload)
-        
-        # 针对 400/500 等异常状态码全面拦截，不粗暴抛出报错，全量打印排查信息
-        if resp.status_code != 200:
-            print(f">>> [同步飞书] ❌ HTTP 请求失败，Status Code: {resp.status_code}")
-            print(f"--- 飞书 API 报错 Response (resp.text) --- \n{resp.text}\n------------------------------------------")
-            print(f"--- 发送的 Payload 数据 --- \n{json.dumps(payload, ensure_ascii=False, indent=2)}\n-------------------------")
-            return
-            
-        result = resp.json()
-        if result.get("code") == 0:
-            print(">>> [同步飞书] ✅ 成功：大模型商业日报已被推送至飞书 Bitable (多维表格) 中！")
-        else:
-            print(f">>> [同步飞书] ❌ 失败：写入遇到逻辑错误 ({result.get('code')}): {result.get('msg')}")
-            print(f"--- 飞书 API 报错 Response 结构 --- \n{resp.text}\n-----------------------------------")
-            print(f"--- 发送的 Payload 数据 --- \n{json.dumps(payload, ensure_ascii=False, indent=2)}\n-------------------------")
-    except Exception as e:
-        print(f">>> [同步飞书] ❌ 网络接口请求异常：{e}")
+        BitableClient(app_token).create_record(table_id, fields)
+        print(">>> [同步飞书] ✅ 成功：大模型商业日报已被推送至飞书 Bitable (多维表格) 中！")
+    except FeishuError as e:
+        # 不粗暴抛出报错，全量打印排查信息
+        print(f">>> [同步飞书] ❌ 失败：写入遇到错误 ({e.code}): {e}")
+        print(f"--- 飞书 API 报错 Response --- \n{e.result}\n------------------------------------------")
+        print(f"--- 发送的 Payload 数据 --- \n{json.dumps({'fields': fields}, ensure_ascii=False, indent=2)}\n-------------------------")
 
 
 def main():
@@ -287,9 +358,13 @@ def main():
     
     price_info = "今日内部监控的 SKU 无显著降价或涨价数据记录。"
     if price_changes:
+         # 增量同步一次价格库，之后逐 SKU 查询历史区间不再重复同步
+         if PRICE_STORE:
+             try: sync_from_csv()
+             except Exception as e: print(f">>> [价格库] 同步失败: {e}")
          price_info = "今日发生价格变动的 SKU 列表：\n" + "\n".join(
              [f" - {r['Brand']} {r['Product Name']} [{r['Platform']}-{r['Country']}]: "
-              f"最新价格 {r['Price']} {r['Currency']}, 趋势：{r['Price_Trend']}" 
+              f"最新价格 {r['Price']} {r['Currency']}, 趋势：{r['Price_Trend']}{describe_price_history(r)}" 
               for r in price_changes]
          )
          
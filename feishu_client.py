@@ -0,0 +1,318 @@
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ================= 配置区域 =================
+APP_ID = os.environ.get("FEISHU_APP_ID")
+APP_SECRET = os.environ.get("FEISHU_APP_SECRET")
+
+BASE_URL = "https://open.feishu.cn/open-apis"
+
+# 飞书 Bitable 单次调用上限
+LIST_PAGE_SIZE = 500
+BATCH_CREATE_LIMIT = 500
+BATCH_UPDATE_LIMIT = 500
+BATCH_DELETE_LIMIT = 500
+
+# Token 有效期 2 小时，提前 5 分钟刷新
+TOKEN_REFRESH_MARGIN = 300
+
+# 限流 / 服务端错误时的重试
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+RATE_LIMIT_CODES = {99991400}
+# 同一数据表有其它写入在进行时返回 1254291 (Write conflict)，请求被明确拒绝，退避后可重试
+WRITE_CONFLICT_CODES = {1254291}
+RETRYABLE_CODES = RATE_LIMIT_CODES | WRITE_CONFLICT_CODES
+TOKEN_INVALID_CODES = {99991661, 99991663, 99991664, 99991668}
+
+# 整个应用的请求速率上限 (飞书按应用限频)
+FEISHU_QPS = float(os.environ.get("FEISHU_QPS", "8"))
+# 单块在 request 内部重试耗尽后，整块再重新提交的次数
+CHUNK_RETRIES = 1
+
+# ================= 共享 HTTP 会话 =================
+# 所有脚本复用同一个 Session (连接池 + keep-alive)，避免每次调用都重新握手
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+_token_cache = {}  # app_id -> (token, 过期时间 monotonic)
+_token_lock = threading.Lock()
+
+# 飞书不允许同一数据表并发写入: 每张表同时只有一个写请求在途，不同表之间互不影响
+_table_write_locks = {}  # (app_token, table_id) -> Lock
+_table_write_locks_guard = threading.Lock()
+
+
+def _table_write_lock(app_token, table_id):
+    with _table_write_locks_guard:
+        return _table_write_locks.setdefault((app_token, table_id), threading.Lock())
+
+
+class RateLimiter:
+    """线程安全的最小间隔限速器: 任意两次放行间隔至少 1/qps 秒"""
+
+    def __init__(self, qps):
+        self.interval = 1.0 / qps if qps > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+RATE_LIMITER = RateLimiter(FEISHU_QPS)
+
+
+class FeishuError(Exception):
+    """飞书接口返回 code != 0 或重试后仍失败"""
+
+    def __init__(self, msg, code=None, result=None):
+        super().__init__(msg)
+        self.code = code
+        self.result = result
+
+
+def get_tenant_access_token(app_id=None, app_secret=None, force_refresh=False):
+    """获取飞书租户令牌；同一进程内缓存复用，临近过期自动刷新。失败返回 None"""
+    app_id = app_id or APP_ID
+    app_secret = app_secret or APP_SECRET
+    with _token_lock:
+        cached = _token_cache.get(app_id)
+        if cached and not force_refresh and time.monotonic() < cached[1]:
+            return cached[0]
+
+        url = f"{BASE_URL}/auth/v3/tenant_access_token/internal"
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        data = {"app_id": app_id, "app_secret": app_secret}
+        try:
+            response = SESSION.post(url, headers=headers, json=data, timeout=15)
+            response.raise_for_status()
+            result = response.json()
+            if result.get("code") == 0:
+                token = result.get("tenant_access_token")
+                expire = int(result.get("expire", 7200))
+                _token_cache[app_id] = (token, time.monotonic() + max(0, expire - TOKEN_REFRESH_MARGIN))
+                return token
+            print(f" 获取 Token 失败: {result.get('msg')}")
+        except Exception as e:
+            print(f" 请求 Token 异常: {e}")
+        return None
+
+
+def iter_chunks(items, size):
+    """把列表按 size 切块"""
+    for i in range(0, len(items), size):
+        yield i, items[i:i + size]
+
+
+def normalize_field_value(value):
+    """把 search 接口返回的富文本片段 [{"type": "text", "text": ...}] 拼回普通字符串，其它类型原样返回"""
+    if isinstance(value, list) and value and all(isinstance(v, dict) and "text" in v for v in value):
+        return "".join(v.get("text") or "" for v in value)
+    return value
+
+
+def summarize_ranges(results):
+    """把逐块结果 [(起始下标, 块大小, 错误)] 合并为连续区间，返回 (成功区间, 失败区间)，区间为 1 起始闭区间"""
+    ok_ranges, failed_ranges = [], []
+    for start, size, error in sorted(results, key=lambda r: r[0]):
+        target = ok_ranges if error is None else failed_ranges
+        if target and target[-1][1] == start:
+            target[-1][1] = start + size
+        else:
+            target.append([start + 1, start + size])
+    return [tuple(r) for r in ok_ranges], [tuple(r) for r in failed_ranges]
+
+
+def format_ranges(ranges):
+    return ", ".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges) or "无"
+
+
+def _retry_delay(response, attempt):
+    """优先使用飞书返回的限流重置时间，否则指数退避"""
+    if response is not None:
+        reset = response.headers.get("x-ogw-ratelimit-reset")
+        if reset:
+            try:
+                return max(float(reset), RETRY_BASE_DELAY)
+            except ValueError:
+                pass
+    return RETRY_BASE_DELAY * (2 ** attempt)
+
+
+class BitableClient:
+    """
+    飞书多维表格客户端:
+      - 复用全局 SESSION 与 Token 缓存
+      - 遇到限流 (HTTP 429 / code 99991400) 或写冲突 (1254291) 自动退避重试，Token 失效时自动刷新；
+        5xx / 超时等结果不确定的失败只对读取接口与带 client_token 的写入重试
+      - 分页迭代器与按接口上限切块的批量增 / 改 / 删；同一张表的写入逐个提交
+    """
+
+    def __init__(self, app_token, app_id=None, app_secret=None):
+        self.app_token = app_token
+        self.app_id = app_id
+        self.app_secret = app_secret
+
+    def _records_url(self, table_id, suffix=""):
+        return f"{BASE_URL}/bitable/v1/apps/{self.app_token}/tables/{table_id}/records{suffix}"
+
+    def request(self, method, url, params=None, json=None, timeout=30, retry_ambiguous=None):
+        """
+        发送请求并返回 data 字段；失败抛出 FeishuError
+        限流 (429 / 99991400)、写冲突 (1254291) 与 Token 失效说明请求被明确拒绝，任何请求都可重试；
+        超时 / 网络异常 / 5xx / 响应无法解析时写入可能已在飞书侧生效，只有 retry_ambiguous 时才重试:
+        默认仅 GET 与 search 读取接口开启，写接口须携带 client_token (飞书按其去重) 才可开启
+        """
+        if retry_ambiguous is None:
+            retry_ambiguous = method == "GET" or url.endswith("/search")
+        force_refresh = False
+        last_error = None
+        for attempt in range(MAX_RETRIES + 1):
+            token = get_tenant_access_token(self.app_id, self.app_secret, force_refresh=force_refresh)
+            if not token:
+                raise FeishuError("无法获取 tenant_access_token")
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json; charset=utf-8",
+            }
+            response = None
+            RATE_LIMITER.wait()
+            try:
+                response = SESSION.request(method, url, headers=headers, params=params, json=json, timeout=timeout)
+                if response.status_code == 429:
+                    last_error = FeishuError(f"HTTP {response.status_code}", result=response.text)
+                elif response.status_code >= 500:
+                    last_error = FeishuError(f"HTTP {response.status_code}", result=response.text)
+                    if not retry_ambiguous:
+                        raise last_error
+                else:
+                    result = response.json()
+                    code = result.get("code")
+                    if code == 0:
+                        return result.get("data", {})
+                    last_error = FeishuError(result.get("msg"), code=code, result=result)
+                    if code in TOKEN_INVALID_CODES:
+                        force_refresh = True
+                        continue
+                    if code not in RETRYABLE_CODES:
+                        raise last_error
+            except FeishuError:
+                raise
+            except (requests.RequestException, ValueError) as e:
+                last_error = FeishuError(f"网络请求异常: {e}")
+                if not retry_ambiguous:
+                    raise last_error
+
+            if attempt < MAX_RETRIES:
+                delay = _retry_delay(response, attempt)
+                print(f" [飞书] {last_error}，{delay:.1f}s 后重试 ({attempt + 1}/{MAX_RETRIES})...")
+                time.sleep(delay)
+        raise last_error
+
+    # ---------- 读取 ----------
+
+    def iter_records(self, table_id, page_size=LIST_PAGE_SIZE, **params):
+        """分页迭代表内记录 (原始 item: {record_id, fields, ...})"""
+        page_token = None
+        while True:
+            query = {"page_size": page_size, **params}
+            if page_token:
+                query["page_token"] = page_token
+            data = self.request("GET", self._records_url(table_id), params=query)
+            for item in data.get("items") or []:
+                yield item
+            if not data.get("has_more"):
+                break
+            page_token = data.get("page_token")
+
+    def list_records(self, table_id, **params):
+        return list(self.iter_records(table_id, **params))
+
+    def iter_search(self, table_id, filter=None, field_names=None, sort=None, page_size=LIST_PAGE_SIZE):
+        """
+        调用 records/search 接口做服务端过滤 + 字段投影，分页迭代记录
+        search 接口的文本字段以富文本片段列表返回，这里统一还原为字符串
+        """
+        body = {}
+        if filter:
+            body["filter"] = filter
+        if field_names:
+            body["field_names"] = list(field_names)
+        if sort:
+            body["sort"] = sort
+        page_token = None
+        while True:
+            params = {"page_size": page_size}
+            if page_token:
+                params["page_token"] = page_token
+            data = self.request("POST", self._records_url(table_id, "/search"), params=params, json=body)
+            for item in data.get("items") or []:
+                item["fields"] = {k: normalize_field_value(v) for k, v in (item.get("fields") or {}).items()}
+                yield item
+            if not data.get("has_more"):
+                break
+            page_token = data.get("page_token")
+
+    # ---------- 写入 ----------
+
+    def create_record(self, table_id, fields):
+        # 同一次调用的所有重试共用一个 client_token，超时后重发不会重复新增
+        with _table_write_lock(self.app_token, table_id):
+            return self.request("POST", self._records_url(table_id), params={"client_token": str(uuid.uuid4())},
+                                json={"fields": fields}, retry_ambiguous=True)
+
+    def _submit_chunk(self, table_id, url, start, chunk, build_payload, use_client_token=False):
+        """
+        提交单块 (持有该表的写锁)；request 内部重试耗尽后整块再重试 CHUNK_RETRIES 次
+        use_client_token 时整块 (含所有重提) 固定一个 client_token，飞书按其去重，超时 / 5xx 也可安全重提；
+        否则只有被限流 / 写冲突明确拒绝时才重提，结果不确定的失败直接上报，不做猜测
+        """
+        params = {"client_token": str(uuid.uuid4())} if use_client_token else None
+        error = None
+        for _ in range(CHUNK_RETRIES + 1):
+            try:
+                with _table_write_lock(self.app_token, table_id):
+                    self.request("POST", url, params=params, json=build_payload(chunk), retry_ambiguous=use_client_token)
+                return start, len(chunk), None
+            except FeishuError as e:
+                error = e
+                if e.code in RETRYABLE_CODES or (use_client_token and e.code is None):
+                    continue
+                # 字段错误等业务错误重试也不会成功
+                break
+        return start, len(chunk), error
+
+    def _batch(self, table_id, suffix, items, chunk_size, build_payload, use_client_token=False):
+        """
+        按接口上限切块，逐块提交 (同一张表不能并发写入，否则返回 1254291 写冲突)；
+        单块失败不影响其它块，按块顺序逐块返回 (起始下标, 块大小, 错误或 None)
+        """
+        url = self._records_url(table_id, suffix)
+        for start, chunk in iter_chunks(items, chunk_size):
+            yield self._submit_chunk(table_id, url, start, chunk, build_payload, use_client_token)
+
+    def batch_create(self, table_id, rows, chunk_size=BATCH_CREATE_LIMIT):
+        """批量新增，rows 为 fields 字典列表"""
+        return self._batch(table_id, "/batch_create", rows, chunk_size,
+                           lambda chunk: {"records": [{"fields": r} for r in chunk]}, use_client_token=True)
+
+    def batch_update(self, table_id, records, chunk_size=BATCH_UPDATE_LIMIT):
+        """批量更新，records 为 {record_id, fields} 列表"""
+        return self._batch(table_id, "/batch_update", records, chunk_size,
+                           lambda chunk: {"records": [{"record_id": r["record_id"], "fields": r["fields"]} for r in chunk]})
+
+    def batch_delete(self, table_id, record_ids, chunk_size=BATCH_DELETE_LIMIT):
+        """批量删除，record_ids 为 record_id 列表"""
+        return self._batch(table_id, "/batch_delete", record_ids, chunk_size,
+                           lambda chunk: {"records": chunk})
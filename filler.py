@@ -1,11 +1,13 @@
 import csv
 import os
 import time
-import random
 import urllib.parse
 import asyncio
 import re
 from playwright.async_api import async_playwright
+from listing_extractor import extract_listing
+from resource_blocker import install_resource_blocking, new_blocking_stats, print_blocking_stats
+from pacing import wait_for_any_selector, wait_for_url_change, wait_for_title_change
 
 # 基础配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -126,8 +128,8 @@ async def handle_antibot_page(page, keyword=""):
             )
             
             if is_bot_page:
-                print(f"  [{keyword}] ⚠ 检测到 Anti-Bot 拦截页 ({title})，等待 5s...")
-                await asyncio.sleep(5)
+                print(f"  [{keyword}] ⚠ 检测到 Anti-Bot 拦截页 ({title})，等待验证通过 (最多 5s)...")
+                await wait_for_title_change(page, title, timeout=5000)
             else:
                 return True
         return False
@@ -143,25 +145,12 @@ async def get_first_result_darty(page, keyword):
     
     try:
         await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
-        selectors = [
-            ".product_detail_link", 
-            "a[data-automation-id='product_details_link']",
-            ".product-card__link",
-            "div.product_list a" 
-        ]
-        for sel in selectors:
-            locators = await page.locator(sel).all()
-            for loc in locators:
-                if await loc.is_visible():
-                    link = await loc.get_attribute("href")
-                    if link:
-                        if not link.startswith("http"):
-                            link = "https://www.darty.com" + link
-                        
-                        # 验证链接
-                        if validate_link(link, keyword):
-                            print(f"  -> 找到链接: {link}")
-                            return link
+        for card in await extract_listing(page, "darty", visible_only=True):
+            link = card["url"]
+            # 验证链接
+            if link and validate_link(link, keyword):
+                print(f"  -> 找到链接: {link}")
+                return link
     except Exception as e:
         print(f"  [Darty搜索失败] {e}")
     return None
@@ -172,12 +161,12 @@ async def get_first_result_boulanger(page, keyword):
     try:
         if "boulanger.com" not in page.url or "resultats" in page.url or "Oups" in await page.title():
             await page.goto("https://www.boulanger.com", wait_until='domcontentloaded', timeout=30000)
-            await asyncio.sleep(random.uniform(2, 4))
+            await wait_for_any_selector(page, ["input[name='tr']", "#searching", "input[type='search']", "#onetrust-accept-btn-handler"])
 
         try:
             if await page.is_visible("#onetrust-accept-btn-handler", timeout=3000):
                 await page.click("#onetrust-accept-btn-handler")
-                await asyncio.sleep(1)
+                await page.wait_for_selector("#onetrust-accept-btn-handler", state="hidden", timeout=3000)
         except: pass
 
         search_input = None
@@ -208,11 +197,11 @@ async def get_first_result_boulanger(page, keyword):
                 # 如果没能成功检测到 URL 变化，回退到普通等待
                 await page.wait_for_load_state("domcontentloaded")
             
-            await asyncio.sleep(2)
+            await wait_for_any_selector(page, ["a[href*='/ref/']"])
         else:
             search_url = f"https://www.boulanger.com/resultats?tr={urllib.parse.quote(keyword)}"
             await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
-            await asyncio.sleep(3)
+            await wait_for_any_selector(page, ["a[href*='/ref/']"])
 
         current_url = page.url
         current_title = await page.title()
@@ -223,20 +212,11 @@ async def get_first_result_boulanger(page, keyword):
                 return current_url
 
         # 提取结果列表，强制过滤可见元素，防止抓到建议层的隐藏内容
-        links = await page.locator("a[href*='/ref/']:visible").all()
-        for link_locator in links:
-            if not await link_locator.is_visible():
-                continue
-                
-            href = await link_locator.get_attribute("href")
-            if href:
-                if not href.startswith("http"):
-                    href = "https://www.boulanger.com" + href
-                
-                # 获取该链接可能的文本描述
-                desc = await link_locator.inner_text()
-                if validate_link(href, keyword, desc):
-                    return href
+        for card in await extract_listing(page, "boulanger", visible_only=True):
+            href = card["url"]
+            # 用该链接的文本描述辅助验证
+            if href and validate_link(href, keyword, card["text"]):
+                return href
 
     except Exception as e:
         print(f"  [Boulanger搜索失败] {e}")
@@ -248,12 +228,12 @@ async def get_first_result_amazon(page, keyword):
     try:
         if "amazon.co.uk" not in page.url:
             await page.goto("https://www.amazon.co.uk", wait_until='domcontentloaded', timeout=30000)
-            await asyncio.sleep(random.uniform(1, 3))
+            await wait_for_any_selector(page, ["#twotabsearchtextbox", "#sp-cc-accept"])
 
         try:
             if await page.is_visible("#sp-cc-accept", timeout=3000):
                 await page.click("#sp-cc-accept")
-                await asyncio.sleep(1)
+                await page.wait_for_selector("#sp-cc-accept", state="hidden", timeout=3000)
         except: pass
 
         search_input = page.locator("#twotabsearchtextbox").first
@@ -269,22 +249,14 @@ async def get_first_result_amazon(page, keyword):
             await page.goto(url, wait_until='domcontentloaded')
 
         await page.wait_for_load_state("domcontentloaded")
-        await asyncio.sleep(3)
+        await wait_for_any_selector(page, ["div.s-main-slot a[href*='/dp/']"], timeout=8000)
 
-        links = await page.locator("div.s-main-slot a[href*='/dp/']").all()
-        for link in links:
-            href = await link.get_attribute("href")
+        for card in await extract_listing(page, "amazon"):
+            href = card["href"]
             if href and "slredirect" not in href and "#" not in href and "/dp/" in href:
-                if not href.startswith("http"):
-                    href = "https://www.amazon.co.uk" + href
-                
-                # 检查标题
-                parent_h2 = await page.evaluate_handle("el => el.closest('div.s-result-item').querySelector('h2')", link)
-                title_text = ""
-                if parent_h2: 
-                    title_text = await (await parent_h2.get_property("innerText")).json_value()
-                
-                if validate_link(href, keyword, title_text):
+                href = card["url"]
+                # 检查所属卡片的标题
+                if validate_link(href, keyword, card["title"]):
                     print(f"  -> 找到链接: {href}")
                     return href
     except Exception as e:
@@ -297,22 +269,17 @@ async def get_first_result_fnac(page, keyword):
     search_url = f"https://www.fnac.com/SearchResult/ResultList.aspx?Search={urllib.parse.quote(keyword)}"
     try:
         await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
-        await asyncio.sleep(2)
+        await wait_for_any_selector(page, ["article a"])
         try:
             if await page.is_visible("#onetrust-accept-btn-handler", timeout=3000):
                 await page.click("#onetrust-accept-btn-handler")
         except: pass
             
-        potential_links = await page.locator("article a").all()
-        for link in potential_links:
-            href = await link.get_attribute("href")
-            title = await link.inner_text()
-            if href:
-                if not href.startswith("http"): 
-                    href = "https://www.fnac.com" + href
-                
+        for card in await extract_listing(page, "fnac"):
+            if card["href"]:
+                href = card["url"]
                 if ("/a" in href or "/mp" in href) and not "avis" in href:
-                    if validate_link(href, keyword, title):
+                    if validate_link(href, keyword, card["text"]):
                         print(f"  -> 找到链接: {href}")
                         return href
     except Exception as e:
@@ -325,12 +292,12 @@ async def get_first_result_currys(page, keyword):
     try:
         await page.goto("https://www.currys.co.uk", wait_until='domcontentloaded', timeout=30000)
         await handle_antibot_page(page, keyword)
-        await asyncio.sleep(random.uniform(1, 2))
+        await wait_for_any_selector(page, ["input[name='search']", "input[type='search']", "input[data-test='search-input']"])
         
         try:
             if await page.is_visible("#onetrust-accept-btn-handler", timeout=3000):
                 await page.click("#onetrust-accept-btn-handler")
-                await asyncio.sleep(1)
+                await page.wait_for_selector("#onetrust-accept-btn-handler", state="hidden", timeout=3000)
         except: pass
         
         search_input = None
@@ -348,14 +315,16 @@ async def get_first_result_currys(page, keyword):
             await asyncio.sleep(0.5)
             await page.keyboard.type(keyword, delay=80)
             await asyncio.sleep(0.5)
+            old_url = page.url
             await page.keyboard.press("Enter")
+            await wait_for_url_change(page, old_url)
             await page.wait_for_load_state("domcontentloaded")
-            await asyncio.sleep(4)
+            await wait_for_any_selector(page, ["a[href*='/products/']"])
         else:
             search_url = f"https://www.currys.co.uk/search/{urllib.parse.quote(keyword)}"
             await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
             await handle_antibot_page(page, keyword)
-            await asyncio.sleep(3)
+            await wait_for_any_selector(page, ["a[href*='/products/']"])
         
         current_url = page.url
         # 验证直接跳转
@@ -364,15 +333,10 @@ async def get_first_result_currys(page, keyword):
                 return current_url
         
         # 查找结果
-        links = await page.locator("a[href*='/products/']").all()
-        for link_locator in links:
-            href = await link_locator.get_attribute("href")
-            title = await link_locator.inner_text()
-            if href:
-                if not href.startswith("http"):
-                    href = "https://www.currys.co.uk" + href
-                
-                if validate_link(href, keyword, title):
+        for card in await extract_listing(page, "currys"):
+            if card["href"]:
+                href = card["url"]
+                if validate_link(href, keyword, card["text"]):
                     print(f"  -> Validated link: {href}")
                     return href
         
@@ -386,14 +350,16 @@ async def get_first_result_mediamarkt(page, keyword):
     try:
         await page.goto("https://www.mediamarkt.de", wait_until='domcontentloaded', timeout=30000)
         await handle_antibot_page(page, keyword)
-        await asyncio.sleep(random.uniform(1.5, 3.0))
+        await wait_for_any_selector(page, ["input[data-test='mms-search-input']", "input[name='query']", "[data-testid='mms-accept-all-button']"])
 
         # 接受 Cookie（德语按钮）
         for btn in ["[data-testid='mms-accept-all-button']", "button:has-text('Alle akzeptieren')", "button:has-text('Akzeptieren')", "#onetrust-accept-btn-handler"]:
             try:
                 if await page.is_visible(btn, timeout=2000):
                     await page.click(btn)
-                    await asyncio.sleep(1)
+                    # 横幅隐藏得慢也不再尝试其它按钮，点击一次即退出
+                    try: await page.wait_for_selector(btn, state="hidden", timeout=3000)
+                    except: pass
                     break
             except: pass
 
@@ -413,30 +379,25 @@ async def get_first_result_mediamarkt(page, keyword):
             await asyncio.sleep(0.3)
             await page.keyboard.type(keyword, delay=100)
             await asyncio.sleep(0.5)
+            old_url = page.url
             await page.keyboard.press("Enter")
+            await wait_for_url_change(page, old_url, timeout=15000)
             try: await page.wait_for_load_state("domcontentloaded", timeout=15000)
             except: pass
-            await asyncio.sleep(3)
+            await wait_for_any_selector(page, ["a[href*='/product/']"])
         else:
             search_url = f"https://www.mediamarkt.de/search?query={urllib.parse.quote(keyword)}"
             await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
             await handle_antibot_page(page, keyword)
-            await asyncio.sleep(3)
+            await wait_for_any_selector(page, ["a[href*='/product/']"])
 
         # 提取结果链接
-        selectors = ["a[href*='/product/']", "a[data-test='mms-router-link']", "article a", "li a[href*='/de/product/']"]
-        for sel in selectors:
-            locators = await page.locator(sel).all()
-            for loc in locators:
-                if await loc.is_visible():
-                    href = await loc.get_attribute("href")
-                    if href and "/product/" in href:
-                        if not href.startswith("http"):
-                            href = "https://www.mediamarkt.de" + href
-                        title = await loc.inner_text()
-                        if validate_link(href, keyword, title):
-                            print(f"  -> 找到链接: {href}")
-                            return href
+        for card in await extract_listing(page, "mediamarkt", visible_only=True):
+            if "/product/" in card["href"]:
+                href = card["url"]
+                if validate_link(href, keyword, card["text"]):
+                    print(f"  -> 找到链接: {href}")
+                    return href
     except Exception as e:
         print(f"  [MediaMarkt搜索失败] {e}")
     return None
@@ -448,14 +409,16 @@ async def get_first_result_coolblue(page, keyword):
     try:
         await page.goto("https://www.coolblue.de", wait_until='domcontentloaded', timeout=30000)
         await handle_antibot_page(page, keyword)
-        await asyncio.sleep(random.uniform(1.5, 3.0))
+        await wait_for_any_selector(page, ["input[data-test='search-input']", "input[name='query']", "input[type='search']"])
 
         # 接受 Cookie
         for btn in ["button:has-text('Akzeptieren')", "button:has-text('Alle akzeptieren')", "#onetrust-accept-btn-handler", "[data-test='accept-cookies']"]:
             try:
                 if await page.is_visible(btn, timeout=2000):
                     await page.click(btn)
-                    await asyncio.sleep(1)
+                    # 横幅隐藏得慢也不再尝试其它按钮，点击一次即退出
+                    try: await page.wait_for_selector(btn, state="hidden", timeout=3000)
+                    except: pass
                     break
             except: pass
 
@@ -475,30 +438,26 @@ async def get_first_result_coolblue(page, keyword):
             await asyncio.sleep(0.3)
             await page.keyboard.type(keyword, delay=100)
             await asyncio.sleep(0.5)
+            old_url = page.url
             await page.keyboard.press("Enter")
+            await wait_for_url_change(page, old_url, timeout=15000)
             try: await page.wait_for_load_state("domcontentloaded", timeout=15000)
             except: pass
-            await asyncio.sleep(3)
+            await wait_for_any_selector(page, ["a[href*='/product/']", "a[href*='/produkt/']"])
         else:
             search_url = f"https://www.coolblue.de/de/suche?query={urllib.parse.quote(keyword)}"
             await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
             await handle_antibot_page(page, keyword)
-            await asyncio.sleep(3)
+            await wait_for_any_selector(page, ["a[href*='/product/']", "a[href*='/produkt/']"])
 
         # 提取结果链接
-        selectors = ["a[href*='/product/']", "a[href*='/produkt/']", "li[data-test='product'] a", "article a"]
-        for sel in selectors:
-            locators = await page.locator(sel).all()
-            for loc in locators:
-                if await loc.is_visible():
-                    href = await loc.get_attribute("href")
-                    if href and ("/product/" in href or "/produkt/" in href):
-                        if not href.startswith("http"):
-                            href = "https://www.coolblue.de" + href
-                        title = await loc.inner_text()
-                        if validate_link(href, keyword, title):
-                            print(f"  -> 找到链接: {href}")
-                            return href
+        for card in await extract_listing(page, "coolblue", visible_only=True):
+            href = card["href"]
+            if "/product/" in href or "/produkt/" in href:
+                href = card["url"]
+                if validate_link(href, keyword, card["text"]):
+                    print(f"  -> 找到链接: {href}")
+                    return href
     except Exception as e:
         print(f"  [Coolblue搜索失败] {e}")
     return None
@@ -580,6 +539,7 @@ async def run_filler_async(headless=False):
         browser_args = ['--disable-blink-features=AutomationControlled']
         browser = await p.chromium.launch(headless=headless, args=browser_args)
         sem = asyncio.Semaphore(3)
+        route_stats = new_blocking_stats()
 
         async def process_item(idx):
             async with sem:
@@ -607,10 +567,11 @@ async def run_filler_async(headless=False):
                 dynamic_stealth = STEALTH_JS.replace("'de-DE'", f"'{locale_str}'").replace("'de'", f"'{lang_short}'")
                 await context.add_init_script(dynamic_stealth)
                 
-                page = await context.new_page()
                 brand = row.get("Brand") or ""
                 platform_val = row.get("Platform") or row.get("平台", "")
                 platform_lower = platform_val.strip().lower()
+                await install_resource_blocking(context, platform_lower, route_stats)
+                page = await context.new_page()
                 
                 print(f"正在处理 [{platform_val}] {name} ...")
                 new_link = None
@@ -640,6 +601,7 @@ async def run_filler_async(headless=False):
         tasks = [process_item(i) for i in to_fill_idx]
         results = await asyncio.gather(*tasks)
         await browser.close()
+        print_blocking_stats(route_stats)
         
         updated_count = 0
         for idx, new_link in results:
@@ -0,0 +1,108 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+# ================= 可插拔 HTML 解析后端 =================
+# 优先使用 C 实现的解析器 (selectolax > lxml)，都未安装时退回 BeautifulSoup 自带的 html.parser
+# 可用环境变量 HTML_PARSER=selectolax / lxml / bs4 强制指定
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as SelectolaxParser
+    except ImportError:
+        SelectolaxParser = None
+
+try:
+    import lxml.html
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    lxml = None
+    CSSSelector = None
+
+AVAILABLE_BACKENDS = ["bs4"]
+if CSSSelector is not None:
+    AVAILABLE_BACKENDS.insert(0, "lxml")
+if SelectolaxParser is not None:
+    AVAILABLE_BACKENDS.insert(0, "selectolax")
+
+_requested = os.environ.get("HTML_PARSER", "").strip().lower()
+BACKEND = _requested if _requested in AVAILABLE_BACKENDS else AVAILABLE_BACKENDS[0]
+
+# 超过该大小 (字符数) 的页面放到进程池解析，避免长时间占用 GIL 拖慢事件循环里的其它任务
+PARSE_PROCESS_THRESHOLD = int(os.environ.get("PARSE_PROCESS_THRESHOLD", "400000"))
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "2"))
+
+_process_pool = None
+
+
+def _anchors_selectolax(html, selectors):
+    tree = SelectolaxParser(html)
+    return [
+        [(n.attributes.get("href") or "", n.attributes.get("title") or "", n.text(deep=True, separator="", strip=True))
+         for n in tree.css(sel)]
+        for sel in selectors
+    ]
+
+
+def _anchors_lxml(html, selectors):
+    doc = lxml.html.fromstring(html)
+    return [
+        [(el.get("href") or "", el.get("title") or "", "".join(t.strip() for t in el.xpath(".//text()")))
+         for el in CSSSelector(sel)(doc)]
+        for sel in selectors
+    ]
+
+
+def _anchors_bs4(html, selectors):
+    soup = BeautifulSoup(html, "html.parser")
+    return [
+        [(a.get("href") or "", a.get("title") or "", a.get_text(strip=True)) for a in soup.select(sel)]
+        for sel in selectors
+    ]
+
+
+_ANCHOR_EXTRACTORS = {
+    "selectolax": _anchors_selectolax,
+    "lxml": _anchors_lxml,
+    "bs4": _anchors_bs4,
+}
+
+
+def select_anchors(html, selectors, backend=None):
+    """
+    只解析一次页面，按每个 CSS 选择器返回命中元素的 (href, title 属性, 去空白文本) 列表，
+    与 BeautifulSoup 的 a.get("href") / a.get("title") / a.get_text(strip=True) 结果一致
+    """
+    return _ANCHOR_EXTRACTORS[backend or BACKEND](html, selectors)
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _process_pool
+
+
+async def parse_async(parse_func, html):
+    """
+    在事件循环之外执行解析: 小页面用默认线程池，大页面用进程池 (parse_func 必须是模块级函数)；
+    进程池不可用时退回线程池
+    """
+    loop = asyncio.get_running_loop()
+    if len(html) >= PARSE_PROCESS_THRESHOLD and PARSE_WORKERS > 0:
+        try:
+            return await loop.run_in_executor(_get_process_pool(), parse_func, html)
+        except Exception as e:
+            print(f"  [HTML解析] 进程池解析失败，改用线程池: {e}")
+    return await loop.run_in_executor(None, parse_func, html)
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
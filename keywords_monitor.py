@@ -1,28 +1,62 @@
 import os
 import csv
-import time
-import requests
 import asyncio
 import urllib.parse
 import random
 import re
 import json
-from bs4 import BeautifulSoup
 from datetime import datetime, timezone, timedelta
 from playwright.async_api import async_playwright
 from curl_cffi import requests as cffi_requests
+from listing_extractor import extract_listing
+from html_backend import select_anchors, parse_async, shutdown_process_pool
+from resource_blocker import install_resource_blocking, new_blocking_stats, print_blocking_stats
+from pacing import PacingController, wait_for_any_selector, wait_for_url_change, wait_for_title_change, wait_for_scroll_growth
 
-# 引入项目中已有的获取 token 模块
-from sync_feishu import get_tenant_access_token
+# 共享飞书客户端 (连接池 + Token 缓存，长时间运行时自动续期)
+from feishu_client import BitableClient, FeishuError, get_tenant_access_token
+# 已知商品库 (SQLite，按 URL 索引，记录首次 / 最近出现日期)
+import known_store
 
 # ================= 配置区 =================
 APP_TOKEN = os.environ.get("FEISHU_APP_TOKEN")
 KEYWORDS_TABLE_ID = os.environ.get("FEISHU_KEYWORDS_TABLE_ID")
 NEW_ITEMS_TABLE_ID = os.environ.get("FEISHU_NEW_ITEMS_TABLE_ID")
 KNOWN_PRODUCTS_CSV = "known_products.csv"
+BITABLE = BitableClient(APP_TOKEN)
 # 东八区时区
 BJ_TZ = timezone(timedelta(hours=8))
 
+# 同平台相邻两次搜索/翻页的基础间隔 (秒)，按拦截情况自适应缩放
+PACER = PacingController(default_delay=(2.0, 4.0))
+
+# 关键词任务并发: 不同平台并行，同一平台同时只跑 1 个关键词；全局上限防止 Runner 内存吃紧
+KEYWORD_PLATFORM_CONCURRENCY = int(os.environ.get("KEYWORD_PLATFORM_CONCURRENCY", "1"))
+KEYWORD_GLOBAL_CONCURRENCY = int(os.environ.get("KEYWORD_GLOBAL_CONCURRENCY", "3"))
+
+# Boulanger 快速通道: 直接读取页面内嵌状态 JSON / 列表 XHR 响应，后续页并发直取；失败时退回滚动抓取
+BOULANGER_FAST_PATH = os.environ.get("BOULANGER_FAST_PATH", "true").lower() in ("true", "1", "yes")
+BOULANGER_PAGE_CONCURRENCY = int(os.environ.get("BOULANGER_PAGE_CONCURRENCY", "3"))
+BOULANGER_MAX_PAGES = 9
+# 单页原始商品数低于该值视为最后一页 (与滚动抓取的判定一致)；快速通道第 1 页不足该值时不再翻页
+BOULANGER_FULL_PAGE = 25
+
+# Amazon 多页搜索: 第 1 页走搜索框，第 2..N 页在同一 Context 的新标签页中按 page= 并发打开
+AMAZON_MAX_PAGES = int(os.environ.get("AMAZON_MAX_PAGES", "5"))
+AMAZON_PAGE_CONCURRENCY = int(os.environ.get("AMAZON_PAGE_CONCURRENCY", "3"))
+ASIN_RE = re.compile(r"/dp/([A-Z0-9]{10})")
+# 翻页验证码 / 拦截页特征
+AMAZON_CAPTCHA_SELECTOR = "form[action*='validateCaptcha'], #captchacharacters"
+
+# 翻页标签页的并发额度按平台共享 (同平台所有关键词任务共用)，
+# KEYWORD_PLATFORM_CONCURRENCY > 1 时同时打开的页面总数也不会成倍增加
+PAGE_SEMS = {}
+
+def get_page_semaphore(platform_key, limit):
+    if platform_key not in PAGE_SEMS:
+        PAGE_SEMS[platform_key] = asyncio.Semaphore(limit)
+    return PAGE_SEMS[platform_key]
+
 # ================= 反爬伪装池与 Stealth 脚本 =================
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
@@ -72,70 +106,45 @@ if (origContentWindow) {
 """
 
 # ================= 飞书操作模块 =================
-def get_feishu_keywords(token):
+def get_feishu_keywords():
     """
     拉取监控配置（读取飞书表 1）
     """
     print(">>> [配置加载] 正在请求飞书检索待监控的关键词列表...")
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{APP_TOKEN}/tables/{KEYWORDS_TABLE_ID}/records"
-    headers = {"Authorization": f"Bearer {token}"}
-    
     keywords_to_monitor = []
-    page_token = None
     
     try:
-        while True:
-            params = {"page_size": 100}
-            if page_token:
-                params["page_token"] = page_token
-                
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            result = response.json()
+        for item in BITABLE.iter_records(KEYWORDS_TABLE_ID):
+            fields = item.get("fields", {})
+            platform = fields.get("平台")
+            keyword = fields.get("搜索关键词")
+            is_active = fields.get("是否开启监控")
             
-            if result.get("code") != 0:
-                print(f" 获取关键词表失败: {result.get('msg')}")
-                break
+            # 兼容不同类型的数据格式 (True, "是", ["是"])
+            active_flag = False
+            if isinstance(is_active, bool) and is_active:
+                active_flag = True
+            elif isinstance(is_active, str) and is_active.strip() in ["是", "True", "true"]:
+                active_flag = True
+            elif isinstance(is_active, list) and len(is_active) > 0 and str(is_active[0]).strip() in ["是", "True", "true"]:
+                active_flag = True
                 
-            data = result.get("data", {})
-            items = data.get("items", [])
-            
-            for item in items:
-                fields = item.get("fields", {})
-                platform = fields.get("平台")
-                keyword = fields.get("搜索关键词")
-                is_active = fields.get("是否开启监控")
-                
-                # 兼容不同类型的数据格式 (True, "是", ["是"])
-                active_flag = False
-                if isinstance(is_active, bool) and is_active:
-                    active_flag = True
-                elif isinstance(is_active, str) and is_active.strip() in ["是", "True", "true"]:
-                    active_flag = True
-                elif isinstance(is_active, list) and len(is_active) > 0 and str(is_active[0]).strip() in ["是", "True", "true"]:
-                    active_flag = True
-                    
-                if active_flag and platform and keyword:
-                    keywords_to_monitor.append({
-                        "platform": platform, 
-                        "keyword": keyword
-                    })
-                    
-            if data.get("has_more"):
-                page_token = data.get("page_token")
-            else:
-                break
+            if active_flag and platform and keyword:
+                keywords_to_monitor.append({
+                    "platform": platform, 
+                    "keyword": keyword
+                })
                 
         print(f">>> [配置加载] 成功读取 {len(keywords_to_monitor)} 个待监控关键词。")
         return keywords_to_monitor
-    except requests.exceptions.RequestException as e:
-        print(f" 请求飞书表格异常 (网络层): {e}")
+    except FeishuError as e:
+        print(f" 获取关键词表失败: {e}")
     except Exception as e:
         print(f" 读取飞书配置失败 (内部解析): {e}")
     
     return keywords_to_monitor
 
-def push_new_items_to_feishu(token, records_to_push):
+def push_new_items_to_feishu(records_to_push):
     """
     汇总与报警输出（写入飞书表 2）
     """
@@ -144,25 +153,13 @@ def push_new_items_to_feishu(token, records_to_push):
         return
         
     print(f">>> [结果推送] 准备向飞书表写回 {len(records_to_push)} 条关键词维度的监控报告...")
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{APP_TOKEN}/tables/{NEW_ITEMS_TABLE_ID}/records/batch_create"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8"
-    }
-    
-    # 按照飞书要求构建 payload，保证 key 正确对应字段名
-    feishu_payload = {"records": [{"fields": r} for r in records_to_push]}
     
-    try:
-        response = requests.post(url, headers=headers, json=feishu_payload)
-        response.raise_for_status()
-        result = response.json()
-        if result.get("code") == 0:
-            print(f">>> [结果推送] 推送成功！已写入 {len(records_to_push)} 条汇总记录。")
+    # 按飞书 batch_create 上限分块写入，保证 key 正确对应字段名
+    for start, size, error in BITABLE.batch_create(NEW_ITEMS_TABLE_ID, records_to_push):
+        if error is None:
+            print(f">>> [结果推送] 推送成功！已写入 {size} 条汇总记录。")
         else:
-            print(f" 推送上新记录失败，飞书反馈信息: {result.get('msg')}")
-    except Exception as e:
-        print(f" 批量推送飞书表 2 异常: {e}")
+            print(f" 推送上新记录失败，飞书反馈信息: {error}")
 
 # ================= 辅助反爬验证函数 =================
 async def handle_bot_protection(page, keyword=""):
@@ -176,8 +173,8 @@ async def handle_bot_protection(page, keyword=""):
                 "Verify you are human" in content or
                 "Vérification de l" in content or
                 "Vérification" in title):
-                print(f"  [{keyword}] ⚠ 检测到平台验证层，稍作等待 5s...")
-                await asyncio.sleep(5)
+                print(f"  [{keyword}] ⚠ 检测到平台验证层，等待验证通过 (最多 5s)...")
+                await wait_for_title_change(page, title, timeout=5000)
             else:
                 return True
         return False
@@ -209,108 +206,156 @@ async def validate_title_match(title: str, keyword: str) -> bool:
     return True
 
 # ================= 纯 HTTP 爬取方案 (curl_cffi 绕过 TLS 指纹检测) =================
-def _http_search_currys(keyword):
-    """使用 curl_cffi 伪装真实浏览器进行 HTTP 请求，绕过 Cloudflare 检测"""
+# 每个平台维护一个已预热的 AsyncSession 池: Cookie 与 TLS 连接跨关键词复用，
+# 只有新建会话时才访问首页预热，之后每个关键词只需发一次搜索请求
+HTTP_PLATFORMS = {
+    "currys": {"label": "Currys", "home": "https://www.currys.co.uk/", "warmup_delay": (1, 4)},
+    "darty": {"label": "Darty", "home": "https://www.darty.com/", "warmup_delay": (2, 5)},
+}
+# 随机选择一个指纹，让 curl_cffi 自己去补全 User-Agent 和所有 Request Headers，保证 TLS 与 Header 自洽
+IMPERSONATE_LIST = ["chrome100", "chrome104", "chrome110", "chrome116", "safari15_3", "safari15_5", "edge101"]
+# 每个平台同时在途的 HTTP 搜索数 (即池内最多的会话数)
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "2"))
+# 保存完整的搜索结果页 HTML 到 debug_screenshots/，供 bench_parse.py 做解析基准测试
+SAVE_SEARCH_HTML = os.environ.get("SAVE_SEARCH_HTML", "false").lower() in ("true", "1", "yes")
+
+class WarmSessionPool:
+    """按平台划分的 curl_cffi AsyncSession 池，借出数受信号量限制，被拦截的会话直接丢弃"""
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = {}  # platform -> [已预热的空闲会话]
+        self._sems = {}
+
+    async def _new_session(self, platform):
+        conf = HTTP_PLATFORMS[platform]
+        impersonate_choice = random.choice(IMPERSONATE_LIST)
+        print(f"  [{conf['label']}] 新建会话，请求指纹: {impersonate_choice}")
+        session = cffi_requests.AsyncSession(impersonate=impersonate_choice)
+        try:
+            # 预热主站获得各种 Cookies
+            await session.get(conf["home"], timeout=20)
+            await asyncio.sleep(random.uniform(*conf["warmup_delay"]))
+        except Exception:
+            await session.close()
+            raise
+        return session
+
+    async def acquire(self, platform):
+        sem = self._sems.setdefault(platform, asyncio.Semaphore(self.size))
+        await sem.acquire()
+        idle = self._idle.setdefault(platform, [])
+        if idle:
+            return idle.pop()
+        try:
+            return await self._new_session(platform)
+        except Exception:
+            sem.release()
+            raise
+
+    async def release(self, platform, session, healthy=True):
+        """归还会话；healthy=False (被拦截 / 异常) 时关闭，下次借出时换指纹重新预热"""
+        if healthy:
+            self._idle.setdefault(platform, []).append(session)
+        else:
+            try: await session.close()
+            except Exception: pass
+        self._sems[platform].release()
+
+    async def close(self):
+        for sessions in self._idle.values():
+            for session in sessions:
+                try: await session.close()
+                except Exception: pass
+        self._idle.clear()
+
+HTTP_POOL = WarmSessionPool(HTTP_POOL_SIZE)
+
+CURRYS_SELECTORS = ["a[href*='/products/']"]
+DARTY_SELECTORS = ["a.product_detail_link", "a[data-automation-id='product_details_link']", ".product-card__link", "div.product_list a"]
+
+def _parse_currys_html(html, backend=None):
     products = []
-    search_url = f"https://www.currys.co.uk/search/{urllib.parse.quote(keyword)}"
-    
-    # 随机选择一个指纹，让 curl_cffi 自己去补全 User-Agent 和所有 Request Headers
-    impersonate_list = ["chrome100", "chrome104", "chrome110", "chrome116", "safari15_3", "safari15_5", "edge101"]
-    impersonate_choice = random.choice(impersonate_list)
-    print(f"  [Currys] 请求指纹: {impersonate_choice}")
+    for matches in select_anchors(html, CURRYS_SELECTORS, backend):
+        for href, title_attr, text in matches:
+            title = title_attr or text
+            if href and title and len(title) > 5:
+                url = "https://www.currys.co.uk" + href if not href.startswith("http") else href
+                products.append({"title": title, "url": url})
+    return products
+
+def _parse_darty_html(html, backend=None):
+    products = []
+    # 专用选择器与兜底的全部链接在同一次解析中取出
+    *matches_list, all_links = select_anchors(html, DARTY_SELECTORS + ["a[href]"], backend)
+    for matches in matches_list:
+        for href, title_attr, text in matches:
+            title = title_attr or text
+            if href and title and len(title) > 5:
+                url = "https://www.darty.com" + href if not href.startswith("http") else href
+                products.append({"title": title, "url": url})
     
-    try:
-        session = cffi_requests.Session(impersonate=impersonate_choice)
-        # 预热主站
-        session.get("https://www.currys.co.uk/", timeout=20)
-        time.sleep(random.uniform(1, 4))
-        
-        # 搜索请求
-        resp = session.get(search_url, timeout=20)
-        print(f"  [Currys HTTP] 状态码: {resp.status_code}, 响应长度: {len(resp.text)}")
-        
-        if resp.status_code == 200 and len(resp.text) > 5000:
-            soup = BeautifulSoup(resp.text, "html.parser")
-            for a_tag in soup.select("a[href*='/products/']"):
-                href = a_tag.get("href", "")
-                title = a_tag.get("title", "") or a_tag.get_text(strip=True)
-                if href and title and len(title) > 5:
-                    url = "https://www.currys.co.uk" + href if not href.startswith("http") else href
+    if not products:
+        for href, title_attr, text in all_links:
+            if "/nav/codic/" in href or "/f-" in href:
+                title = title_attr or text
+                if title and len(title) > 5:
+                    url = "https://www.darty.com" + href if not href.startswith("http") else href
                     products.append({"title": title, "url": url})
-        else:
-            print(f"  [Currys HTTP] 请求被拦截或异常 (状态码: {resp.status_code})")
-            try:
-                with open("debug_currys_http_response.html", "w", encoding="utf-8") as f:
-                    f.write(resp.text[:5000])
-            except: pass
-    except Exception as e:
-        print(f"  [Currys HTTP] 请求异常: {e}")
     return products
 
-def _http_search_darty(keyword):
-    """使用 curl_cffi 伪装真实浏览器进行 HTTP 请求，绕过 Datadome 检测"""
+async def _http_search(platform, search_url, parse_html):
+    """从会话池借一个已预热的会话发起搜索请求，解析在事件循环之外进行 (大页面走进程池)"""
+    label = HTTP_PLATFORMS[platform]["label"]
     products = []
-    search_url = f"https://www.darty.com/nav/recherche?text={urllib.parse.quote(keyword)}"
-    
-    # 随机选择一个指纹，并禁用自动 User-Agent 强行写入错误信息，让内部 TLS 逻辑和 Header 自洽
-    impersonate_list = ["chrome100", "chrome104", "chrome110", "chrome116", "safari15_3", "safari15_5", "edge101"]
-    impersonate_choice = random.choice(impersonate_list)
-    print(f"  [Darty] 请求指纹: {impersonate_choice}")
-    
     try:
-        session = cffi_requests.Session(impersonate=impersonate_choice)
-        # 预热主站获得 session 各种 Cookies
-        session.get("https://www.darty.com/", timeout=20)
-        time.sleep(random.uniform(2, 5))
-        
-        # 搜索请求
-        resp = session.get(search_url, timeout=20)
-        print(f"  [Darty HTTP] 状态码: {resp.status_code}, 响应长度: {len(resp.text)}")
+        session = await HTTP_POOL.acquire(platform)
+    except Exception as e:
+        print(f"  [{label} HTTP] 会话预热异常: {e}")
+        return products
+    healthy = False
+    try:
+        resp = await session.get(search_url, timeout=20)
+        print(f"  [{label} HTTP] 状态码: {resp.status_code}, 响应长度: {len(resp.text)}")
         
         if resp.status_code == 200 and len(resp.text) > 5000:
-            soup = BeautifulSoup(resp.text, "html.parser")
-            for sel in ["a.product_detail_link", "a[data-automation-id='product_details_link']", ".product-card__link", "div.product_list a"]:
-                for a_tag in soup.select(sel):
-                    href = a_tag.get("href", "")
-                    title = a_tag.get("title", "") or a_tag.get_text(strip=True)
-                    if href and title and len(title) > 5:
-                        url = "https://www.darty.com" + href if not href.startswith("http") else href
-                        products.append({"title": title, "url": url})
-            
-            if not products:
-                for a_tag in soup.find_all("a", href=True):
-                    href = a_tag["href"]
-                    if "/nav/codic/" in href or "/f-" in href:
-                        title = a_tag.get("title", "") or a_tag.get_text(strip=True)
-                        if title and len(title) > 5:
-                            url = "https://www.darty.com" + href if not href.startswith("http") else href
-                            products.append({"title": title, "url": url})
+            healthy = True
+            if SAVE_SEARCH_HTML:
+                try:
+                    os.makedirs("debug_screenshots", exist_ok=True)
+                    with open(os.path.join("debug_screenshots", f"{platform}_search_{int(datetime.now().timestamp())}.html"), "w", encoding="utf-8") as f:
+                        f.write(resp.text)
+                except: pass
+            products = await parse_async(parse_html, resp.text)
         else:
-            print(f"  [Darty HTTP] 请求被拦截或异常 (状态码: {resp.status_code})")
+            print(f"  [{label} HTTP] 请求被拦截或异常 (状态码: {resp.status_code})")
             try:
-                with open("debug_darty_http_response.html", "w", encoding="utf-8") as f:
+                with open(f"debug_{platform}_http_response.html", "w", encoding="utf-8") as f:
                     f.write(resp.text[:5000])
             except: pass
     except Exception as e:
-        print(f"  [Darty HTTP] 请求异常: {e}")
+        print(f"  [{label} HTTP] 请求异常: {e}")
+    finally:
+        await HTTP_POOL.release(platform, session, healthy=healthy)
     return products
 
 async def http_search_currys(keyword):
-    """异步包装器：在线程池中运行同步的 curl_cffi 请求"""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _http_search_currys, keyword)
+    """使用 curl_cffi 伪装真实浏览器进行 HTTP 请求，绕过 Cloudflare 检测"""
+    search_url = f"https://www.currys.co.uk/search/{urllib.parse.quote(keyword)}"
+    return await _http_search("currys", search_url, _parse_currys_html)
 
 async def http_search_darty(keyword):
-    """异步包装器：在线程池中运行同步的 curl_cffi 请求"""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _http_search_darty, keyword)
+    """使用 curl_cffi 伪装真实浏览器进行 HTTP 请求，绕过 Datadome 检测"""
+    search_url = f"https://www.darty.com/nav/recherche?text={urllib.parse.quote(keyword)}"
+    return await _http_search("darty", search_url, _parse_darty_html)
 
 async def homepage_warmup(page, platform_url):
     """全局首页预热机制：先访问首页，接受 Cookie，滑动一下，再跳转搜索页"""
     try:
         print(f"  [全局预热] 正在访问官网首页: {platform_url} ...")
         await page.goto(platform_url, wait_until='domcontentloaded', timeout=30000)
-        await asyncio.sleep(random.uniform(2.0, 4.0))
+        # 等待常见 Cookie 弹窗挂载 (最多 4s)，代替固定等待
+        await wait_for_any_selector(page, ["#onetrust-accept-btn-handler", "#didomi-notice-agree-button"], timeout=4000)
         
         # 常见 Cookie 同意逻辑 (增加 Didomi 授权捕捉，延长一点识别时间)
         for cookie_btn in [
@@ -329,7 +374,8 @@ async def homepage_warmup(page, platform_url):
             try:
                 if await page.is_visible(cookie_btn, timeout=1500):
                     await page.click(cookie_btn)
-                    await asyncio.sleep(1.5)
+                    try: await page.wait_for_selector(cookie_btn, state="hidden", timeout=3000)
+                    except: pass
                     break 
             except: pass
             
@@ -354,13 +400,290 @@ async def homepage_warmup(page, platform_url):
                     setTimeout(() => window.scrollBy(0, -100), 1200);
                 }
             """)
-            await asyncio.sleep(random.uniform(1.5, 3.0))
+            # 等滚动脚本执行完 (最后一次滚动在 1.2s)
+            await asyncio.sleep(1.3)
         except: pass
         
         print("  [全局预热] 官网首页热身完成。")
     except Exception as e:
         print(f"  [全局预热] 官网首页加载抛错 (容错忽略): {e}")
 
+# ================= Boulanger 内嵌数据快速通道 =================
+# 页面内嵌的状态脚本 (SSR 注水数据 / JSON-LD)
+EMBEDDED_JSON_SCRIPT_RE = re.compile(
+    r'<script[^>]*(?:type="application/(?:ld\+)?json"|id="__(?:NEXT_DATA|NUXT_DATA|BLG_STATE)__")[^>]*>(.*?)</script>',
+    re.DOTALL | re.IGNORECASE,
+)
+EMBEDDED_STATE_VAR_RE = re.compile(r'window\.(?:__INITIAL_STATE__|__NUXT__|__PRELOADED_STATE__|__BLG_STATE__)\s*=\s*')
+
+PRODUCT_URL_KEYS = ("url", "link", "href", "productUrl", "productURL", "canonicalUrl", "path", "@id")
+PRODUCT_TITLE_KEYS = ("label", "name", "title", "designation", "productName", "libelle")
+TOTAL_COUNT_KEYS = ("nbResults", "totalResults", "nbHits", "totalCount", "resultsCount", "nbProducts", "totalItems", "numberOfItems")
+
+def extract_embedded_json(html):
+    """从 HTML 中提取所有可解析的内嵌 JSON 对象 (script JSON 块 + window.__XXX__ = {...} 赋值)"""
+    objects = []
+    for match in EMBEDDED_JSON_SCRIPT_RE.finditer(html):
+        try:
+            objects.append(json.loads(match.group(1).strip()))
+        except ValueError:
+            pass
+    decoder = json.JSONDecoder()
+    for match in EMBEDDED_STATE_VAR_RE.finditer(html):
+        try:
+            obj, _ = decoder.raw_decode(html, match.end())
+            objects.append(obj)
+        except ValueError:
+            pass
+    return objects
+
+def _as_boulanger_product(node):
+    """商品节点 (带 /ref/ 链接 + 标题) 返回 (绝对链接, 标题)，否则返回 None"""
+    href = next((node[k] for k in PRODUCT_URL_KEYS if isinstance(node.get(k), str) and "/ref/" in node[k]), None)
+    title = next((node[k] for k in PRODUCT_TITLE_KEYS if isinstance(node.get(k), str) and node[k].strip()), None)
+    if not href or not title:
+        return None
+    # 与滚动抓取相同的过滤：排除评价页与带参数的跟踪链接
+    if "avis" in href.lower() or "?" in href:
+        return None
+    url = "https://www.boulanger.com" + href if not href.startswith("http") else href
+    return url, " ".join(title.split())
+
+def _product_lists(obj):
+    """
+    找出 JSON 中所有包含商品节点的列表，返回 [{"path", "owner", "items": {url: title}}]
+    path 为从根到该列表的 key 路径 (不含列表下标)，owner 为直接持有该列表的 dict
+    商品节点归属于最近的外层列表；列表套列表时归属外层列表
+    """
+    lists = {}
+    stack = [(obj, (), None, None)]  # (节点, key 路径, 父节点, (所属列表, 列表路径, 列表 owner))
+    while stack:
+        node, path, parent, enclosing = stack.pop()
+        if isinstance(node, dict):
+            product = _as_boulanger_product(node)
+            if product and enclosing is not None:
+                entry = lists.setdefault(id(enclosing[0]), {"path": enclosing[1], "owner": enclosing[2], "items": {}})
+                entry["items"].setdefault(*product)
+            stack.extend((v, path + (k,), node, enclosing) for k, v in reversed(list(node.items())))
+        elif isinstance(node, list):
+            if isinstance(parent, dict) or enclosing is None:
+                enclosing = (node, path, parent)
+            stack.extend((v, path, node, enclosing) for v in reversed(node))
+    return list(lists.values())
+
+def _list_total(product_list):
+    """在列表的 owner 及其直接子对象 (如 pagination) 中寻找搜索结果总数字段，取最大值；找不到返回 None"""
+    owner = product_list["owner"]
+    if not isinstance(owner, dict):
+        return None
+    counts = [
+        node[k] for node in [owner] + [v for v in owner.values() if isinstance(v, dict)] for k in TOTAL_COUNT_KEYS
+        if isinstance(node.get(k), int) and not isinstance(node.get(k), bool) and node[k] > 0
+    ]
+    return max(counts) if counts else None
+
+def select_boulanger_results(objects, path=None, allow_uncounted=False):
+    """
+    从内嵌状态 / XHR JSON 中选出搜索结果列表，推荐位、最近浏览、JSON-LD 等其它商品列表不参与
+    选择顺序: 与 path 相同路径的列表 (后续页沿用第 1 页的位置) > 旁边带结果总数字段的列表 >
+    (allow_uncounted 时，用于列表 XHR) 商品最多的列表
+    返回 (结果列表 {url: title}, 大盘总数, 列表路径)；找不到返回 (None, None, None)
+    """
+    lists = [entry for obj in objects for entry in _product_lists(obj)]
+    if path is not None:
+        same_path = [entry for entry in lists if entry["path"] == path]
+        if same_path:
+            entry = max(same_path, key=lambda e: len(e["items"]))
+            return entry["items"], _list_total(entry), entry["path"]
+    counted = [(entry, _list_total(entry)) for entry in lists]
+    counted = [(entry, total) for entry, total in counted if total]
+    if counted:
+        entry, total = max(counted, key=lambda x: len(x[0]["items"]))
+        return entry["items"], total, entry["path"]
+    if allow_uncounted and lists:
+        entry = max(lists, key=lambda e: len(e["items"]))
+        return entry["items"], None, entry["path"]
+    return None, None, None
+
+def with_query_param(url, key, value):
+    """在 URL 的 Query 中加入 / 修改一个参数"""
+    parsed_url = urllib.parse.urlparse(url)
+    query_dict = urllib.parse.parse_qs(parsed_url.query)
+    query_dict[key] = [str(value)]
+    new_query = urllib.parse.urlencode(query_dict, doseq=True)
+    return urllib.parse.urlunparse((
+        parsed_url.scheme,
+        parsed_url.netloc,
+        parsed_url.path,
+        parsed_url.params,
+        new_query,
+        parsed_url.fragment
+    ))
+
+async def _fetch_boulanger_page(page, url, sem):
+    """用同一 Context 的 APIRequest (共享 Cookie) 直取某一页 HTML 并解析内嵌数据；失败返回 None"""
+    async with sem:
+        try:
+            resp = await page.request.get(url, headers={"Accept": "text/html,application/xhtml+xml"}, timeout=30000)
+            if resp.status != 200:
+                print(f"  [Boulanger快速通道] {url} 状态码 {resp.status}")
+                return None
+            return extract_embedded_json(await resp.text())
+        except Exception as e:
+            print(f"  [Boulanger快速通道] {url} 请求异常: {e}")
+            return None
+
+async def boulanger_fast_path(page, keyword, xhr_responses):
+    """
+    读取当前 (第 1 页) 页面的内嵌状态 (或已拦截的列表 XHR JSON) 中的搜索结果列表，一次拿到本页全部商品与大盘总数；
+    再按总数与结果列表长度 (总数未知时按批试探) 并发直取 numPage=2..N 的页面
+    返回 (已通过标题校验的商品列表, 大盘总数)；第 1 页拿不到结果列表、后续页异常或按总数不该为空的页为空时返回 None，交给滚动抓取兜底
+    """
+    objects = extract_embedded_json(await page.content())
+    first_items, total, result_path = select_boulanger_results(objects)
+    if not first_items:
+        # 内嵌状态里找不到带总数的结果列表时，用拦截到的列表 XHR (其中最大的商品列表即搜索结果)
+        xhr_objects = []
+        for resp in xhr_responses:
+            try:
+                xhr_objects.append(await resp.json())
+            except Exception:
+                pass
+        first_items, total, result_path = select_boulanger_results(xhr_objects, allow_uncounted=True)
+    if not first_items:
+        print("  [Boulanger快速通道] 第 1 页未找到搜索结果列表，退回滚动抓取。")
+        return None
+
+    page_size = len(first_items)
+    all_products = dict(first_items)
+    print(f"  [Boulanger快速通道] 第 1 页结果列表: {page_size} 个原始商品，大盘总数: {total if total else '未知'}")
+
+    if page_size >= BOULANGER_FULL_PAGE:
+        if total:
+            last_page = min(BOULANGER_MAX_PAGES, -(-total // page_size))
+        else:
+            last_page = BOULANGER_MAX_PAGES
+        sem = asyncio.Semaphore(BOULANGER_PAGE_CONCURRENCY)
+        base_url = page.url
+        next_page = 2
+        # 总数已知时一次性并发拉完；未知时按并发数分批试探，遇到不满页 / 空页即停止
+        batch_size = last_page if total else BOULANGER_PAGE_CONCURRENCY
+        while next_page <= last_page:
+            page_nums = list(range(next_page, min(last_page, next_page + batch_size - 1) + 1))
+            results = await asyncio.gather(*[
+                _fetch_boulanger_page(page, with_query_param(base_url, "numPage", n), sem) for n in page_nums
+            ])
+            reached_end = False
+            for n, page_objects in zip(page_nums, results):
+                if page_objects is None:
+                    print(f"  [Boulanger快速通道] 第 {n} 页直取失败，退回滚动抓取。")
+                    return None
+                page_items, _, _ = select_boulanger_results(page_objects, path=result_path)
+                if not page_items:
+                    if total:
+                        # 按总数本应有商品却是空页 (软拦截页 / 页面结构变化)，交给滚动抓取
+                        print(f"  [Boulanger快速通道] 第 {n} 页没有商品数据，退回滚动抓取。")
+                        return None
+                    # 总数未知时前一页恰好满页，下一页为空即已到底
+                    print(f"  [Boulanger快速通道] 第 {n} 页为空，结果已到底。")
+                    reached_end = True
+                    break
+                for url, title in page_items.items():
+                    all_products.setdefault(url, title)
+                print(f"  [Boulanger快速通道] 第 {n} 页: {len(page_items)} 个原始商品，目前累计 {len(all_products)}")
+                if len(page_items) < page_size:
+                    reached_end = True
+                    break
+            if reached_end:
+                break
+            next_page = page_nums[-1] + 1
+
+    products = []
+    for url, title in all_products.items():
+        if len(title) >= 3 and await validate_title_match(title, keyword):
+            products.append({"title": title, "url": url})
+    print(f"  [Boulanger快速通道] 共 {len(all_products)} 个原始商品，过滤后 {len(products)} 个符合条件。")
+    return products, total
+
+# ================= Amazon 多页搜索 =================
+async def amazon_cards_to_products(cards, keyword):
+    """从 Amazon 列表卡片中筛出商品，返回 (通过标题校验的商品列表, 本页出现的全部 ASIN)"""
+    products = []
+    asins = set()
+    for card in cards:
+        href = card["href"]
+        if href and "slredirect" not in href and "#" not in href and "/dp/" in href:
+            match = ASIN_RE.search(href)
+            if match:
+                asins.add(match.group(1))
+            title_text = card["title"]
+            if title_text and card["url"] and await validate_title_match(title_text, keyword):
+                products.append({"title": title_text.strip(), "url": card["url"]})
+    return products, asins
+
+async def read_amazon_total(page):
+    """读取结果栏中的 "1-48 of over 2,000 results" 总数；读不到返回 None"""
+    try:
+        text = await page.locator("[data-component-type='s-result-info-bar'] h1, .s-breadcrumb").first.inner_text(timeout=2000)
+        match = re.search(r'of\s+(?:over\s+)?([\d,.]+)\s+results', text, re.IGNORECASE)
+        if match:
+            return int(re.sub(r'[,.]', '', match.group(1)))
+    except Exception:
+        pass
+    return None
+
+async def _fetch_amazon_page(context, url, sem):
+    """
+    在同一 Context (共享 Cookie / 拦截规则) 的新标签页中打开某一页并批量提取卡片
+    返回 (卡片列表, 是否命中验证码)；加载失败时卡片列表为 None
+    """
+    async with sem:
+        tab = await context.new_page()
+        try:
+            await tab.goto(url, wait_until='domcontentloaded', timeout=30000)
+            await wait_for_any_selector(tab, ["div.s-main-slot a[href*='/dp/']", AMAZON_CAPTCHA_SELECTOR], timeout=8000)
+            if "Robot Check" in await tab.title() or await tab.locator(AMAZON_CAPTCHA_SELECTOR).count():
+                return None, True
+            return await extract_listing(tab, "amazon"), False
+        except Exception as e:
+            print(f"  [Amazon] 翻页 {url} 异常: {e}")
+            return None, False
+        finally:
+            await tab.close()
+
+async def amazon_more_pages(page, platform_key, keyword, seen_asins):
+    """
+    并发抓取第 2..AMAZON_MAX_PAGES 页 (同平台共享 AMAZON_PAGE_CONCURRENCY 个标签页额度)，
+    按页码顺序合并，遇到没有新 ASIN 的页、验证码页 (或加载失败) 即停止
+    """
+    products = []
+    base_url = page.url if "k=" in page.url else f"https://www.amazon.co.uk/s?k={urllib.parse.quote(keyword)}"
+    sem = get_page_semaphore(platform_key, AMAZON_PAGE_CONCURRENCY)
+    next_page = 2
+    while next_page <= AMAZON_MAX_PAGES:
+        page_nums = list(range(next_page, min(AMAZON_MAX_PAGES, next_page + AMAZON_PAGE_CONCURRENCY - 1) + 1))
+        results = await asyncio.gather(*[
+            _fetch_amazon_page(page.context, with_query_param(base_url, "page", n), sem) for n in page_nums
+        ])
+        for n, (cards, blocked) in zip(page_nums, results):
+            if blocked:
+                print(f"  [Amazon] 第 {n} 页命中验证码拦截，停止翻页。")
+                PACER.record(platform_key, blocked=True)
+                return products
+            if not cards:
+                print(f"  [Amazon] 第 {n} 页无结果，停止翻页。")
+                return products
+            page_products, asins = await amazon_cards_to_products(cards, keyword)
+            new_asins = asins - seen_asins
+            if not new_asins:
+                print(f"  [Amazon] 第 {n} 页没有新的 ASIN，停止翻页。")
+                return products
+            seen_asins |= new_asins
+            products.extend(page_products)
+            print(f"  [Amazon] 第 {n} 页: 新 ASIN {len(new_asins)} 个，符合条件商品 {len(page_products)} 个")
+        next_page = page_nums[-1] + 1
+    return products
+
 # ================= 核心爬虫模块 (Async) =================
 async def search_scraper_async(page, platform, keyword):
     """
@@ -386,12 +709,12 @@ async def search_scraper_async(page, platform, keyword):
                 if "amazon.co.uk" not in page.url and "amazon.com" not in page.url:
                     try: await page.goto("https://www.amazon.co.uk", wait_until='domcontentloaded', timeout=30000)
                     except Exception as e: print(f"  [继续提取] 预载导航超时: {e}")
-                    await asyncio.sleep(random.uniform(1, 3))
+                    await wait_for_any_selector(page, ["#twotabsearchtextbox", "#sp-cc-accept"])
                 
                 try:
                     if await page.is_visible("#sp-cc-accept", timeout=3000):
                         await page.click("#sp-cc-accept")
-                        await asyncio.sleep(1)
+                        await page.wait_for_selector("#sp-cc-accept", state="hidden", timeout=3000)
                 except: pass
 
                 search_input = page.locator("#twotabsearchtextbox").first
@@ -401,26 +724,25 @@ async def search_scraper_async(page, platform, keyword):
                     await asyncio.sleep(0.5)
                     await page.keyboard.type(keyword, delay=100)
                     await asyncio.sleep(0.5)
+                    old_url = page.url
                     await page.keyboard.press("Enter")
+                    await wait_for_url_change(page, old_url)
                 else:
                     url = f"https://www.amazon.co.uk/s?k={urllib.parse.quote(keyword)}"
                     try: await page.goto(url, wait_until='domcontentloaded', timeout=30000)
                     except Exception as e: print(f"  [继续提取] 预载导航超时: {e}")
 
-                await asyncio.sleep(4)
+                await wait_for_any_selector(page, ["div.s-main-slot a[href*='/dp/']"], timeout=8000)
 
-                links = await page.locator("div.s-main-slot a[href*='/dp/']").all()
-                for link in links:
-                    href = await link.get_attribute("href")
-                    if href and "slredirect" not in href and "#" not in href and "/dp/" in href:
-                        url = "https://www.amazon.co.uk" + href if not href.startswith("http") else href
-                        
-                        parent_h2 = await page.evaluate_handle("el => el.closest('div.s-result-item').querySelector('h2')", link)
-                        title_text = ""
-                        if parent_h2: 
-                            title_text = await (await parent_h2.get_property("innerText")).json_value()
-                        if title_text and url and await validate_title_match(title_text, keyword):
-                            products.append({"title": title_text.strip(), "url": url})
+                # 一次 evaluate 取回整页卡片 (链接 + 所属卡片的 h2 标题)
+                page_products, seen_asins = await amazon_cards_to_products(await extract_listing(page, "amazon"), keyword)
+                products.extend(page_products)
+                total_found_count = await read_amazon_total(page)
+                print(f"  [Amazon] 第 1 页: ASIN {len(seen_asins)} 个，符合条件商品 {len(page_products)} 个，大盘总数: {total_found_count if total_found_count else '未知'}")
+                
+                # 第 2..N 页在新标签页中并发打开，覆盖更多商品而不成倍增加耗时
+                if seen_asins and AMAZON_MAX_PAGES > 1:
+                    products.extend(await amazon_more_pages(page, platform_lower, keyword, seen_asins))
                 
                 if not products:
                     try: await page.screenshot(path=f"error_screenshot_empty_amazon_{keyword}.png", full_page=True)
@@ -450,7 +772,7 @@ async def search_scraper_async(page, platform, keyword):
                 try:
                     await homepage_warmup(page, "https://www.currys.co.uk")
                     await handle_bot_protection(page, keyword)
-                    await asyncio.sleep(random.uniform(1, 2))
+                    await wait_for_any_selector(page, ["#search", "input[name='q']", "input[name='search']", "input[type='search']"])
                     
                     search_input = None
                     for selector in ["#search", "input[name='q']", "input[data-test='search-input']", "input[name='search']", "input[type='search']"]:
@@ -470,24 +792,22 @@ async def search_scraper_async(page, platform, keyword):
                         await search_input.fill("", force=True)
                         await search_input.press_sequentially(keyword, delay=150)
                         await asyncio.sleep(0.5)
+                        old_url = page.url
                         await search_input.press("Enter")
+                        await wait_for_url_change(page, old_url, timeout=15000)
                         try: await page.wait_for_load_state("domcontentloaded", timeout=15000)
                         except: pass
-                        await asyncio.sleep(4)
+                        await wait_for_any_selector(page, ["a[href*='/products/']"])
                     else:
                         search_url = f"https://www.currys.co.uk/search/{urllib.parse.quote(keyword)}"
                         try: await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
                         except: pass
                         await handle_bot_protection(page, keyword)
-                        await asyncio.sleep(3)
+                        await wait_for_any_selector(page, ["a[href*='/products/']"])
                     
-                    links = await page.locator("a[href*='/products/']").all()
-                    for link_locator in links:
-                        href = await link_locator.get_attribute("href")
-                        title = await link_locator.inner_text()
-                        if href and await validate_title_match(title, keyword):
-                            url = "https://www.currys.co.uk" + href if not href.startswith("http") else href
-                            products.append({"title": title.strip(), "url": url})
+                    for card in await extract_listing(page, "currys"):
+                        if card["href"] and await validate_title_match(card["text"], keyword):
+                            products.append({"title": card["text"].strip(), "url": card["url"]})
                             
                     if not products:
                         try: await page.screenshot(path=f"error_screenshot_empty_currys_{keyword}.png", full_page=True)
@@ -502,7 +822,13 @@ async def search_scraper_async(page, platform, keyword):
             try:
                 # Boulanger 恢复使用人类模拟策略：进入首页，预热，在搜索框中键入
                 await homepage_warmup(page, "https://www.boulanger.com/")
-                await asyncio.sleep(2)
+                
+                # 搜索提交后拦截列表 XHR 的 JSON 响应，供快速通道直接解析
+                xhr_responses = []
+                def on_response(resp):
+                    if resp.request.resource_type in ("xhr", "fetch") and "json" in (resp.headers.get("content-type") or ""):
+                        xhr_responses.append(resp)
+                page.on("response", on_response)
                 
                 print(f"  [Boulanger] 尝试使用搜索框查词: {keyword}")
                 search_input = None
@@ -522,19 +848,21 @@ async def search_scraper_async(page, platform, keyword):
                         await search_input.fill("", force=True)
                         await search_input.press_sequentially(keyword, delay=150)
                         await asyncio.sleep(0.5)
+                        old_url = page.url
                         await search_input.press("Enter")
+                        await wait_for_url_change(page, old_url, timeout=15000)
                         try: await page.wait_for_load_state("domcontentloaded", timeout=15000)
                         except: pass
                         
-                        # 给页面留出通过路由重定向的时间 (Boulanger的智能搜索可能会重定向到 /c/televiseur/...)
-                        await asyncio.sleep(4)
+                        # 等待商品卡片渲染 (Boulanger的智能搜索可能会重定向到 /c/televiseur/...)
+                        await wait_for_any_selector(page, ["a[href*='/ref/']"], timeout=8000)
                 else:
                     # 兜底直接跳转
                     search_url = f"https://www.boulanger.com/resultats?tr={urllib.parse.quote(keyword)}"
                     print(f"  [Boulanger] 未找到输入框，使用 URL 跳转: {search_url}")
                     try: await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
                     except: pass
-                    await asyncio.sleep(4)
+                    await wait_for_any_selector(page, ["a[href*='/ref/']"], timeout=8000)
 
                 # 尝试提前挖掘页面的“大盘总数量”
                 try:
@@ -545,98 +873,88 @@ async def search_scraper_async(page, platform, keyword):
                         total_found_count = int(match.group(1))
                 except: pass
 
-                # 分页循环机制，最多允许发现翻页异常前进行更多页次 (如放宽到 10 页)
-                previous_count = 0
-                for page_num in range(1, 10):
-                    # === 平滑滚动懒加载机制 ===
+                # === 快速通道：内嵌状态 / XHR JSON 一次取全，后续页并发直取 ===
+                fast_result = None
+                if BOULANGER_FAST_PATH:
                     try:
-                        print(f"  [Boulanger] 第 {page_num} 页: 触发深层平滑滚动，挖掘隐藏商品...")
-                        previous_height = 0
-                        scroll_attempts = 0
-                        # 增加深层滚动次数，保证 40 个卡片能被完整划过到底部触发加载
-                        while scroll_attempts < 12:
-                            await page.evaluate("window.scrollBy(0, 1200)")
-                            await asyncio.sleep(random.uniform(1.0, 2.0))
-                            new_height = await page.evaluate("document.body.scrollHeight")
-                            if new_height == previous_height:
-                                break
-                            previous_height = new_height
-                            scroll_attempts += 1
-                    except Exception as sc_e:
-                        print(f"  [Boulanger] 滚动报错: {sc_e}")
+                        fast_result = await boulanger_fast_path(page, keyword, xhr_responses)
+                    except Exception as fast_e:
+                        print(f"  [Boulanger快速通道] 异常，退回滚动抓取: {fast_e}")
+                page.remove_listener("response", on_response)
+                if fast_result:
+                    products, fast_total = fast_result
+                    if total_found_count is None:
+                        total_found_count = fast_total
 
-                    # 提取列表元素 (拒绝 innerText 暴力兜底)
-                    links = await page.locator("a[href*='/ref/']:visible").all()
-                    
-                    raw_urls_this_page = set()
-                    
-                    for link_locator in links:
+                # === 兜底：平滑滚动 + 逐页翻页 ===
+                if not fast_result:
+                    # 分页循环机制，最多允许发现翻页异常前进行更多页次 (如放宽到 10 页)
+                    previous_count = 0
+                    for page_num in range(1, BOULANGER_MAX_PAGES + 1):
+                        # === 平滑滚动懒加载机制 ===
                         try:
-                            if not await link_locator.is_visible(): continue
-                            href = await link_locator.get_attribute("href")
+                            print(f"  [Boulanger] 第 {page_num} 页: 触发深层平滑滚动，挖掘隐藏商品...")
+                            previous_height = 0
+                            scroll_attempts = 0
+                            # 增加深层滚动次数，保证 40 个卡片能被完整划过到底部触发加载
+                            while scroll_attempts < 12:
+                                await page.evaluate("window.scrollBy(0, 1200)")
+                                # 页面被懒加载撑高即继续滚动，2s 内没有增长视为到底
+                                new_height = await wait_for_scroll_growth(page, previous_height, timeout=2000)
+                                if new_height == previous_height:
+                                    break
+                                previous_height = new_height
+                                scroll_attempts += 1
+                        except Exception as sc_e:
+                            print(f"  [Boulanger] 滚动报错: {sc_e}")
+
+                        # 提取列表元素 (拒绝 innerText 暴力兜底)，一次 evaluate 取回所有可见卡片
+                        raw_urls_this_page = set()
+                        
+                        for card in await extract_listing(page, "boulanger", visible_only=True):
+                            href = card["href"]
                             if href and "avis" not in href.lower() and "?" not in href:
-                                url = "https://www.boulanger.com" + href if not href.startswith("http") else href
+                                url = card["url"]
                                 raw_urls_this_page.add(url)
                                 
-                                desc = await link_locator.get_attribute("title")
-                                if not desc:
-                                    desc = await link_locator.evaluate("""el => {
-                                        let titleEl = el.querySelector('h2, h3, .product-designation, .product-label');
-                                        return titleEl ? titleEl.innerText : null;
-                                    }""")
-                                
+                                # 优先取链接 title 属性，其次取链接内的标题元素
+                                desc = card["title"]
                                 if not desc or len(desc.strip()) < 3:
                                     continue
                                     
                                 desc_clean = " ".join(desc.split()).strip()
                                 if desc_clean and url and await validate_title_match(desc_clean, keyword):
                                     products.append({"title": desc_clean, "url": url})
-                                    # 利用字典推导去重，防止深度滚动重复抓取同一卡片
-                                    products = list({p['url']: p for p in products}.values())
-                        except Exception as loop_e:
-                            print(f"    [忽略] Boulanger 单个卡片解析异常: {loop_e}")
-                            continue
-
-                    current_total = len(products)
-                    delta = current_total - previous_count
-                    raw_count = len(raw_urls_this_page)
+                        # 利用字典推导去重，防止深度滚动重复抓取同一卡片
+                        products = list({p['url']: p for p in products}.values())
+
+                        current_total = len(products)
+                        delta = current_total - previous_count
+                        raw_count = len(raw_urls_this_page)
                     
-                    print(f"  [Boulanger] 第 {page_num} 页发现 {raw_count} 个原始商品卡片，过滤后提取到 {delta} 个符合条件的商品。目前累计: {current_total}")
+                        print(f"  [Boulanger] 第 {page_num} 页发现 {raw_count} 个原始商品卡片，过滤后提取到 {delta} 个符合条件的商品。目前累计: {current_total}")
                     
-                    # 修复 Bug: 使用原始页面上真实存在的商品卡片数量来推算是否到底
-                    # 而并不是基于 validate_title_match 过滤后的商品数 (delta) 进行推算
-                    # 如果 delta < 40 就 break，因为有些相关配件会被过滤掉，会引发最后一页提前停止
-                    if raw_count < 25:
-                        print(f"  [Boulanger] 本页原始商品数量 ({raw_count}) 小于满页安全阈值，基本确认已到底，停止翻页。")
-                        break
+                        # 修复 Bug: 使用原始页面上真实存在的商品卡片数量来推算是否到底
+                        # 而并不是基于 validate_title_match 过滤后的商品数 (delta) 进行推算
+                        # 如果 delta < 40 就 break，因为有些相关配件会被过滤掉，会引发最后一页提前停止
+                        if raw_count < BOULANGER_FULL_PAGE:
+                            print(f"  [Boulanger] 本页原始商品数量 ({raw_count}) 小于满页安全阈值，基本确认已到底，停止翻页。")
+                            break
                         
-                    previous_count = current_total
+                        previous_count = current_total
                     
-                    # === 改用基于 URL 注入特征参数的极简翻页法 ===
-                    next_page = page_num + 1
-                    current_url = page.url
-                    # 解析当前 URL，提取 Query 然后加入 / 修改 numPage
-                    parsed_url = urllib.parse.urlparse(current_url)
-                    query_dict = urllib.parse.parse_qs(parsed_url.query)
-                    query_dict['numPage'] = [str(next_page)]
+                        # === 改用基于 URL 注入特征参数的极简翻页法 ===
+                        next_page = page_num + 1
+                        next_url = with_query_param(page.url, "numPage", next_page)
                     
-                    new_query = urllib.parse.urlencode(query_dict, doseq=True)
-                    next_url = urllib.parse.urlunparse((
-                        parsed_url.scheme, 
-                        parsed_url.netloc, 
-                        parsed_url.path, 
-                        parsed_url.params, 
-                        new_query, 
-                        parsed_url.fragment
-                    ))
-                    
-                    print(f"  [Boulanger] 自动拼接好下一页 URL，准备直达第 {next_page} 页: {next_url}")
-                    try:
-                        await page.goto(next_url, wait_until='domcontentloaded', timeout=30000)
-                        await asyncio.sleep(random.uniform(2.5, 4.0))
-                    except Exception as goto_e:
-                        print(f"  [Boulanger] 翻页跳转异常: {goto_e}")
-                        break
+                        print(f"  [Boulanger] 自动拼接好下一页 URL，准备直达第 {next_page} 页: {next_url}")
+                        try:
+                            await PACER.wait(platform_lower)
+                            await page.goto(next_url, wait_until='domcontentloaded', timeout=30000)
+                            await wait_for_any_selector(page, ["a[href*='/ref/']"], timeout=8000)
+                        except Exception as goto_e:
+                            print(f"  [Boulanger] 翻页跳转异常: {goto_e}")
+                            break
                             
                 if not products:
                     try: await page.screenshot(path=f"error_screenshot_empty_boulanger_{keyword}.png", full_page=True)
@@ -684,33 +1002,22 @@ async def search_scraper_async(page, platform, keyword):
                         await search_input.fill("", force=True)
                         await search_input.press_sequentially(keyword, delay=150)
                         await asyncio.sleep(0.5)
+                        old_url = page.url
                         await search_input.press("Enter")
+                        await wait_for_url_change(page, old_url, timeout=15000)
                         try: await page.wait_for_load_state("domcontentloaded", timeout=15000)
                         except: pass
-                        await asyncio.sleep(3)
+                        await wait_for_any_selector(page, [".product_detail_link", ".product-card__link", "div.product_list a"])
                     else:
                         search_url = f"https://www.darty.com/nav/recherche?text={urllib.parse.quote(keyword)}"
                         try: await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
                         except: pass
                         await handle_bot_protection(page, keyword)
-                        await asyncio.sleep(3)
+                        await wait_for_any_selector(page, [".product_detail_link", ".product-card__link", "div.product_list a"])
                     
-                    selectors = [
-                        ".product_detail_link", 
-                        "a[data-automation-id='product_details_link']",
-                        ".product-card__link",
-                        "div.product_list a" 
-                    ]
-                    for sel in selectors:
-                        locators = await page.locator(sel).all()
-                        for loc in locators:
-                            if await loc.is_visible():
-                                href = await loc.get_attribute("href")
-                                if href:
-                                    url = "https://www.darty.com" + href if not href.startswith("http") else href
-                                    title = await loc.inner_text()
-                                    if await validate_title_match(title, keyword):
-                                        products.append({"title": title.strip(), "url": url})
+                    for card in await extract_listing(page, "darty", visible_only=True):
+                        if card["href"] and await validate_title_match(card["text"], keyword):
+                            products.append({"title": card["text"].strip(), "url": card["url"]})
                                     
                     if not products:
                         try: await page.screenshot(path=f"error_screenshot_empty_darty_{keyword}.png", full_page=True)
@@ -726,21 +1033,18 @@ async def search_scraper_async(page, platform, keyword):
             try:
                 try: await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
                 except Exception as e: print(f"  [继续提取] 搜索导航超时: {e}")
-                await asyncio.sleep(2)
+                await wait_for_any_selector(page, ["article a"])
                 try:
                     if await page.is_visible("#onetrust-accept-btn-handler", timeout=3000):
                         await page.click("#onetrust-accept-btn-handler")
                 except: pass
                     
-                potential_links = await page.locator("article a").all()
-                for link in potential_links:
-                    href = await link.get_attribute("href")
-                    title = await link.inner_text()
-                    if href:
-                        url = "https://www.fnac.com" + href if not href.startswith("http") else href
+                for card in await extract_listing(page, "fnac"):
+                    if card["href"]:
+                        url = card["url"]
                         if ("/a" in url or "/mp" in url) and not "avis" in url:
-                            if await validate_title_match(title, keyword):
-                                products.append({"title": title.strip(), "url": url})
+                            if await validate_title_match(card["text"], keyword):
+                                products.append({"title": card["text"].strip(), "url": url})
                                 
                 if not products:
                     try: await page.screenshot(path=f"error_screenshot_empty_fnac_{keyword}.png", full_page=True)
@@ -807,6 +1111,42 @@ def append_new_products(new_items):
         print(f" 追加保存本地 CSV 记忆库时异常: {e}")
 
 # ================= 主控制流程 =================
+async def scrape_keyword_job(browser, job, platform_sem, global_sem, route_stats):
+    """单个关键词的抓取任务 (并发单元)，只返回结果，不触碰共享的去重状态"""
+    platform = job["platform"]
+    keyword = job["keyword"]
+    platform_key = str(platform).lower()
+    
+    # 先占平台额度再占全局额度，避免排队中的任务白白占着全局名额
+    async with platform_sem, global_sem:
+        # 同平台相邻任务按自适应间隔放行，不同平台之间无需等待
+        await PACER.wait(platform_key)
+        
+        # --- 为了防止前一个关键词被目标网站拦截后把 "连坐惩罚" 带入下一个关键词的搜索 ---
+        # 每次新词建立一个全新的无痕迹 Context
+        ua = random.choice(USER_AGENTS)
+        context = await browser.new_context(
+            user_agent=ua,
+            viewport={'width': random.choice([1920, 1366, 1440, 1536]), 'height': random.choice([1080, 768, 900])},
+            locale="fr-FR",  # Boulanger/Darty 等法国平台倾向于看到法语 local
+            timezone_id="Europe/Paris"
+        )
+        scraped_products, total_found = [], None
+        try:
+            await context.add_init_script(STEALTH_JS)
+            await install_resource_blocking(context, platform, route_stats)
+            page = await context.new_page()
+            
+            # 使用基于 playwright 异步机制的方法抓取
+            scraped_products, total_found = await search_scraper_async(page, platform, keyword)
+        except Exception as e:
+            print(f" [{platform}] 关键词 '{keyword}' 抓取异常: {e}")
+        finally:
+            await context.close()  # 打完收工，销毁伪造身份
+        # 零结果通常意味着被拦截，反馈给节奏控制器放慢该平台
+        PACER.record(platform_key, blocked=not scraped_products)
+        return scraped_products, total_found
+
 async def run_monitor_async():
     # 环境自检
     if not KEYWORDS_TABLE_ID or not NEW_ITEMS_TABLE_ID or not APP_TOKEN:
@@ -814,19 +1154,25 @@ async def run_monitor_async():
         return
         
     # 优先抓取 token (复用了旧组件)
-    token = get_tenant_access_token()
-    if not token:
+    if not get_tenant_access_token():
         print(" 错误: 无法获取飞书全局凭配(Token)，程序终止。")
         return
         
     # 1. 下载待监控项配置表
-    keywords_list = get_feishu_keywords(token)
+    keywords_list = get_feishu_keywords()
     if not keywords_list:
         print(" 没有获取到任何需要处于开启状态的监控关键词，程序即刻退出。")
         return
         
-    # 2. 预热本地的知识过滤库
-    known_urls = load_known_products()
+    # 2. 预热本地的知识过滤库 (SQLite 库按需逐条查询；关闭时退回整表加载 CSV)
+    known_conn = None
+    if known_store.KNOWN_STORE:
+        known_conn = known_store.connect()
+        known_urls = set()  # 本批次新发现的 URL
+        print(f">>> [本地校验] 已知商品库就绪，共 {known_store.count_known(known_conn)} 个历史商品 URL。")
+    else:
+        known_urls = load_known_products()
+    seen_date = datetime.now(BJ_TZ).strftime("%Y-%m-%d")
     
     feishu_report_records = []
     all_new_csv_items = []
@@ -851,39 +1197,36 @@ async def run_monitor_async():
             print(f"  [引擎提示] 尝试调用系统原生 Chrome 失败，退回 Playwright 默认内核下载版。{e}")
             browser = await p.chromium.launch(headless=True, args=browser_args)
             
-        # 不多开context了，复用同一个context模拟人类行为，但记得清理缓存
-        # 3. 逐个进行爬虫处理和比对 (独立 Context 避免交叉污染)
+        route_stats = new_blocking_stats()
+        # 3. 按平台分组并发抓取 (每个关键词独立 Context 避免交叉污染)
+        platform_sems = {}
         for job in keywords_list:
+            platform_key = str(job["platform"]).lower()
+            if platform_key not in platform_sems:
+                platform_sems[platform_key] = asyncio.Semaphore(KEYWORD_PLATFORM_CONCURRENCY)
+        global_sem = asyncio.Semaphore(KEYWORD_GLOBAL_CONCURRENCY)
+        print(f">>> [调度] {len(keywords_list)} 个关键词, {len(platform_sems)} 个平台并行 (全局并发 {KEYWORD_GLOBAL_CONCURRENCY})")
+        
+        results = await asyncio.gather(*[
+            scrape_keyword_job(browser, job, platform_sems[str(job["platform"]).lower()], global_sem, route_stats)
+            for job in keywords_list
+        ])
+        
+        # 4. 按飞书配置表中的关键词顺序合并结果，去重与上报顺序与串行执行完全一致
+        for job, (scraped_products, total_found) in zip(keywords_list, results):
             platform = job["platform"]
             keyword = job["keyword"]
-            
-            # --- 为了防止前一个关键词被目标网站拦截后把 "连坐惩罚" 带入下一个关键词的搜索 ---
-            # 每次新词建立一个全新的无痕迹 Context
-            ua = random.choice(USER_AGENTS)
-            context = await browser.new_context(
-                user_agent=ua,
-                viewport={'width': random.choice([1920, 1366, 1440, 1536]), 'height': random.choice([1080, 768, 900])},
-                locale="fr-FR",  # Boulanger/Darty 等法国平台倾向于看到法语 local
-                timezone_id="Europe/Paris"
-            )
-            await context.add_init_script(STEALTH_JS)
-            page = await context.new_page()
-            
-            # 使用基于 playwright 异步机制的方法抓取
-            scraped_products, total_found = await search_scraper_async(page, platform, keyword)
             # 优先使用网页上官方标示的大盘总数据，如果没提取到则用爬到的本页明细代替
             total_scraped = total_found if total_found is not None else len(scraped_products)
-            
-            await context.close()  # 打完收工，销毁伪造身份
         
-            # 挑选新商品 (修正缩进，使其并入每个关键词的循环)
+            # 挑选新商品
             new_items = []
             for p in scraped_products:
                 # 过滤乱码和换行符保证 CSV 干净整洁
                 clean_title = p["title"].replace('\n', ' ').replace('\r', ' ').strip()
                 p["title"] = clean_title
                 # 判断逻辑：只要链接不在记忆库就算“上新”
-                if p["url"] not in known_urls:
+                if p["url"] not in known_urls and not (known_conn and known_store.is_known(known_conn, p["url"])):
                     new_items.append(p)
                     known_urls.add(p["url"])  # 同批次加缓存排重
                     
@@ -894,6 +1237,13 @@ async def run_monitor_async():
                         "Product Title": p["title"],
                         "Product URL": p["url"]
                     })
+            
+            if known_conn and scraped_products:
+                # 先统计消失的商品再刷新本次出现记录
+                disappeared = known_store.get_disappeared(known_conn, platform, keyword, seen_date)
+                known_store.record_sightings(known_conn, platform, keyword, scraped_products, seen_date)
+                if disappeared:
+                    print(f"  [已知商品库] [{platform}] '{keyword}': {len(disappeared)} 个历史商品本次未出现在搜索结果中。")
                     
             # 拼装给飞表的上报行
             new_count = len(new_items)
@@ -916,17 +1266,21 @@ async def run_monitor_async():
             }
             feishu_report_records.append(record_fields)
             
-            # 为了防护策略，每次任务结束后做一段随机休眠
-            await asyncio.sleep(random.uniform(2, 4))
-            
-    # 彻底关闭游览器
+    # 彻底关闭游览器与 HTTP 会话池
     await browser.close()
+    await HTTP_POOL.close()
+    shutdown_process_pool()
+    print_blocking_stats(route_stats)
+    PACER.print_summary()
         
-    # 4. 把更新记忆回写硬盘
+    # 5. 把更新记忆回写硬盘 (SQLite 库已在合并时逐关键词写入)
+    # 两种模式都追加 CSV: 保证随时切回 KNOWN_STORE=false 或删掉 known_products.db 重建时，记忆库仍是完整的
+    if known_conn:
+        known_conn.close()
     append_new_products(all_new_csv_items)
     
-    # 5. 上传最终报表
-    push_new_items_to_feishu(token, feishu_report_records)
+    # 6. 上传最终报表
+    push_new_items_to_feishu(feishu_report_records)
     print(">>> [整体流程] 执行完毕，全部监控项已处理。")
 
 if __name__ == "__main__":
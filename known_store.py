@@ -0,0 +1,113 @@
+import csv
+import os
+import sqlite3
+import sys
+
+# ================= 配置区域 =================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(BASE_DIR, "known_products.db")
+# 记忆库 CSV，首次打开数据库时一次性导入；keywords_monitor 在两种模式下都会继续追加新商品
+KNOWN_PRODUCTS_CSV = os.path.join(BASE_DIR, "known_products.csv")
+# 关闭后 keywords_monitor 退回整表读取 known_products.csv
+KNOWN_STORE = os.environ.get("KNOWN_STORE", "true").lower() in ("true", "1", "yes")
+
+# ================= SQLite 已知商品库 =================
+# sightings 表每个 (URL, 关键词) 一行，记录首次 / 最近一次在该关键词搜索结果中出现的日期；
+# 判断 "是否上新" 只需按 URL 主键前缀查一次索引，不再把整个记忆库读进内存
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sightings (
+    url TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    platform TEXT,
+    title TEXT,
+    first_seen TEXT,
+    last_seen TEXT,
+    PRIMARY KEY (url, keyword)
+);
+CREATE INDEX IF NOT EXISTS idx_sightings_platform_url ON sightings (platform, url);
+CREATE INDEX IF NOT EXISTS idx_sightings_keyword ON sightings (platform, keyword, last_seen);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def connect(db_file=DB_FILE, csv_file=KNOWN_PRODUCTS_CSV):
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    import_csv_once(conn, csv_file)
+    return conn
+
+def import_csv_once(conn, csv_file=KNOWN_PRODUCTS_CSV):
+    """把 known_products.csv 导入数据库 (每个数据库只执行一次)，返回导入行数"""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'csv_imported'").fetchone():
+        return 0
+    rows = []
+    if os.path.exists(csv_file):
+        try:
+            with open(csv_file, mode="r", encoding="utf-8-sig") as f:
+                for row in csv.DictReader(f):
+                    url = (row.get("Product URL") or "").strip()
+                    if url:
+                        rows.append((url, (row.get("Keyword") or "").strip(), (row.get("Platform") or "").strip(), row.get("Product Title")))
+        except Exception as e:
+            print(f"[已知商品库] 读取 {csv_file} 异常: {e}")
+            return 0
+    with conn:
+        # 旧 CSV 没有日期信息，首次 / 最近出现日期留空
+        conn.executemany("INSERT OR IGNORE INTO sightings (url, keyword, platform, title) VALUES (?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_imported', ?)", (str(len(rows)),))
+    if rows:
+        print(f"[已知商品库] 已从 {os.path.basename(csv_file)} 导入 {len(rows)} 条历史记录。")
+    return len(rows)
+
+def is_known(conn, url):
+    """URL 是否在任意关键词下出现过"""
+    return conn.execute("SELECT 1 FROM sightings WHERE url = ? LIMIT 1", (url,)).fetchone() is not None
+
+def count_known(conn):
+    return conn.execute("SELECT COUNT(DISTINCT url) FROM sightings").fetchone()[0]
+
+def record_sightings(conn, platform, keyword, products, seen_date):
+    """记录一次关键词搜索的结果: 新 (URL, 关键词) 写入首次出现日期，已有的刷新最近出现日期与标题"""
+    rows = [(p["url"], keyword, platform, p.get("title"), seen_date, seen_date) for p in products]
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO sightings (url, keyword, platform, title, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (url, keyword) DO UPDATE SET
+                title = excluded.title,
+                platform = excluded.platform,
+                first_seen = COALESCE(sightings.first_seen, excluded.first_seen),
+                last_seen = excluded.last_seen
+            """,
+            rows,
+        )
+
+def get_disappeared(conn, platform, keyword, seen_date):
+    """该关键词以前出现过、但本次 (seen_date) 搜索结果里没有的商品，按最近出现日期倒序"""
+    return [
+        dict(r) for r in conn.execute(
+            """
+            SELECT url, title, first_seen, last_seen FROM sightings
+            WHERE platform = ? AND keyword = ? AND (last_seen IS NULL OR last_seen < ?)
+            ORDER BY last_seen DESC
+            """,
+            (platform, keyword, seen_date),
+        )
+    ]
+
+if __name__ == "__main__":
+    # python known_store.py                       查看库内商品数
+    # python known_store.py <平台> <关键词> <日期>  列出该关键词在指定日期搜索结果中消失的商品
+    conn = connect()
+    try:
+        if len(sys.argv) == 4:
+            for item in get_disappeared(conn, sys.argv[1], sys.argv[2], sys.argv[3]):
+                print(f"{item['last_seen'] or '未知'}  {item['title']}  {item['url']}")
+        else:
+            print(f"[已知商品库] 共 {count_known(conn)} 个已知商品 URL")
+    finally:
+        conn.close()
@@ -0,0 +1,122 @@
+# ================= 搜索列表页批量提取 =================
+# 一次 page.evaluate 取回整页所有商品卡片 (链接 / 标题 / 价格 / 是否广告 / 是否可见)，
+# 代替逐个卡片调用 get_attribute / inner_text / evaluate_handle 的多次 IPC 往返
+# keywords_monitor 的 search_scraper_async 与 filler 的 get_first_result_* 共用这里的规则
+
+# 每个平台的规则:
+#   base        相对链接补全用的站点根地址
+#   selectors   链接选择器，按顺序依次匹配 (同一元素可能被多个选择器命中，与逐个 locator 遍历时一致)
+#   card        链接所属商品卡片的容器 (closest 查找)，价格 / 广告标识在卡片内查找
+#   title       标题来源: "card" 取卡片内 title_selector 的文本；"attr_or_inner" 先取链接 title 属性，再取链接内 title_selector 的文本；
+#               "text" 直接用链接文本
+LISTING_RULES = {
+    "amazon": {
+        "base": "https://www.amazon.co.uk",
+        "selectors": ["div.s-main-slot a[href*='/dp/']"],
+        "card": "div.s-result-item",
+        "title": "card",
+        "title_selector": "h2",
+        "price_selector": ".a-price .a-offscreen",
+        "sponsored_selector": ".puis-sponsored-label-text, .s-sponsored-label-text, [data-component-type='sp-sponsored-result']",
+    },
+    "boulanger": {
+        "base": "https://www.boulanger.com",
+        "selectors": ["a[href*='/ref/']"],
+        "card": "article, li, .product-list__item",
+        "title": "attr_or_inner",
+        "title_selector": "h2, h3, .product-designation, .product-label",
+        "price_selector": ".price__amount, .price, [class*='price']",
+    },
+    "currys": {
+        "base": "https://www.currys.co.uk",
+        "selectors": ["a[href*='/products/']"],
+        "card": "article, .product, [data-component='product-tile']",
+        "title": "text",
+        "price_selector": ".product-price, [class*='price']",
+    },
+    "darty": {
+        "base": "https://www.darty.com",
+        "selectors": [".product_detail_link", "a[data-automation-id='product_details_link']", ".product-card__link", "div.product_list a"],
+        "card": ".product_detail, .product-card, div.product_list",
+        "title": "text",
+        "price_selector": ".product_price, .price, [class*='price']",
+    },
+    "fnac": {
+        "base": "https://www.fnac.com",
+        "selectors": ["article a"],
+        "card": "article",
+        "title": "text",
+        "price_selector": ".userPrice, .f-faPriceBox__price, [class*='price']",
+        "sponsored_selector": ".sponsoredLabel, [class*='sponsor']",
+    },
+    "mediamarkt": {
+        "base": "https://www.mediamarkt.de",
+        "selectors": ["a[href*='/product/']", "a[data-test='mms-router-link']", "article a", "li a[href*='/de/product/']"],
+        "card": "article, [data-test='mms-product-card']",
+        "title": "text",
+        "price_selector": "[data-test='product-price'], [class*='price']",
+        "sponsored_selector": "[data-test='mms-sponsored-label'], [class*='sponsored']",
+    },
+    "coolblue": {
+        "base": "https://www.coolblue.de",
+        "selectors": ["a[href*='/product/']", "a[href*='/produkt/']", "li[data-test='product'] a", "article a"],
+        "card": "li[data-test='product'], article, .product-card",
+        "title": "text",
+        "price_selector": ".sales-price__current, [class*='price']",
+    },
+}
+
+EXTRACT_LISTING_JS = """
+(rule) => {
+    const text = (el) => (el ? (el.innerText || el.textContent || "") : "");
+    const isVisible = (el) => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== "hidden";
+    };
+    const cards = [];
+    for (const sel of rule.selectors) {
+        for (const el of document.querySelectorAll(sel)) {
+            const card = rule.card ? el.closest(rule.card) : null;
+            const scope = card || el;
+            let title = "";
+            if (rule.title === "card") {
+                title = text(scope.querySelector(rule.title_selector));
+            } else if (rule.title === "attr_or_inner") {
+                title = el.getAttribute("title") || text(el.querySelector(rule.title_selector));
+            } else {
+                title = text(el);
+            }
+            const href = el.getAttribute("href") || "";
+            cards.push({
+                selector: sel,
+                href: href,
+                text: text(el),
+                title: title,
+                price: rule.price_selector ? text(scope.querySelector(rule.price_selector)).trim() : "",
+                sponsored: href.includes("slredirect") || href.includes("/sspa/") ||
+                    (rule.sponsored_selector ? !!scope.querySelector(rule.sponsored_selector) : false),
+                visible: isVisible(el),
+            });
+        }
+    }
+    return cards;
+}
+"""
+
+def absolute_url(href, base):
+    return base + href if not href.startswith("http") else href
+
+async def extract_listing(page, platform, visible_only=False):
+    """
+    返回当前页所有商品卡片: [{selector, href, url, text, title, price, sponsored, visible}]
+    href 为原始属性值，url 为补全后的绝对链接；title 按平台规则取，text 为链接自身的 innerText
+    """
+    rule = LISTING_RULES[platform]
+    cards = await page.evaluate(EXTRACT_LISTING_JS, rule)
+    results = []
+    for card in cards:
+        if visible_only and not card["visible"]:
+            continue
+        card["url"] = absolute_url(card["href"], rule["base"]) if card["href"] else ""
+        results.append(card)
+    return results
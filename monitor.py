@@ -1,5 +1,6 @@
 import asyncio
 import csv
+import io
 import json
 import os
 import random
@@ -8,6 +9,18 @@ import time
 from datetime import datetime
 from urllib.parse import quote
 from playwright.async_api import async_playwright
+from resource_blocker import install_resource_blocking, new_blocking_stats, print_blocking_stats
+from pacing import PacingController, wait_for_any_selector, wait_for_title_change, wait_for_network_quiet
+from price_index import refresh_index, get_index_key, save_batch_marker
+from price_store import sync_from_csv
+
+# HTTP 优先抓取层 (curl_cffi 伪装 TLS 指纹 + 静态 HTML 解析)，缺依赖时自动退回纯浏览器模式
+try:
+    from curl_cffi import requests as cffi_requests
+    from bs4 import BeautifulSoup
+    HTTP_TIER_AVAILABLE = True
+except ImportError:
+    HTTP_TIER_AVAILABLE = False
 
 # ================= 配置区域 =================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,6 +29,39 @@ PRODUCTS_CSV = os.path.join(BASE_DIR, "products.csv")
 SCREENSHOTS_DIR = os.path.join(BASE_DIR, "debug_screenshots")
 os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
 
+# 运行断点: 每完成一个商品就记录一次，进程被杀后同一天重跑可跳过已抓取的商品
+# 文件不入库；CI 中由 daily_monitor.yml 通过 actions/cache 保存 / 恢复，已写入的 prices.csv 行在失败时也会提交
+CHECKPOINT_FILE = os.path.join(BASE_DIR, "run_checkpoint.json")
+RESUME_RUN = os.environ.get("MONITOR_RESUME", "true").lower() in ("true", "1", "yes")
+
+# ================= 并发调度配置 =================
+# 每个平台独立的并发额度: 不同平台之间并行，同一平台内保持礼貌
+PLATFORM_CONCURRENCY = {
+    "amazon": 1,
+    "currys": 2,
+    "mediamarkt": 2,
+    "coolblue": 2,
+    "boulanger": 3,
+    "fnac": 2,
+    "darty": 2,
+}
+DEFAULT_PLATFORM_CONCURRENCY = 2
+# 全局上限: 防止 GitHub Runner 同时开太多 Context 导致内存吃紧
+GLOBAL_CONCURRENCY = 8
+
+# 每个平台相邻两次导航的基础间隔区间 (秒)，实际间隔由 PACER 按拦截率自适应缩放
+PLATFORM_DELAYS = {
+    "amazon": (8.0, 15.0),
+}
+DEFAULT_PLATFORM_DELAY = (1.0, 3.0)
+PACER = PacingController(PLATFORM_DELAYS, DEFAULT_PLATFORM_DELAY)
+
+# ================= HTTP 优先抓取配置 =================
+# 商品页价格写在静态 Schema/Meta 里的平台：先用 curl_cffi 取 HTML，失败再开浏览器
+HTTP_FIRST = os.environ.get("MONITOR_HTTP_FIRST", "true").lower() in ("true", "1", "yes")
+HTTP_FIRST_PLATFORMS = {"boulanger", "fnac", "darty", "coolblue"}
+HTTP_IMPERSONATE_LIST = ["chrome110", "chrome116", "chrome120", "edge101", "safari15_5"]
+
 # ================= 随机 User-Agent 池 =================
 USER_AGENTS = [
     # Chrome - Windows
@@ -120,29 +166,31 @@ def clean_price(text):
     except: pass
     return None
 
+def is_bot_page(title, content):
+    """根据标题和正文判断是否为 Cloudflare / Datadome / Akamai 拦截页"""
+    title_lower = (title or "").lower()
+    content_lower = (content or "").lower()
+    return (
+        "bear with us" in title_lower or 
+        "checking your connection" in content_lower or 
+        "verify you are human" in content_lower or
+        "just a moment" in title_lower or
+        "ein moment" in title_lower or
+        "access denied" in title_lower or
+        "attention required" in title_lower or
+        "cloudflare" in title_lower
+    )
+
 async def handle_antibot_page(page, name=""):
     """检测并处理 Cloudflare / Datadome / Akamai 等拦截页"""
     try:
         for _ in range(4): # 增加等待次数
             content = await page.content()
             title = await page.title()
-            title_lower = title.lower()
-            content_lower = content.lower()
-            
-            is_bot_page = (
-                "bear with us" in title_lower or 
-                "checking your connection" in content_lower or 
-                "verify you are human" in content_lower or
-                "just a moment" in title_lower or
-                "ein moment" in title_lower or
-                "access denied" in title_lower or
-                "attention required" in title_lower or
-                "cloudflare" in title_lower
-            )
             
-            if is_bot_page:
-                print(f"  [{name}] ⚠ 检测到 Anti-Bot 拦截页 ({title})，尝试原地等待 5s...")
-                await asyncio.sleep(5)
+            if is_bot_page(title, content):
+                print(f"  [{name}] ⚠ 检测到 Anti-Bot 拦截页 ({title})，等待验证通过 (最多 5s)...")
+                await wait_for_title_change(page, title, timeout=5000)
             else:
                 return True # 不再包含验证特征，认为已通过
         
@@ -150,6 +198,14 @@ async def handle_antibot_page(page, name=""):
     except:
         return True
 
+def get_platform_key(platform):
+    """将 Platform 列归一化为调度键 (amazon / boulanger / ...)，未知平台原样小写返回"""
+    platform_lower = (platform or "").strip().lower()
+    for key in PLATFORM_CONCURRENCY:
+        if key in platform_lower:
+            return key
+    return platform_lower or "other"
+
 def load_products_from_csv():
     """读取商品列表"""
     products = []
@@ -186,9 +242,18 @@ def load_products_from_csv():
 
 def load_latest_historical_prices():
     """
-    读取 prices.csv 获取每个商品的最新有效价格
+    获取每个商品的最新有效价格 (优先读取 prices_index.json 增量索引)
     返回字典 Key: {Name}_{Country}_{Platform}, Value: Price (float)
     """
+    try:
+        index = refresh_index(CSV_FILE)
+        return {k: v["last_price"] for k, v in index["entries"].items() if v.get("last_price") is not None}
+    except Exception as e:
+        print(f"[提示] 读取价格索引失败，退回全量扫描 prices.csv: {e}")
+        return scan_latest_historical_prices()
+
+def scan_latest_historical_prices():
+    """全量扫描 prices.csv 获取每个商品的最新有效价格 (索引不可用时的兜底)"""
     historical_prices = {}
     if not os.path.exists(CSV_FILE):
         return historical_prices
@@ -215,33 +280,157 @@ def load_latest_historical_prices():
     
     return historical_prices
 
-def log_price_update(date_str, time_str, brand, name, country, platform, price, currency, page_title, price_trend="-", status="Success"):
-    """写入 CSV"""
-    file_exists = os.path.isfile(CSV_FILE)
-    header = ["Date", "Time", "Brand", "Product Name", "Country", "Platform", "Price", "Currency", "Page Title", "Status", "Price_Trend"]
-    
+PRICE_HEADER = ["Date", "Time", "Brand", "Product Name", "Country", "Platform", "Price", "Currency", "Page Title", "Status", "Price_Trend"]
+
+def build_price_row(date_str, time_str, brand, name, country, platform, price, currency, page_title, price_trend="-", status="Success"):
+    """组装 prices.csv 的一行"""
+    return {
+        "Date": date_str,
+        "Time": time_str,
+        "Brand": brand,
+        "Product Name": name,
+        "Country": country,
+        "Platform": platform,
+        "Price": price,
+        "Currency": currency,
+        "Page Title": page_title,
+        "Status": status,
+        "Price_Trend": price_trend
+    }
+
+class PriceCsvWriter:
+    """
+    prices.csv 批量写入器:
+      - 一批结果先序列化到内存，一次 open / 一次 write / 一次 fsync
+      - 写入前先落一份 journal (prices.csv.pending)，记录追加前的文件长度与待写内容；
+        若追加过程中进程被杀，下次启动时按 journal 截断回原长度并重放，保证不留半行
+      - append_rows 可多次调用，既能整批写入，也能在结果陆续完成时流式追加
+    """
+
+    def __init__(self, csv_file=CSV_FILE):
+        self.csv_file = csv_file
+        self.journal_file = csv_file + ".pending"
+        self.recover()
+
+    def _serialize(self, rows, with_header):
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=PRICE_HEADER)
+        if with_header:
+            buf.write("\ufeff")
+            writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+        return buf.getvalue().encode("utf-8")
+
+    def _apply(self, offset, data):
+        """把文件截断到 offset 后写入 data，并 fsync"""
+        mode = 'r+b' if os.path.exists(self.csv_file) else 'wb'
+        with open(self.csv_file, mode) as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def recover(self):
+        """若上次写入中途崩溃，根据 journal 重放，使 prices.csv 回到完整状态"""
+        if not os.path.exists(self.journal_file):
+            return
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+            self._apply(journal["offset"], journal["data"].encode("utf-8"))
+            print(f"[写入器] 检测到未完成的写入，已按 journal 重放 {journal.get('rows', '?')} 行。")
+        except Exception as e:
+            print(f"[写入器] journal 损坏，放弃重放: {e}")
+        os.remove(self.journal_file)
+
+    def append_rows(self, rows):
+        """原子追加多行；返回是否成功"""
+        if not rows:
+            return True
+        try:
+            offset = os.path.getsize(self.csv_file) if os.path.isfile(self.csv_file) else 0
+            data = self._serialize(rows, with_header=(offset == 0))
+
+            # 1. 先落 journal (临时文件 + os.replace，保证 journal 本身完整)
+            tmp_file = self.journal_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"offset": offset, "rows": len(rows), "data": data.decode("utf-8")}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.journal_file)
+
+            # 2. 一次性追加并 fsync
+            self._apply(offset, data)
+
+            # 3. 写入完成，删除 journal
+            os.remove(self.journal_file)
+            return True
+        except Exception as e:
+            print(f"  [错误] 写入 CSV 失败: {e}")
+            return False
+
+# ================= 运行断点 =================
+# run_checkpoint.json 结构:
+# {"run_date": "2026-01-01", "run_time": "06:15:00", "done": ["{Name}_{Country}_{Platform}", ...]}
+# 同一批次的所有行共用 run_date + run_time，sync_feishu.py 依赖它识别最新批次
+
+def load_run_checkpoint(today):
+    """读取今天未完成的运行断点，不存在 / 非今天 / 损坏时返回 None"""
+    if not RESUME_RUN or not os.path.exists(CHECKPOINT_FILE):
+        return None
     try:
-        with open(CSV_FILE, 'a', newline='', encoding='utf-8-sig') as f:
-            writer = csv.DictWriter(f, fieldnames=header)
-            if not file_exists:
-                writer.writeheader()
-            
-            writer.writerow({
-                "Date": date_str,
-                "Time": time_str,
-                "Brand": brand,
-                "Product Name": name,
-                "Country": country,
-                "Platform": platform,
-                "Price": price,
-                "Currency": currency,
-                "Page Title": page_title,
-                "Status": status,
-                "Price_Trend": price_trend
-            })
-            print(f"  [记录] {currency} {price} | Trend: {price_trend} | Status: {status}")
+        with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("run_date") != today:
+            return None
+        checkpoint["done"] = list(checkpoint.get("done", []))
+        return checkpoint
+    except Exception as e:
+        print(f"[断点] 读取 {CHECKPOINT_FILE} 失败，将重新开始: {e}")
+        return None
+
+def save_run_checkpoint(checkpoint):
+    """原子写入断点文件"""
+    tmp_file = CHECKPOINT_FILE + ".tmp"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, CHECKPOINT_FILE)
+    except Exception as e:
+        print(f"  [提示] 写入断点失败: {e}")
+
+def clear_run_checkpoint():
+    """整批完成后删除断点，下次运行开启新批次"""
+    try:
+        if os.path.exists(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
+    except Exception:
+        pass
+
+def refresh_price_sidecars():
+    """prices.csv 追加后增量刷新派生数据 (prices_index.json / prices.db)，失败时下次运行自动补齐"""
+    try:
+        refresh_index(CSV_FILE)
+    except Exception as e:
+        print(f"  [提示] 刷新价格索引失败 (下次运行会自动补齐): {e}")
+    try:
+        sync_from_csv(CSV_FILE)
     except Exception as e:
-        print(f"  [错误] 写入 CSV 失败: {e}")
+        print(f"  [提示] 同步 prices.db 失败 (下次运行会自动补齐): {e}")
+
+def log_price_update(date_str, time_str, brand, name, country, platform, price, currency, page_title, price_trend="-", status="Success"):
+    """写入单条记录到 CSV (批量场景请使用 PriceCsvWriter.append_rows)"""
+    row = build_price_row(date_str, time_str, brand, name, country, platform, price, currency, page_title, price_trend, status)
+    if not PriceCsvWriter(CSV_FILE).append_rows([row]):
+        return
+    print(f"  [记录] {currency} {price} | Trend: {price_trend} | Status: {status}")
+
+    # 同步刷新最新价格索引与 SQLite 价格库 (只解析刚追加的行)
+    refresh_price_sidecars()
 
 def clean_duplicate_links_in_csv():
     """运行前清洗: 检测 products.csv 中重复的链接，将后出现的重复项清空以触发 Filler 重搜"""
@@ -297,52 +486,284 @@ def clean_duplicate_links_in_csv():
     else:
         print("[清洗] 未发现重复链接，跳过。")
 
+def parse_price_from_json_ld(text):
+    """从单段 JSON-LD 文本中解析 (价格, 币种)，解析不到返回 None"""
+    if not text or '"price"' not in text:
+        return None
+    try:
+        data = json.loads(text)
+        items = data if isinstance(data, list) else [data]
+        for item in items:
+            # 兼容多种常见的 Schema 嵌套结构
+            if isinstance(item, dict):
+                offers = item.get('offers')
+                if not offers and '@graph' in item:
+                    for sub in item['@graph']:
+                        if 'offers' in sub:
+                            offers = sub['offers']
+                            break
+                
+                if offers:
+                    offer_list = offers if isinstance(offers, list) else [offers]
+                    for offer in offer_list:
+                        if isinstance(offer, dict):
+                            p = offer.get('price')
+                            if p:
+                                return float(str(p).replace(",", ".")), offer.get('priceCurrency', 'EUR')
+    except: pass
+    return None
+
+def parse_price_from_meta(amount, currency, fallback_currency=None):
+    """把 Meta 标签里的价格/币种转为 (价格, 币种)"""
+    if not amount:
+        return None
+    if not currency or amount == currency:
+        currency = fallback_currency
+    try:
+        return float(amount.replace(",", ".")), currency or "EUR"
+    except ValueError:
+        return None
+
+# 一次 evaluate 取回全部 Meta 价格字段与 JSON-LD 文本，解析放在 Python 侧
+SCHEMA_EXTRACT_JS = """() => {
+    const meta = (sel) => { const el = document.querySelector(sel); return el ? el.getAttribute('content') : null; };
+    return {
+        amount: meta("meta[property='product:price:amount']") || meta("meta[itemprop='price']"),
+        currency: meta("meta[property='product:price:currency']"),
+        itemprop_currency: meta("meta[itemprop='priceCurrency']"),
+        ld: Array.from(document.querySelectorAll("script[type='application/ld+json']")).map(s => s.textContent || '')
+    };
+}"""
+
 async def get_price_from_schema(page):
     """通用方法：从 JSON-LD 或 Meta 标签中提取价格"""
-    # 1. Meta Tags (Open Graph / Product Meta)
     try:
-        # Check standard opengraph and microdata
-        amount = await page.get_attribute("meta[property='product:price:amount']", "content", timeout=500)
-        if not amount:
-            amount = await page.get_attribute("meta[itemprop='price']", "content", timeout=500)
-        
-        if amount:
-            currency = await page.get_attribute("meta[property='product:price:currency']", "content") or "EUR"
-            if not currency or amount == currency:
-                currency = await page.get_attribute("meta[itemprop='priceCurrency']", "content") or "EUR"
-            return float(amount.replace(",", ".")), currency
-    except: pass
+        data = await page.evaluate(SCHEMA_EXTRACT_JS)
+    except:
+        return None
+
+    # 1. Meta Tags (Open Graph / Product Meta)
+    amount = data.get("amount")
+    if amount:
+        currency = data.get("currency")
+        fallback_currency = data.get("itemprop_currency") if (not currency or amount == currency) else None
+        result = parse_price_from_meta(amount, currency, fallback_currency)
+        if result: return result
 
     # 2. JSON-LD
+    for text in data.get("ld") or []:
+        result = parse_price_from_json_ld(text)
+        if result: return result
+    return None
+
+def get_price_from_html(html):
+    """
+    HTTP 层使用：从静态 HTML 中按与 get_price_from_schema 相同的优先级提取价格
+    返回 (价格, 币种, 页面标题) 或 None
+    """
+    soup = BeautifulSoup(html, "html.parser")
+
+    def meta_content(attr, value):
+        tag = soup.find("meta", attrs={attr: value})
+        return tag.get("content") if tag else None
+
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    og_title = meta_content("property", "og:title")
+
+    price_data = None
+    amount = meta_content("property", "product:price:amount") or meta_content("itemprop", "price")
+    if amount:
+        currency = meta_content("property", "product:price:currency")
+        fallback_currency = None
+        if not currency or amount == currency:
+            fallback_currency = meta_content("itemprop", "priceCurrency")
+        price_data = parse_price_from_meta(amount, currency, fallback_currency)
+
+    if not price_data:
+        for script in soup.find_all("script", attrs={"type": "application/ld+json"}):
+            price_data = parse_price_from_json_ld(script.string or script.get_text())
+            if price_data: break
+
+    if not price_data:
+        return None
+    return price_data[0], price_data[1], title or og_title or ""
+
+# ================= HTTP 优先抓取层 =================
+
+def _http_fetch_page(url):
+    """使用 curl_cffi 伪装真实浏览器 TLS 指纹获取商品页 HTML，返回 (状态码, HTML)"""
+    session = cffi_requests.Session(impersonate=random.choice(HTTP_IMPERSONATE_LIST))
     try:
-        scripts = await page.locator("script[type='application/ld+json']").all()
-        for script in scripts:
-            text = await script.text_content()
-            if text and '"price"' in text:
-                try:
-                    data = json.loads(text)
-                    items = data if isinstance(data, list) else [data]
-                    for item in items:
-                        # 兼容多种常见的 Schema 嵌套结构
-                        if isinstance(item, dict):
-                            offers = item.get('offers')
-                            if not offers and '@graph' in item:
-                                for sub in item['@graph']:
-                                    if 'offers' in sub:
-                                        offers = sub['offers']
-                                        break
-                            
-                            if offers:
-                                offer_list = offers if isinstance(offers, list) else [offers]
-                                for offer in offer_list:
-                                    if isinstance(offer, dict):
-                                        p = offer.get('price')
-                                        if p:
-                                            return float(str(p).replace(",", ".")), offer.get('priceCurrency', 'EUR')
-                except: continue
-    except: pass
+        resp = session.get(url, timeout=20)
+        return resp.status_code, resp.text
+    finally:
+        session.close()
+
+async def fetch_price_via_http(url, name=""):
+    """
+    轻量抓取层：不启动浏览器，直接解析静态 Schema/Meta 价格
+    返回 (价格数据, 是否被拦截)；遇到拦截页、非 200、死链或解析不到价格时价格数据为 None，由调用方升级到 Playwright
+    是否被拦截 (拦截页 / 403 / 429) 用于反馈给 PACER 调整该平台节奏
+    """
+    loop = asyncio.get_event_loop()
+    try:
+        status_code, html = await loop.run_in_executor(None, _http_fetch_page, url)
+    except Exception as e:
+        print(f"  [{name}] HTTP 层请求异常，升级浏览器: {str(e)[:80]}")
+        return None, False
+
+    if status_code != 200 or len(html) < 5000:
+        blocked = status_code in (403, 429) or is_bot_page("", html[:20000])
+        print(f"  [{name}] HTTP 层状态码 {status_code} / 长度 {len(html)}{' (拦截)' if blocked else ''}，升级浏览器")
+        return None, blocked
+
+    try:
+        parsed = await loop.run_in_executor(None, get_price_from_html, html)
+    except Exception as e:
+        print(f"  [{name}] HTTP 层解析异常，升级浏览器: {str(e)[:80]}")
+        return None, False
+
+    if not parsed:
+        if is_bot_page("", html[:20000]):
+            print(f"  [{name}] HTTP 层命中拦截页，升级浏览器")
+            return None, True
+        print(f"  [{name}] HTTP 层未解析到 Schema 价格，升级浏览器")
+        return None, False
+
+    price, currency, title = parsed
+    # 标题里带死链特征的交给浏览器流程处理 (会触发重新搜索)
+    if is_bot_page(title, ""):
+        return None, True
+    if "404" in title or "Page Not Found" in title or "Oups" in title or "épuisé" in title:
+        return None, False
+    return (price, currency, title), False
+
+def get_price_trend(historical_prices, name, country, platform, new_price):
+    """与历史最新有效价格对比，返回价格趋势标签"""
+    key = f"{name}_{country}_{platform}"
+    old_price = historical_prices.get(key)
+    if old_price is None:
+        return "新上线"
+    if new_price < old_price:
+        return "降价"
+    if new_price > old_price:
+        return "涨价"
+    return "持平"
+
+# ================= 声明式价格选择器 =================
+# 每个平台的 CSS 候选按优先级分组，浏览器端一次 evaluate 返回所有候选的文本/可见性/划线标记，
+# 排序与清洗在 Python 侧完成。分组字段:
+#   selector          CSS 选择器
+#   check_crossed     是否检测划线价 (text-decoration: line-through)
+#   crossed_closest   祖先命中该选择器时同样视为划线原价
+#   first_only        只看第一个匹配元素 (等价于 page.is_visible(sel) / page.inner_text(sel))
+#   parent_text       额外返回父元素文本，用于过滤分期/月供
+#   newline_as_comma  将换行替换为逗号 (Boulanger 把小数部分拆成单独一行)
+PRICE_SELECTOR_SPECS = {
+    "fnac": {
+        "groups": [
+            {"selector": sel, "check_crossed": True, "crossed_closest": ".is-crossed, .old-price"}
+            for sel in [".f-price", ".userPrice", ".product-price", ".price"]
+        ],
+    },
+    "darty": {
+        "groups": [
+            {"selector": sel, "check_crossed": True, "crossed_closest": ".old-price, .crossed"}
+            for sel in [".product_price", ".darty_price", ".price"]
+        ],
+    },
+    "boulanger": {
+        "groups": [
+            # 优先 .price__main (主价格)
+            {"selector": ".price__main .price__amount", "first_only": True, "newline_as_comma": True},
+            # 兜底: 所有 .price__amount 并排除划线价格
+            {"selector": ".price__amount", "check_crossed": True, "crossed_closest": ".price__crossed, .price__old", "newline_as_comma": True},
+            # 通用兜底
+            {"selector": ".price", "first_only": True},
+            {"selector": "span[class*='price']", "first_only": True},
+        ],
+    },
+    "coolblue": {
+        "groups": [
+            {"selector": sel, "check_crossed": True, "crossed_closest": "[class*='old'], [class*='crossed'], [class*='advice']"}
+            for sel in [
+                "[class*='sales-price__current']",
+                "[class*='SalesPrice']",
+                "strong[class*='price']",
+                "[data-test='sales-price']",
+                "[class*='price--current']",
+                ".price",
+                "span[class*='price']",
+            ]
+        ],
+    },
+    "mediamarkt": {
+        "groups": [
+            {"selector": sel, "check_crossed": True, "crossed_closest": "[class*='old'], [class*='crossed'], [class*='strike']", "parent_text": True}
+            for sel in [
+                "[data-test='mms-product-detail-price']",
+                "[data-test='mms-price-product-wrapper']",
+                "[data-test='mms-product-price']",
+                "div[data-test='mms-price']",
+                "[class*='ProductPrice']",
+                "span[class*='price--value']",
+                ".price",
+            ]
+        ],
+        # 过滤分期/月供组件
+        "exclude_context": ["mtl", "monat", "finanz", "rate", "eff."],
+        # 在家电价格监控场景中，绝对阻断极小值（典型的月供金）
+        "min_price": 150,
+    },
+}
+
+PRICE_CANDIDATES_JS = """(groups) => groups.map(g => {
+    let els = [];
+    try { els = Array.from(document.querySelectorAll(g.selector)); } catch (e) { return []; }
+    if (g.first_only) els = els.slice(0, 1);
+    return els.map(el => {
+        const style = window.getComputedStyle(el);
+        const rect = el.getBoundingClientRect();
+        const visible = style.visibility !== 'hidden' && rect.width > 0 && rect.height > 0;
+        let crossed = false;
+        if (g.check_crossed) {
+            crossed = (style.textDecoration || '').includes('line-through') ||
+                      (g.crossed_closest ? !!el.closest(g.crossed_closest) : false);
+        }
+        const parent = g.parent_text && el.parentElement ? (el.parentElement.innerText || '').toLowerCase() : '';
+        return { text: el.innerText || '', visible: visible, crossed: crossed, parent_text: parent };
+    });
+})"""
+
+def pick_price_candidate(spec, candidate_groups):
+    """按分组优先级挑选第一个可见、未划线且能清洗出价格的候选"""
+    exclude_context = spec.get("exclude_context") or []
+    min_price = spec.get("min_price")
+    for group, candidates in zip(spec["groups"], candidate_groups):
+        for c in candidates:
+            if not c.get("visible") or c.get("crossed"):
+                continue
+            text = c.get("text") or ""
+            if exclude_context:
+                combined = text.lower() + " " + (c.get("parent_text") or "")
+                if any(x in combined for x in exclude_context):
+                    continue
+            if group.get("newline_as_comma"):
+                text = text.replace("\n", ",")
+            result = clean_price(text)
+            if result and (min_price is None or result[0] > min_price):
+                return result
     return None
 
+async def get_price_by_spec(page, platform_key):
+    """一次 page.evaluate 取回平台全部候选价格节点，在 Python 侧排序"""
+    spec = PRICE_SELECTOR_SPECS[platform_key]
+    try:
+        candidate_groups = await page.evaluate(PRICE_CANDIDATES_JS, spec["groups"])
+    except:
+        return None
+    return pick_price_candidate(spec, candidate_groups)
+
 # ================= 爬虫策略函数 (Async) =================
 
 async def get_fnac_price(page):
@@ -350,21 +771,8 @@ async def get_fnac_price(page):
     schema_res = await get_price_from_schema(page)
     if schema_res: return schema_res
 
-    # 2. CSS 候选
-    selectors = [".f-price", ".userPrice", ".product-price", ".price"]
-    for sel in selectors:
-        try:
-            elements = await page.locator(sel).all()
-            for el in elements:
-                if await el.is_visible():
-                    # 排除被划掉的价格
-                    is_crossed = await el.evaluate("el => window.getComputedStyle(el).textDecoration.includes('line-through') || el.closest('.is-crossed, .old-price')")
-                    if not is_crossed:
-                        text = await el.inner_text()
-                        result = clean_price(text)
-                        if result: return result
-        except: pass
-    return None
+    # 2. CSS 候选 (排除被划掉的价格)
+    return await get_price_by_spec(page, "fnac")
 
 async def get_darty_price(page):
     # 1. 尝试 Schema/Meta
@@ -372,58 +780,15 @@ async def get_darty_price(page):
     if schema_res: return schema_res
 
     # 2. CSS 候选
-    selectors = [".product_price", ".darty_price", ".price"]
-    for sel in selectors:
-        try:
-            elements = await page.locator(sel).all()
-            for el in elements:
-                if await el.is_visible():
-                    is_crossed = await el.evaluate("el => window.getComputedStyle(el).textDecoration.includes('line-through') || el.closest('.old-price, .crossed')")
-                    if not is_crossed:
-                        text = await el.inner_text()
-                        result = clean_price(text)
-                        if result: return result
-        except: pass
-    return None
+    return await get_price_by_spec(page, "darty")
 
 async def get_boulanger_price(page):
     # 1. 尝试 Schema/Meta (Boulanger 的 Schema 通常非常准确)
     schema_res = await get_price_from_schema(page)
     if schema_res: return schema_res
 
-    # 2. 针对性 CSS: 优先尝试 .price__main (主价格)
-    try:
-        price_main = page.locator(".price__main .price__amount").first
-        if await price_main.is_visible(timeout=2000):
-            text = await price_main.inner_text()
-            result = clean_price(text.replace("\n", ","))
-            if result: return result
-    except: pass
-
-    # 3. 兜底: 寻找所有 .price__amount 并排除划线价格
-    try:
-        elements = await page.locator(".price__amount").all()
-        for el in elements:
-            if await el.is_visible():
-                is_invalid = await el.evaluate("""el => {
-                    const style = window.getComputedStyle(el);
-                    return style.textDecoration.includes('line-through') || el.closest('.price__crossed, .price__old');
-                }""")
-                if not is_invalid:
-                    text = await el.inner_text()
-                    result = clean_price(text.replace("\n", ","))
-                    if result: return result
-    except: pass
-
-    # 4. 通用兜底
-    for sel in [".price", "span[class*='price']"]:
-        try:
-            if await page.is_visible(sel, timeout=1000):
-                text = await page.inner_text(sel)
-                result = clean_price(text)
-                if result: return result
-        except: pass
-    return None
+    # 2. 主价格 -> 非划线 .price__amount -> 通用兜底
+    return await get_price_by_spec(page, "boulanger")
 
 async def get_amazon_price(page):
     """抓取亚马逊价格 (优先 Deal Price，支持第三方卖家)"""
@@ -588,35 +953,7 @@ async def get_mediamarkt_price(page):
     except: pass
 
     # 终极兜底扫描: 纯 CSS 选择器遍历，且辅以严格过滤规则
-    selectors = [
-        "[data-test='mms-product-detail-price']",
-        "[data-test='mms-price-product-wrapper']",
-        "[data-test='mms-product-price']",
-        "div[data-test='mms-price']",
-        "[class*='ProductPrice']",
-        "span[class*='price--value']",
-        ".price",
-    ]
-    for sel in selectors:
-        try:
-            els = await page.locator(sel).all()
-            for el in els:
-                if await el.is_visible():
-                    is_crossed = await el.evaluate("el => window.getComputedStyle(el).textDecoration.includes('line-through') || !!el.closest('[class*=\"old\"], [class*=\"crossed\"], [class*=\"strike\"]')")
-                    if not is_crossed:
-                        text = await el.inner_text()
-                        parent_text = await el.evaluate("el => { let p = el.parentElement; return p ? p.innerText.toLowerCase() : ''; }")
-                        combined = text.lower() + " " + parent_text
-                        if any(x in combined for x in ["mtl", "monat", "finanz", "rate", "eff."]):
-                            continue
-                        
-                        result = clean_price(text)
-                        # 最核心的防卫网: 在家电价格监控场景中，绝对阻断极小值（典型的月供金）
-                        if result and result[0] > 150: 
-                            return result
-        except: pass
-
-    return None
+    return await get_price_by_spec(page, "mediamarkt")
 
 
 async def get_coolblue_price(page):
@@ -629,27 +966,7 @@ async def get_coolblue_price(page):
     try: await page.wait_for_selector("[class*='sales-price'], .price, [data-test*='price']", timeout=5000)
     except: pass
 
-    selectors = [
-        "[class*='sales-price__current']",
-        "[class*='SalesPrice']",
-        "strong[class*='price']",
-        "[data-test='sales-price']",
-        "[class*='price--current']",
-        ".price",
-        "span[class*='price']",
-    ]
-    for sel in selectors:
-        try:
-            elements = await page.locator(sel).all()
-            for el in elements:
-                if await el.is_visible():
-                    is_crossed = await el.evaluate("el => window.getComputedStyle(el).textDecoration.includes('line-through') || !!el.closest('[class*=\"old\"], [class*=\"crossed\"], [class*=\"advice\"]')")
-                    if not is_crossed:
-                        text = await el.inner_text()
-                        result = clean_price(text)
-                        if result: return result
-        except: pass
-    return None
+    return await get_price_by_spec(page, "coolblue")
 
 
 # ================= 导入 Filler =================
@@ -670,13 +987,14 @@ async def amazon_warmup(page):
     try:
         print("  [预热] 访问 Amazon UK 首页...")
         await page.goto("https://www.amazon.co.uk", wait_until='domcontentloaded', timeout=30000)
-        await asyncio.sleep(random.uniform(2.0, 4.0))
+        # 等待搜索框或 Cookie 弹窗出现，代替固定等待
+        await wait_for_any_selector(page, ["#twotabsearchtextbox", "#sp-cc-accept"], timeout=5000)
         
         # 接受 Cookie
         try:
-            if await page.is_visible("#sp-cc-accept", timeout=3000):
+            if await page.is_visible("#sp-cc-accept"):
                 await page.click("#sp-cc-accept")
-                await asyncio.sleep(1)
+                await page.wait_for_selector("#sp-cc-accept", state="hidden", timeout=3000)
         except: pass
         
         # 模拟滚动 (注入 JS)
@@ -688,18 +1006,106 @@ async def amazon_warmup(page):
                     setTimeout(() => window.scrollBy(0, -100), 1200);
                 }
             """)
-            await asyncio.sleep(random.uniform(1.5, 3.0))
+            # 等滚动脚本执行完 (最后一次滚动在 1.2s)
+            await asyncio.sleep(1.3)
         except: pass
         
         print("  [预热] 首页预热完成。")
     except Exception as e:
         print(f"  [预热] 首页预热失败 (非致命): {e}")
 
+# ================= Context 复用池 =================
+
+# 单个 Context 连续处理多少个商品页后回收重建 (避免 Cookie/指纹长期不变被风控盯上)
+CONTEXT_MAX_PAGES = 15
+
+def get_locale_for_country(country):
+    """根据 Country 返回对应的 (locale, timezone)"""
+    if country == 'DE':
+        return 'de-DE', 'Europe/Berlin'
+    if country == 'FR':
+        return 'fr-FR', 'Europe/Paris'
+    return 'en-GB', 'Europe/London'
+
+class BrowserContextPool:
+    """
+    按 (平台, 国家) 复用已预热的浏览器 Context：
+      - 首次借出时创建并预热 (Amazon 访问首页、接受 Cookie)
+      - 归还后留给同平台的下一个商品继续使用，保留 Cookie
+      - 连续使用 CONTEXT_MAX_PAGES 次或遭遇反爬后关闭重建
+    """
+
+    def __init__(self, browser, max_pages=CONTEXT_MAX_PAGES):
+        self.browser = browser
+        self.max_pages = max_pages
+        self.idle = {}  # (platform_key, country) -> [entry, ...]
+        self.created = 0
+        self.recycled = 0
+        self.route_stats = new_blocking_stats()
+
+    async def _create(self, platform_key, country):
+        ua = random.choice(USER_AGENTS)
+        locale_str, tz_str = get_locale_for_country(country)
+        context = await self.browser.new_context(
+            user_agent=ua,
+            viewport={'width': random.choice([1920, 1366, 1440, 1536]), 'height': random.choice([1080, 768, 900])},
+            locale=locale_str,
+            timezone_id=tz_str
+        )
+        # 注入完整 Stealth 脚本
+        await context.add_init_script(STEALTH_JS)
+        # 拦截图片/字体/视频/第三方统计，只保留价格所需的 DOM 与脚本
+        await install_resource_blocking(context, platform_key, self.route_stats)
+        page = await context.new_page()
+        self.created += 1
+
+        # === Amazon 专属: 首页预热 (每个 Context 只做一次) ===
+        if platform_key == "amazon":
+            await PACER.wait(platform_key)
+            await amazon_warmup(page)
+
+        return {"key": (platform_key, country), "context": context, "page": page, "uses": 0}
+
+    async def acquire(self, platform_key, country):
+        """借出一个 Context，优先复用空闲的已预热实例"""
+        entries = self.idle.get((platform_key, country))
+        while entries:
+            entry = entries.pop()
+            if not entry["page"].is_closed():
+                return entry
+            await self._close(entry)
+        return await self._create(platform_key, country)
+
+    async def release(self, entry, burned=False):
+        """归还 Context；burned=True (反爬/异常) 或达到使用上限时直接关闭"""
+        if entry is None:
+            return
+        entry["uses"] += 1
+        if burned or entry["uses"] >= self.max_pages or entry["page"].is_closed():
+            self.recycled += 1
+            await self._close(entry)
+            return
+        self.idle.setdefault(entry["key"], []).append(entry)
+
+    async def _close(self, entry):
+        try:
+            await entry["context"].close()
+        except: pass
+
+    async def close_all(self):
+        for entries in self.idle.values():
+            for entry in entries:
+                await self._close(entry)
+        self.idle.clear()
+        print(f"[Context 池] 共创建 {self.created} 个 Context，回收重建 {self.recycled} 次。")
+        print_blocking_stats(self.route_stats)
+
 # ================= 主逻辑 (Async) =================
 
-async def process_product(sem, browser, item, historical_prices):
+async def process_product(platform_sem, global_sem, context_pool, item, historical_prices):
     """单个商品处理逻辑 (并发单元, 返回结果而不直接写入)"""
-    async with sem:
+    # 先占平台额度再占全局额度，避免排队中的任务白白占着全局名额
+    async with platform_sem, global_sem:
         # 初始化
         url = item.get('url', '').strip()
         name = item['product_name']
@@ -707,7 +1113,8 @@ async def process_product(sem, browser, item, historical_prices):
         platform = item.get('platform', '').strip()
         country = item.get('country', 'FR')
         platform_lower = platform.lower()
-        is_amazon = "amazon" in platform_lower
+        platform_key = get_platform_key(platform)
+        is_amazon = platform_key == "amazon"
         
         result = {
             "brand": brand, "name": name, "country": country,
@@ -719,31 +1126,34 @@ async def process_product(sem, browser, item, historical_prices):
         
         print(f"\n正在处理 [{country}] {name} ({platform}) ...")
         
-        context = None
+        # === HTTP 优先: 静态 Schema 能拿到价格就不开浏览器 ===
+        http_paced = False  # HTTP 层已占用本次节奏等待，升级浏览器后首次导航不再重复等待
+        if url and HTTP_FIRST and HTTP_TIER_AVAILABLE and platform_key in HTTP_FIRST_PLATFORMS:
+            await PACER.wait(platform_key)
+            http_paced = True
+            http_data, http_blocked = await fetch_price_via_http(url, name)
+            if http_blocked:
+                # HTTP 层被拦截同样反馈给节奏控制器，放慢该平台
+                PACER.record(platform_key, blocked=True)
+            if http_data:
+                PACER.record(platform_key)
+                new_price, currency, page_title = http_data
+                result['price'] = new_price
+                result['currency'] = currency
+                result['title'] = page_title
+                result['status'] = "Success"
+                result['price_trend'] = get_price_trend(historical_prices, name, country, platform, new_price)
+                print(f"  [成功/HTTP] {name}: {currency} {new_price} ({result['price_trend']})")
+                return result
+        
+        entry = None
+        burned = False  # 遭遇反爬或严重异常时，归还后不再复用该 Context
+        blocked = False  # 是否被平台拦截 (反馈给 PACER 调整节奏)
         try:
-            # === 创建独立上下文 (随机指纹) ===
-            ua = random.choice(USER_AGENTS)
-            # 根据 Country 设置对应的区域和时区
-            if country == 'DE':
-                locale_str, tz_str = 'de-DE', 'Europe/Berlin'
-            elif country == 'FR':
-                locale_str, tz_str = 'fr-FR', 'Europe/Paris'
-            else:
-                locale_str, tz_str = 'en-GB', 'Europe/London'
-            context = await browser.new_context(
-                user_agent=ua,
-                viewport={'width': random.choice([1920, 1366, 1440, 1536]), 'height': random.choice([1080, 768, 900])},
-                locale=locale_str,
-                timezone_id=tz_str
-            )
-            # 注入完整 Stealth 脚本
-            await context.add_init_script(STEALTH_JS)
-            
-            page = await context.new_page()
-            
-            # === Amazon 专属: 首页预热 ===
-            if is_amazon:
-                await amazon_warmup(page)
+            # === 从池中借出已预热的上下文 (同平台同国家复用 Cookie) ===
+            entry = await context_pool.acquire(platform_key, country)
+            context = entry["context"]
+            page = entry["page"]
             
             # === 大循环: 允许 \"链接失效 -> 清空 -> 重新搜索\" ===
             MAX_LOOPS = 2
@@ -804,20 +1214,23 @@ async def process_product(sem, browser, item, historical_prices):
                         
                         if should_navigate:
                             try:
-                                # === Amazon 专属降速: 8-15秒等待 ===
-                                if is_amazon:
-                                    delay = random.uniform(8.0, 15.0)
-                                    print(f"  [{name}] Amazon 降速等待 {delay:.1f}s ...")
-                                    await asyncio.sleep(delay)
+                                # === 按平台自适应降速 (Amazon 基础间隔 8-15秒) ===
+                                if http_paced:
+                                    http_paced = False
+                                    waited = 0.0
                                 else:
-                                    await asyncio.sleep(random.uniform(1.0, 3.0))
+                                    waited = await PACER.wait(platform_key)
+                                if is_amazon and waited > 0:
+                                    print(f"  [{name}] Amazon 降速等待了 {waited:.1f}s")
                                 
                                 timeout_val = 40000 if attempt == 0 else 60000
                                 await page.goto(url, wait_until='domcontentloaded', timeout=timeout_val)
                                 
                                 # === Bot 拦截检测（Currys / MediaMarkt / Coolblue）===
                                 if "currys" in url.lower() or "mediamarkt" in url.lower() or "coolblue" in url.lower() or "darty" in url.lower() or "fnac" in url.lower():
-                                    await handle_antibot_page(page, name)
+                                    if not await handle_antibot_page(page, name):
+                                        burned = True
+                                        blocked = True
                             except Exception as e:
                                 print(f"  [{name}] 导航超时/错误 ({attempt+1}): {e}")
                                 if attempt < MAX_RETRIES - 1: continue
@@ -849,6 +1262,7 @@ async def process_product(sem, browser, item, historical_prices):
                             if not robot_check_retried:
                                 print(f"  [{name}] ⚠ 遭遇验证码，尝试绕过...")
                                 robot_check_retried = True
+                                blocked = True
                                 
                                 # 1. 清空 Cookies
                                 await context.clear_cookies()
@@ -867,6 +1281,7 @@ async def process_product(sem, browser, item, historical_prices):
                             else:
                                 print(f"  [{name}] 验证码逃逸失败，放弃")
                                 result['status'] = "Failed: Anti-Bot Block"
+                                burned = True
                                 try:
                                     safe_name = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
                                     screenshot_path = os.path.join(SCREENSHOTS_DIR, f"{safe_name}_anti_bot.png")
@@ -882,7 +1297,7 @@ async def process_product(sem, browser, item, historical_prices):
                             if is_amazon:
                                 if await page.is_visible("input#continue-shopping", timeout=2000):
                                     await page.click("input#continue-shopping")
-                                    await asyncio.sleep(2)
+                                    await wait_for_network_quiet(page, timeout=3000)
                                 if await page.is_visible("#sp-cc-accept", timeout=2000):
                                     await page.click("#sp-cc-accept")
                         except: pass
@@ -934,16 +1349,7 @@ async def process_product(sem, browser, item, historical_prices):
                             result['status'] = "Success"
                             
                             # === 价格趋势逻辑 ===
-                            key = f"{name}_{country}_{platform}"
-                            old_price = historical_prices.get(key)
-                            if old_price is None:
-                                result['price_trend'] = "新上线"
-                            elif new_price < old_price:
-                                result['price_trend'] = "降价"
-                            elif new_price > old_price:
-                                result['price_trend'] = "涨价"
-                            else:
-                                result['price_trend'] = "持平"
+                            result['price_trend'] = get_price_trend(historical_prices, name, country, platform, new_price)
                             
                             # 成功后读取标题
                             final_title = await page.title()
@@ -970,8 +1376,6 @@ async def process_product(sem, browser, item, historical_prices):
                                     print(f"  [{name}] 调试截图已保存: {screenshot_path}")
                                 except Exception as ss_err:
                                     print(f"  [{name}] 截图失败: {ss_err}")
-                            else:
-                                await asyncio.sleep(2)
                                 
                     except Exception as e:
                          print(f"  [{name}] 异常: {str(e)[:80]}")
@@ -988,8 +1392,11 @@ async def process_product(sem, browser, item, historical_prices):
         except Exception as e:
             print(f"  [{name}] 严重异常: {e}")
             result['status'] = f"Failed: Critical Error {str(e)[:50]}"
+            burned = True
         finally:
-            if context: await context.close()
+            await context_pool.release(entry, burned=burned)
+            if entry is not None:
+                PACER.record(platform_key, blocked=blocked)
             
         return result
 
@@ -1003,7 +1410,43 @@ async def run_scraper_async(headless=True):
     products = load_products_from_csv()
     if not products: return
 
-    print(f"启动并发爬虫 (Headless={headless}, Concurrency=3)...")
+    # 批次时间取运行开始时刻，所有行共用，便于流式写入与断点续跑
+    now = datetime.now()
+    date_str = now.strftime("%Y-%m-%d")
+    checkpoint = load_run_checkpoint(date_str)
+    if checkpoint:
+        done = set(checkpoint["done"])
+        pending = [
+            item for item in products
+            if get_index_key(item['product_name'], item.get('country', 'FR'), item.get('platform', '').strip()) not in done
+        ]
+        time_str = checkpoint["run_time"]
+        print(f"[断点] 续跑 {date_str} {time_str} 批次: 已完成 {len(products) - len(pending)} 个，剩余 {len(pending)} 个。")
+    else:
+        pending = products
+        time_str = now.strftime("%H:%M:%S")
+        checkpoint = {"run_date": date_str, "run_time": time_str, "done": []}
+    if not pending:
+        clear_run_checkpoint()
+        print("所有任务完成。")
+        return
+    writer = PriceCsvWriter(CSV_FILE)
+    if not checkpoint["done"]:
+        # 新批次: 记录批次起始字节位置，sync_feishu.py 据此直接定位最新批次
+        try:
+            save_batch_marker(date_str, time_str, os.path.getsize(CSV_FILE) if os.path.isfile(CSV_FILE) else 0)
+        except Exception as e:
+            print(f"  [提示] 写入批次标记失败: {e}")
+    save_run_checkpoint(checkpoint)
+
+    # 按平台分配独立的并发额度
+    platform_sems = {}
+    for item in pending:
+        key = get_platform_key(item.get('platform'))
+        if key not in platform_sems:
+            platform_sems[key] = asyncio.Semaphore(PLATFORM_CONCURRENCY.get(key, DEFAULT_PLATFORM_CONCURRENCY))
+    pool_desc = ", ".join(f"{k}={PLATFORM_CONCURRENCY.get(k, DEFAULT_PLATFORM_CONCURRENCY)}" for k in platform_sems)
+    print(f"启动并发爬虫 (Headless={headless}, Global={GLOBAL_CONCURRENCY}, {pool_desc})...")
 
     async with async_playwright() as p:
         browser_args = [
@@ -1019,28 +1462,47 @@ async def run_scraper_async(headless=True):
         except:
             browser = await p.chromium.launch(headless=headless, args=browser_args)
         
-        sem = asyncio.Semaphore(3)
+        global_sem = asyncio.Semaphore(GLOBAL_CONCURRENCY)
+        context_pool = BrowserContextPool(browser)
         
-        tasks = [process_product(sem, browser, item, historical_prices) for item in products]
-        results = await asyncio.gather(*tasks)
+        tasks = [
+            process_product(platform_sems[get_platform_key(item.get('platform'))], global_sem, context_pool, item, historical_prices)
+            for item in pending
+        ]
+        written = 0
+        try:
+            # 谁先完成先落盘: 每条结果立即追加到 prices.csv 并更新断点
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    res = await finished
+                except Exception as e:
+                    print(f"  [错误] 任务异常退出: {e}")
+                    continue
+                row = build_price_row(
+                    date_str, time_str,
+                    res['brand'], res['name'], res['country'], res['platform'],
+                    res['price'], res['currency'], res['title'],
+                    price_trend=res['price_trend'],
+                    status=res['status']
+                )
+                if not writer.append_rows([row]):
+                    continue
+                written += 1
+                print(f"  [记录 {written}/{len(pending)}] {row['Product Name']} | {row['Currency']} {row['Price']} | Trend: {row['Price_Trend']} | Status: {row['Status']}")
+                checkpoint["done"].append(get_index_key(res['name'], res['country'], res['platform']))
+                save_run_checkpoint(checkpoint)
+        finally:
+            await context_pool.close_all()
+            PACER.print_summary()
         
         await browser.close()
-    
-    # 按顺序写入结果
-    print("\n正在按顺序写入结果...")
-    now = datetime.now()
-    date_str = now.strftime("%Y-%m-%d")
-    time_str = now.strftime("%H:%M:%S")
-    
-    for res in results:
-        log_price_update(
-            date_str, time_str,
-            res['brand'], res['name'], res['country'], res['platform'],
-            res['price'], res['currency'], res['title'],
-            price_trend=res['price_trend'],
-            status=res['status']
-        )
-            
+
+    refresh_price_sidecars()
+
+    if written == len(pending):
+        clear_run_checkpoint()
+    else:
+        print(f"[断点] 本次仅写入 {written}/{len(pending)} 条，重跑时将跳过已完成的商品。")
     print("所有任务完成。")
 
 def run_scraper(headless=True):
@@ -0,0 +1,102 @@
+import asyncio
+import random
+import time
+
+# ================= 自适应节奏控制 =================
+
+class PacingController:
+    """
+    按域名 (平台) 控制请求间隔：
+      - 同一域名的相邻两次导航至少间隔 随机基础区间 × 当前倍率
+      - 被拦截时倍率翻倍 (放慢)，顺利抓取时逐步回落 (加速)，限制在 [min_factor, max_factor]
+    """
+
+    def __init__(self, delays=None, default_delay=(1.0, 3.0), min_factor=0.3, max_factor=4.0):
+        self.delays = delays or {}
+        self.default_delay = default_delay
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.factor = {}        # domain -> 当前倍率
+        self.last_request = {}  # domain -> 上次放行的时间 (monotonic)
+        self.stats = {}         # domain -> {"ok": n, "blocked": n, "waited": 秒}
+        self._locks = {}
+
+    def _stat(self, domain):
+        return self.stats.setdefault(domain, {"ok": 0, "blocked": 0, "waited": 0.0})
+
+    async def wait(self, domain):
+        """在向 domain 发起导航前调用，按需等待并返回实际等待秒数"""
+        lock = self._locks.setdefault(domain, asyncio.Lock())
+        async with lock:
+            lo, hi = self.delays.get(domain, self.default_delay)
+            delay = random.uniform(lo, hi) * self.factor.get(domain, 1.0)
+            last = self.last_request.get(domain)
+            remaining = 0.0 if last is None else max(0.0, last + delay - time.monotonic())
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            self.last_request[domain] = time.monotonic()
+            self._stat(domain)["waited"] += remaining
+            return remaining
+
+    def record(self, domain, blocked=False):
+        """记录一次请求结果，调整该域名的倍率"""
+        factor = self.factor.get(domain, 1.0)
+        if blocked:
+            self._stat(domain)["blocked"] += 1
+            self.factor[domain] = min(self.max_factor, factor * 2.0)
+        else:
+            self._stat(domain)["ok"] += 1
+            self.factor[domain] = max(self.min_factor, factor * 0.85)
+
+    def print_summary(self, label="节奏控制"):
+        for domain, st in sorted(self.stats.items()):
+            total = st["ok"] + st["blocked"]
+            rate = st["blocked"] / total * 100 if total else 0.0
+            print(f"[{label}] {domain}: 请求 {total} 次，拦截率 {rate:.0f}%，"
+                  f"累计等待 {st['waited']:.0f}s，最终倍率 x{self.factor.get(domain, 1.0):.2f}")
+
+# ================= 事件驱动等待 =================
+# 以页面信号代替固定 sleep：条件满足立即返回，超时也不抛错
+
+async def wait_for_any_selector(page, selectors, timeout=5000):
+    """等待任一选择器出现，返回是否出现"""
+    try:
+        await page.wait_for_selector(", ".join(selectors), timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+async def wait_for_url_change(page, old_url, timeout=10000):
+    """等待页面 URL 离开 old_url (表单提交 / 重定向)"""
+    try:
+        await page.wait_for_function("u => window.location.href !== u", arg=old_url, timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+async def wait_for_title_change(page, old_title, timeout=5000):
+    """等待页面标题变化 (验证页通过后通常会跳转或改标题)"""
+    try:
+        await page.wait_for_function("t => document.title !== t", arg=old_title, timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+async def wait_for_network_quiet(page, timeout=5000):
+    """等待网络空闲；长连接站点可能永远不空闲，因此只等待 timeout"""
+    try:
+        await page.wait_for_load_state("networkidle", timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+async def wait_for_scroll_growth(page, previous_height, timeout=2000):
+    """滚动后等待懒加载撑高页面，返回新的 scrollHeight"""
+    try:
+        await page.wait_for_function("h => document.body.scrollHeight > h", arg=previous_height, timeout=timeout)
+    except Exception:
+        pass
+    try:
+        return await page.evaluate("document.body.scrollHeight")
+    except Exception:
+        return previous_height
@@ -0,0 +1,314 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+
+# ================= 配置区域 =================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_FILE = os.path.join(BASE_DIR, "prices.csv")
+INDEX_FILE = os.path.join(BASE_DIR, "prices_index.json")
+BATCH_FILE = os.path.join(BASE_DIR, "prices_batch.json")
+INDEX_VERSION = 2
+
+# 校验 offset 时比对其前面这么多字节的指纹，发现 prices.csv 被改写 (即使大小不变或变大)
+OFFSET_FINGERPRINT_BYTES = 256
+
+# prices.csv 的完整表头 (早期数据可能缺失 Price_Trend)
+PRICE_FIELDS = ["Date", "Time", "Brand", "Product Name", "Country", "Platform", "Price", "Currency", "Page Title", "Status", "Price_Trend"]
+
+# ================= 最新价格索引 =================
+# prices_index.json 结构:
+# {
+#   "version": 2,
+#   "csv_offset": 已消化到 prices.csv 的字节位置,
+#   "csv_fingerprint": csv_offset 之前 OFFSET_FINGERPRINT_BYTES 字节的指纹,
+#   "entries": {
+#       "{Name}_{Country}_{Platform}": {
+#           "brand", "name", "country", "platform",
+#           "last_status", "last_date", "last_time",        # 最后一条记录 (含失败)
+#           "last_row_status", "last_row_price",            # 最后一条记录的原始 Status / Price
+#           "last_row_currency", "last_trend",
+#           "prev_day_status",                              # last_date 之前最后一条记录的原始 Status
+#           "last_price", "last_currency", "last_success_date",  # 最后一条 Success 记录
+#           "min_price", "max_price"                        # 全历史 Success 价格区间
+#       }
+#   }
+# }
+
+def get_index_key(name, country, platform):
+    """与 monitor.py 价格趋势对比使用的 Key 保持一致"""
+    return f"{name}_{country}_{platform}"
+
+def _empty_index():
+    return {"version": INDEX_VERSION, "csv_offset": 0, "csv_fingerprint": None, "entries": {}}
+
+def offset_fingerprint(csv_file, offset):
+    """offset 之前最多 OFFSET_FINGERPRINT_BYTES 字节的 sha1"""
+    start = max(0, offset - OFFSET_FINGERPRINT_BYTES)
+    with open(csv_file, 'rb') as f:
+        f.seek(start)
+        return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+def is_valid_offset(csv_file, offset, fingerprint=None):
+    """
+    offset 是否仍可用于增量读取: 不超过文件大小、落在行首，且 (给出 fingerprint 时) 之前的字节未被改写
+    prices.csv 被手工修改后即使大小不变或变大，也能发现并触发全量重建，而不是从半行处接着解析
+    """
+    if offset <= 0:
+        return offset == 0
+    if offset > os.path.getsize(csv_file):
+        return False
+    with open(csv_file, 'rb') as f:
+        f.seek(offset - 1)
+        if f.read(1) != b"\n":
+            return False
+    return fingerprint is None or offset_fingerprint(csv_file, offset) == fingerprint
+
+def load_index(index_file=INDEX_FILE):
+    """读取索引文件，不存在或损坏时返回空索引"""
+    if not os.path.exists(index_file):
+        return _empty_index()
+    try:
+        with open(index_file, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION or "entries" not in index:
+            return _empty_index()
+        return index
+    except Exception as e:
+        print(f"[索引] 读取 {index_file} 失败，将重建: {e}")
+        return _empty_index()
+
+def save_index(index, index_file=INDEX_FILE):
+    """原子写入: 先写临时文件再替换，避免中途崩溃留下半个 JSON"""
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, index_file)
+
+def apply_row(entries, row):
+    """把 prices.csv 的一行并入索引"""
+    name = (row.get("Product Name") or "").strip()
+    if not name:
+        return
+    country = (row.get("Country") or "").strip()
+    platform = (row.get("Platform") or "").strip()
+    key = get_index_key(name, country, platform)
+    entry = entries.get(key)
+    if entry is None:
+        entry = entries[key] = {
+            "brand": (row.get("Brand") or "").strip(),
+            "name": name,
+            "country": country,
+            "platform": platform,
+            "last_status": None, "last_date": None, "last_time": None,
+            "last_row_status": None, "last_row_price": None, "last_row_currency": None, "last_trend": None,
+            "prev_day_status": None,
+            "last_price": None, "last_currency": None, "last_success_date": None,
+            "min_price": None, "max_price": None,
+        }
+
+    status = (row.get("Status") or "").strip()
+    if status:
+        entry["last_status"] = status
+    # 跨天时记下前一天最后一条的状态，供日报判断状态突变
+    if entry["last_date"] is not None and row.get("Date") != entry["last_date"]:
+        entry["prev_day_status"] = entry["last_row_status"]
+    entry["last_row_status"] = status
+    entry["last_row_price"] = row.get("Price")
+    entry["last_row_currency"] = row.get("Currency")
+    entry["last_trend"] = row.get("Price_Trend")
+    entry["last_date"] = row.get("Date")
+    entry["last_time"] = row.get("Time")
+    if row.get("Brand"):
+        entry["brand"] = row["Brand"].strip()
+
+    price_str = row.get("Price")
+    if status == "Success" and price_str:
+        try:
+            price = float(price_str)
+        except ValueError:
+            return
+        entry["last_price"] = price
+        entry["last_currency"] = row.get("Currency")
+        entry["last_success_date"] = row.get("Date")
+        entry["min_price"] = price if entry["min_price"] is None else min(entry["min_price"], price)
+        entry["max_price"] = price if entry["max_price"] is None else max(entry["max_price"], price)
+
+def read_csv_tail(csv_file, offset):
+    """
+    从 offset 开始读取 prices.csv 新追加的完整行
+    返回 (行列表, 新 offset)；末尾未写完的半行不消化，留待下次
+    """
+    with open(csv_file, 'rb') as f:
+        header_line = f.readline()
+        header = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+        header = [h.strip() for h in header] or PRICE_FIELDS
+        # 旧文件表头缺失 Price_Trend 时按完整表头解析
+        if len(header) < len(PRICE_FIELDS):
+            header = PRICE_FIELDS
+        start = max(offset, f.tell())
+        f.seek(start)
+        data = f.read()
+
+    last_newline = data.rfind(b"\n")
+    if last_newline < 0:
+        return [], start
+    data = data[:last_newline + 1]
+    reader = csv.DictReader(io.StringIO(data.decode('utf-8'), newline=''), fieldnames=header)
+    rows = [row for row in reader if any(row.values())]
+    return rows, start + len(data)
+
+def refresh_index(csv_file=CSV_FILE, index_file=INDEX_FILE, save=True):
+    """
+    增量刷新索引: 只解析上次 offset 之后新追加的行
+    若 prices.csv 被重写/截断 (offset 超出文件、不在行首或之前的字节指纹不符)，自动全量重建
+    """
+    index = load_index(index_file)
+    if not os.path.exists(csv_file):
+        return index
+
+    size = os.path.getsize(csv_file)
+    if not is_valid_offset(csv_file, index["csv_offset"], index.get("csv_fingerprint")):
+        print("[索引] prices.csv 已被重写，全量重建索引...")
+        index = _empty_index()
+    if index["csv_offset"] == size:
+        return index
+
+    rows, new_offset = read_csv_tail(csv_file, index["csv_offset"])
+    for row in rows:
+        apply_row(index["entries"], row)
+    index["csv_offset"] = new_offset
+    index["csv_fingerprint"] = offset_fingerprint(csv_file, new_offset)
+    if save:
+        try:
+            save_index(index, index_file)
+        except Exception as e:
+            print(f"[索引] 写入索引失败: {e}")
+    return index
+
+def get_latest_states(csv_file=CSV_FILE, index_file=INDEX_FILE):
+    """
+    每个 SKU 的最新状态 (最后状态 / 最后价格 / 最后成功日期等)，返回 {Key: entry}
+    索引由 monitor.py 写入时维护，这里只增量消化新追加的行，开销为 O(SKU 数)
+    """
+    return refresh_index(csv_file, index_file)["entries"]
+
+def rebuild_index(csv_file=CSV_FILE, index_file=INDEX_FILE):
+    """从 prices.csv 全量重建索引"""
+    if os.path.exists(index_file):
+        os.remove(index_file)
+    index = refresh_index(csv_file, index_file)
+    print(f"[索引] 重建完成: {len(index['entries'])} 个 SKU, offset={index['csv_offset']}")
+    return index
+
+# ================= 最新批次定位 =================
+# 同一次运行写入的行共用 Date + Time (批次标识)。monitor.py 开始新批次时把
+# {"run_id", "date", "time", "offset"} 写入 prices_batch.json，offset 为批次第一行的字节位置；
+# 读取最新批次时直接 seek 过去，缺失或失效时再从文件尾部倒序扫描
+
+def get_run_id(date_str, time_str):
+    return f"{date_str}T{time_str}"
+
+def save_batch_marker(date_str, time_str, offset, batch_file=BATCH_FILE):
+    """记录新批次在 prices.csv 中的起始位置 (原子写入)"""
+    marker = {"run_id": get_run_id(date_str, time_str), "date": date_str, "time": time_str, "offset": offset}
+    tmp_file = batch_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(marker, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, batch_file)
+
+def load_batch_marker(batch_file=BATCH_FILE):
+    if not os.path.exists(batch_file):
+        return None
+    try:
+        with open(batch_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def _read_batch_from_marker(csv_file, marker):
+    """按 marker 的 offset 读取批次；marker 不是最新批次或 offset 失效时返回 None"""
+    try:
+        offset = int(marker["offset"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    # offset 必须落在行首
+    if offset <= 0 or not is_valid_offset(csv_file, offset):
+        return None
+    rows, _ = read_csv_tail(csv_file, offset)
+    if not rows:
+        return None
+    batch_id = (marker.get("date"), marker.get("time"))
+    if (rows[0].get("Date"), rows[0].get("Time")) != batch_id or (rows[-1].get("Date"), rows[-1].get("Time")) != batch_id:
+        return None
+    return [r for r in rows if (r.get("Date"), r.get("Time")) == batch_id]
+
+def _read_batch_from_tail(csv_file, block_size=64 * 1024):
+    """
+    从文件尾部按块倒序读取，遇到上一批次的行即停止，返回最后一批 (按文件顺序)
+    带引号的字段 (如 Page Title) 可能含换行: 引号数为奇数的物理行说明记录未完整，
+    与更早的物理行拼接后再解析
+    """
+    batch = []
+    batch_id = None
+    with open(csv_file, 'rb') as f:
+        f.readline() # 跳过文件头
+        header_end = f.tell()
+        pos = os.path.getsize(csv_file)
+        pending = b""
+        carry = b""  # 跨物理行的未完整记录 (记录的后半部分)
+        while pos > header_end:
+            read_size = min(block_size, pos - header_end)
+            pos -= read_size
+            f.seek(pos)
+            lines = (f.read(read_size) + pending).split(b"\n")
+            # 块首的半行留到下一轮与更早的数据拼接
+            pending = lines.pop(0) if pos > header_end else b""
+            for line in reversed(lines):
+                record = line + b"\n" + carry if carry else line
+                if record.count(b'"') % 2:
+                    carry = record
+                    continue
+                carry = b""
+                text = record.decode('utf-8').rstrip("\r")
+                if not text.strip():
+                    continue
+                row = next(csv.DictReader(io.StringIO(text, newline=''), fieldnames=PRICE_FIELDS))
+                row_id = (row.get("Date"), row.get("Time"))
+                if batch_id is None:
+                    batch_id = row_id
+                elif row_id != batch_id:
+                    batch.reverse()
+                    return batch
+                batch.append(row)
+    batch.reverse()
+    return batch
+
+def read_latest_batch_rows(csv_file=CSV_FILE, batch_file=BATCH_FILE):
+    """
+    读取 prices.csv 最后一个批次的所有行，开销只与单次运行的行数成正比
+    优先使用 prices_batch.json 记录的起始位置，失效时倒序扫描文件尾部
+    """
+    if not os.path.exists(csv_file):
+        return []
+    marker = load_batch_marker(batch_file)
+    if marker:
+        rows = _read_batch_from_marker(csv_file, marker)
+        if rows:
+            return rows
+    return _read_batch_from_tail(csv_file)
+
+if __name__ == "__main__":
+    # python price_index.py          增量刷新
+    # python price_index.py rebuild  从 prices.csv 全量重建
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        rebuild_index()
+    else:
+        idx = refresh_index()
+        print(f"[索引] 当前 {len(idx['entries'])} 个 SKU, offset={idx['csv_offset']}")
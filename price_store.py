@@ -0,0 +1,177 @@
+import os
+import sqlite3
+import sys
+
+from price_index import CSV_FILE, is_valid_offset, offset_fingerprint, read_csv_tail
+
+# ================= 配置区域 =================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(BASE_DIR, "prices.db")
+# prices.db 只是 prices.csv 的派生副本 (可随时从 CSV 重建)，关闭后各脚本照常全量读 CSV
+PRICE_STORE = os.environ.get("PRICE_STORE", "true").lower() in ("true", "1", "yes")
+
+# ================= SQLite 价格历史库 =================
+# prices 表与 prices.csv 一一对应；meta 表记录已同步到的 CSV 字节位置及其之前字节的指纹，
+# 每次只导入新追加的行 (与 prices_index.json 相同的增量策略)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    brand TEXT,
+    product TEXT NOT NULL,
+    country TEXT,
+    platform TEXT,
+    price REAL,
+    currency TEXT,
+    page_title TEXT,
+    status TEXT,
+    price_trend TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_prices_sku ON prices (brand, product, country, platform, date);
+CREATE INDEX IF NOT EXISTS idx_prices_product ON prices (product, country, platform, date);
+CREATE INDEX IF NOT EXISTS idx_prices_batch ON prices (date, time);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ["date", "time", "brand", "product", "country", "platform", "price", "currency", "page_title", "status", "price_trend"]
+
+def connect(db_file=DB_FILE):
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+def _get_meta(conn, key):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+def _get_offset(conn):
+    value = _get_meta(conn, "csv_offset")
+    return int(value) if value is not None else 0
+
+def _to_record(row):
+    """prices.csv 的一行 -> prices 表的一行"""
+    price_str = (row.get("Price") or "").strip()
+    try:
+        price = float(price_str) if price_str else None
+    except ValueError:
+        price = None
+    return (
+        (row.get("Date") or "").strip(),
+        (row.get("Time") or "").strip(),
+        (row.get("Brand") or "").strip(),
+        (row.get("Product Name") or "").strip(),
+        (row.get("Country") or "").strip(),
+        (row.get("Platform") or "").strip(),
+        price,
+        row.get("Currency"),
+        row.get("Page Title"),
+        (row.get("Status") or "").strip(),
+        row.get("Price_Trend"),
+    )
+
+def sync_from_csv(csv_file=CSV_FILE, db_file=DB_FILE):
+    """
+    把 prices.csv 新追加的行导入 prices.db，返回导入行数
+    若 CSV 被重写/截断 (offset 超出文件、不在行首或之前的字节指纹不符)，清空后全量重建
+    prices.db 从 Actions 缓存恢复、prices.csv 却在 git 中被手工修改时也能发现
+    """
+    if not PRICE_STORE or not os.path.exists(csv_file):
+        return 0
+    conn = connect(db_file)
+    try:
+        offset = _get_offset(conn)
+        size = os.path.getsize(csv_file)
+        if not is_valid_offset(csv_file, offset, _get_meta(conn, "csv_fingerprint")):
+            print("[价格库] prices.csv 已被重写，全量重建 prices.db...")
+            conn.execute("DELETE FROM prices")
+            offset = 0
+        if offset == size:
+            return 0
+
+        rows, new_offset = read_csv_tail(csv_file, offset)
+        records = [_to_record(r) for r in rows if (r.get("Product Name") or "").strip()]
+        with conn:
+            conn.executemany(f"INSERT INTO prices ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", records)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_offset', ?)", (str(new_offset),))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_fingerprint', ?)",
+                         (offset_fingerprint(csv_file, new_offset),))
+        return len(records)
+    finally:
+        conn.close()
+
+def rebuild_store(csv_file=CSV_FILE, db_file=DB_FILE):
+    """从 prices.csv 全量重建 prices.db"""
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    count = sync_from_csv(csv_file, db_file)
+    print(f"[价格库] 重建完成: 导入 {count} 行")
+    return count
+
+# ================= 查询 API =================
+# 返回值均为 dict 列表，字段名与 prices.csv 表头一致，方便替换原有的 csv.DictReader 结果
+
+def _to_csv_dict(row):
+    price = row["price"]
+    return {
+        "Date": row["date"],
+        "Time": row["time"],
+        "Brand": row["brand"],
+        "Product Name": row["product"],
+        "Country": row["country"],
+        "Platform": row["platform"],
+        "Price": "" if price is None else str(price),
+        "Currency": row["currency"],
+        "Page Title": row["page_title"],
+        "Status": row["status"],
+        "Price_Trend": row["price_trend"],
+    }
+
+def _query(sql, params=(), db_file=DB_FILE, sync=True):
+    if sync:
+        sync_from_csv(db_file=db_file)
+    conn = connect(db_file)
+    try:
+        return [_to_csv_dict(r) for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+def get_latest_batch(db_file=DB_FILE, sync=True):
+    """最新一批 (Date + Time 最大) 的所有行"""
+    return _query(
+        "SELECT * FROM prices WHERE (date, time) = (SELECT date, time FROM prices ORDER BY date DESC, time DESC LIMIT 1) ORDER BY rowid",
+        db_file=db_file, sync=sync,
+    )
+
+def get_rows_for_date(date_str, db_file=DB_FILE, sync=True):
+    """指定日期 (YYYY-MM-DD) 的所有行，按写入顺序"""
+    return _query("SELECT * FROM prices WHERE date = ? ORDER BY rowid", (date_str,), db_file=db_file, sync=sync)
+
+def get_sku_history(name, country=None, platform=None, start_date=None, end_date=None, brand=None, db_file=DB_FILE, sync=True):
+    """单个 SKU 在 [start_date, end_date] 内的历史价格，按时间升序"""
+    sql = "SELECT * FROM prices WHERE product = ?"
+    params = [name]
+    for column, value in (("brand", brand), ("country", country), ("platform", platform)):
+        if value is not None:
+            sql += f" AND {column} = ?"
+            params.append(value)
+    if start_date:
+        sql += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        sql += " AND date <= ?"
+        params.append(end_date)
+    sql += " ORDER BY date, time"
+    return _query(sql, params, db_file=db_file, sync=sync)
+
+if __name__ == "__main__":
+    # python price_store.py          增量同步 prices.csv -> prices.db
+    # python price_store.py rebuild  全量重建
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        rebuild_store()
+    else:
+        print(f"[价格库] 新导入 {sync_from_csv()} 行")
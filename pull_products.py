@@ -1,6 +1,7 @@
 import os
 import csv
-import requests
+
+from feishu_client import BitableClient, FeishuError, get_tenant_access_token
 
 # ================= 配置读取 (从环境变量获取) =================
 APP_ID = os.environ.get("FEISHU_APP_ID")
@@ -10,6 +11,8 @@ TABLE_ID = os.environ.get("FEISHU_PRODUCT_TABLE_ID")
 
 CSV_FILE = "products.csv"
 
+BITABLE = BitableClient(APP_TOKEN)
+
 # 飞书列名映射
 # 注意：新增了 "是否监控" 字段
 FIELD_MAPPING = {
@@ -21,83 +24,38 @@ FIELD_MAPPING = {
     "是否监控": "Is_Active"
 }
 
-def get_tenant_access_token():
-    """获取飞书租户验证令牌"""
-    url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-    headers = {"Content-Type": "application/json; charset=utf-8"}
-    data = {"app_id": APP_ID, "app_secret": APP_SECRET}
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        if result.get("code") == 0:
-            return result.get("tenant_access_token")
-        else:
-            print(f"❌ 获取 Token 失败: {result.get('msg')}")
-    except Exception as e:
-        print(f"❌ 请求 Token 异常: {e}")
-    return None
-
-def fetch_active_feishu_products(token):
+def fetch_active_feishu_products():
     """从飞书拉取所有标记为“监控中”的产品"""
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{APP_TOKEN}/tables/{TABLE_ID}/records"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8"
-    }
-    
     active_records = []
-    page_token = None
-    has_more = True
-    
-    while has_more:
-        params = {"page_size": 100}
-        if page_token:
-            params["page_token"] = page_token
+    try:
+        for item in BITABLE.iter_records(TABLE_ID):
+            fields = item.get("fields", {})
             
-        try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            result = response.json()
+            # 检查“是否监控”状态
+            # 飞书复选框通常为 bool，单选/多选可能为字符串 "是"
+            is_active_val = fields.get("是否监控")
+            is_monitored = False
+            if isinstance(is_active_val, bool):
+                is_monitored = is_active_val
+            elif isinstance(is_active_val, str):
+                is_monitored = (is_active_val == "是")
             
-            if result.get("code") == 0:
-                data = result.get("data", {})
-                items = data.get("items", [])
-                for item in items:
-                    fields = item.get("fields", {})
-                    
-                    # 检查“是否监控”状态
-                    # 飞书复选框通常为 bool，单选/多选可能为字符串 "是"
-                    is_active_val = fields.get("是否监控")
-                    is_monitored = False
-                    if isinstance(is_active_val, bool):
-                        is_monitored = is_active_val
-                    elif isinstance(is_active_val, str):
-                        is_monitored = (is_active_val == "是")
-                    
-                    if not is_monitored:
-                        continue
+            if not is_monitored:
+                continue
 
-                    # 转换基础字段
-                    record = {FIELD_MAPPING[k]: fields.get(k) for k in FIELD_MAPPING if k in fields}
-                    
-                    # 处理链接字段 (兼容超链接对象)
-                    link_data = fields.get("链接")
-                    if isinstance(link_data, dict):
-                        record["Link"] = link_data.get("link", "")
-                    else:
-                        record["Link"] = str(link_data) if link_data else ""
-                    
-                    active_records.append(record)
-                
-                has_more = data.get("has_more", False)
-                page_token = data.get("page_token")
+            # 转换基础字段
+            record = {FIELD_MAPPING[k]: fields.get(k) for k in FIELD_MAPPING if k in fields}
+            
+            # 处理链接字段 (兼容超链接对象)
+            link_data = fields.get("链接")
+            if isinstance(link_data, dict):
+                record["Link"] = link_data.get("link", "")
             else:
-                print(f"❌ 拉取记录失败: {result.get('msg')}")
-                break
-        except Exception as e:
-            print(f"❌ 网络请求异常: {e}")
-            break
+                record["Link"] = str(link_data) if link_data else ""
+            
+            active_records.append(record)
+    except FeishuError as e:
+        print(f"❌ 拉取记录失败: {e}")
             
     return active_records
 
@@ -127,11 +85,10 @@ def main():
                     local_link_map[key] = link
 
     # 2. 获取飞书最新的“监控中”名单
-    token = get_tenant_access_token()
-    if not token: return
+    if not get_tenant_access_token(): return
     
     print("🚀 正在从飞书全量同步监控清单（仅同步标记为‘是’的产品）...")
-    feishu_active_list = fetch_active_feishu_products(token)
+    feishu_active_list = fetch_active_feishu_products()
     
     # 3. 整合数据：以飞书为准，但保留本地已有的 Link
     final_rows = []
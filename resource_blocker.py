@@ -0,0 +1,136 @@
+import os
+from collections import Counter
+from urllib.parse import urlparse
+
+# ================= 请求拦截配置 =================
+# 只读取价格 DOM / JSON-LD，图片、字体、音视频以及第三方统计脚本都无需下载
+BLOCK_RESOURCES = os.environ.get("BLOCK_RESOURCES", "true").lower() in ("true", "1", "yes")
+
+DEFAULT_BLOCK_TYPES = {"image", "media", "font"}
+
+# 第三方统计 / 广告 / 录屏类域名 (子串匹配)
+DEFAULT_BLOCK_HOSTS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googleadservices.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "facebook.net",
+    "facebook.com",
+    "connect.facebook",
+    "hotjar.com",
+    "criteo.com",
+    "criteo.net",
+    "taboola.com",
+    "outbrain.com",
+    "tiktok.com",
+    "snapchat.com",
+    "pinterest.com",
+    "bing.com",
+    "clarity.ms",
+    "contentsquare.net",
+    "abtasty.com",
+    "kameleoon",
+    "adnxs.com",
+    "quantserve.com",
+    "scorecardresearch.com",
+    "trustpilot.com",
+]
+
+# 平台级覆盖规则:
+#   allow_types  从默认拦截类型中放行的类型
+#   block_types  额外拦截的类型
+#   block_hosts  额外拦截的域名
+#   allow_hosts  即使命中拦截域名也放行 (反爬校验依赖的脚本)
+PLATFORM_RULES = {
+    "amazon": {
+        "block_hosts": ["amazon-adsystem.com", "fls-eu.amazon", "unagi.amazon"],
+    },
+    "boulanger": {
+        "block_hosts": ["tag.boulanger.com"],
+    },
+    "currys": {
+        # Cloudflare 挑战页依赖 challenges.cloudflare.com
+        "allow_hosts": ["cloudflare.com"],
+    },
+    "darty": {
+        # Datadome 校验脚本必须放行，否则会被判定为机器人
+        "allow_hosts": ["datadome.co", "captcha-delivery.com"],
+    },
+    "fnac": {
+        "allow_hosts": ["datadome.co", "captcha-delivery.com"],
+    },
+    "mediamarkt": {},
+    "coolblue": {},
+}
+
+# 被拦截请求的平均体积估算 (字节)，仅用于统计节省的流量
+AVG_BYTES_BY_TYPE = {
+    "image": 60_000,
+    "media": 500_000,
+    "font": 40_000,
+    "script": 50_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+    "other": 10_000,
+}
+
+def new_blocking_stats():
+    """创建一份本次运行的拦截统计"""
+    return {"blocked": Counter(), "allowed": 0, "est_bytes_saved": 0}
+
+def get_rules(platform):
+    """合并默认规则与平台覆盖规则，返回 (拦截类型, 拦截域名, 放行域名)"""
+    platform_lower = (platform or "").strip().lower()
+    override = {}
+    for key, rules in PLATFORM_RULES.items():
+        if key in platform_lower:
+            override = rules
+            break
+    block_types = (DEFAULT_BLOCK_TYPES - set(override.get("allow_types", []))) | set(override.get("block_types", []))
+    block_hosts = DEFAULT_BLOCK_HOSTS + list(override.get("block_hosts", []))
+    allow_hosts = list(override.get("allow_hosts", []))
+    return block_types, block_hosts, allow_hosts
+
+def should_block(resource_type, url, rules):
+    """判断单个请求是否应当拦截"""
+    block_types, block_hosts, allow_hosts = rules
+    host = (urlparse(url).hostname or "").lower()
+    if any(h in host for h in allow_hosts):
+        return False
+    if resource_type in block_types:
+        return True
+    return any(h in host for h in block_hosts)
+
+async def install_resource_blocking(context, platform=None, stats=None):
+    """在 Context 上挂载请求拦截 (context.route)，按平台规则拦截无关资源"""
+    if not BLOCK_RESOURCES:
+        return
+    rules = get_rules(platform)
+
+    async def _handle(route):
+        request = route.request
+        try:
+            if should_block(request.resource_type, request.url, rules):
+                if stats is not None:
+                    stats["blocked"][request.resource_type] += 1
+                    stats["est_bytes_saved"] += AVG_BYTES_BY_TYPE.get(request.resource_type, AVG_BYTES_BY_TYPE["other"])
+                await route.abort()
+                return
+            if stats is not None:
+                stats["allowed"] += 1
+            await route.continue_()
+        except Exception:
+            # 页面已关闭等情况下 route 可能已失效，忽略
+            pass
+
+    await context.route("**/*", _handle)
+
+def print_blocking_stats(stats, label="资源拦截"):
+    """打印本次运行拦截的请求数与估算节省流量"""
+    if not BLOCK_RESOURCES or stats is None:
+        return
+    blocked_total = sum(stats["blocked"].values())
+    detail = ", ".join(f"{k}={v}" for k, v in stats["blocked"].most_common())
+    print(f"[{label}] 拦截 {blocked_total} 个请求 ({detail or '无'})，放行 {stats['allowed']} 个，"
+          f"估算节省流量 {stats['est_bytes_saved'] / 1024 / 1024:.1f} MB")